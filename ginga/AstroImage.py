@@ -6,6 +6,8 @@
 #
 import sys
 import math
+import itertools
+import threading
 import traceback
 
 import numpy
@@ -45,6 +47,12 @@ class AstroImage(BaseImage):
                  name=None, wcsclass=None, ioclass=None,
                  inherit_primary_header=False, save_primary_header=True):
 
+        # statistics of the slices of multidimensional data, keyed by
+        # naxispath (see get_slice_stats)
+        self._slice_stats = {}
+        self._slice_key = None
+        self._slice_lock = threading.RLock()
+
         BaseImage.__init__(self, data_np=data_np, metadata=metadata,
                            logger=logger, name=name)
 
@@ -96,7 +104,7 @@ class AstroImage(BaseImage):
             data = data.reshape((1, data.shape[0]))
 
         # this is a handle to the full data array
-        self._md_data = data
+        self._set_mddata(data)
 
         # this will get reset in set_naxispath() if array is
         # multidimensional
@@ -172,6 +180,19 @@ class AstroImage(BaseImage):
     def get_mddata(self):
         return self._md_data
 
+    def _set_mddata(self, data):
+        # the cached statistics of the slices go with the data; replacing
+        # the dict also lets calculations still running for the old data
+        # know that their results are stale (see _store_slice_stats)
+        with self._slice_lock:
+            self._md_data = data
+            self._slice_stats = {}
+
+    def _get_slice_state(self):
+        # the data and the statistics of its slices, consistently
+        with self._slice_lock:
+            return (self._md_data, self._slice_stats)
+
     def set_naxispath(self, naxispath):
         """Choose a slice out of multidimensional data.
         """
@@ -180,7 +201,7 @@ class AstroImage(BaseImage):
 
         # construct slice view and extract it
         view = revnaxis + [slice(None), slice(None)]
-        data = self.get_mddata()[view]
+        data = self.get_mddata()[tuple(view)]
 
         if len(data.shape) != 2:
             raise ImageError(
@@ -189,7 +210,187 @@ class AstroImage(BaseImage):
         self.naxispath = naxispath
         self.revnaxis = revnaxis
 
-        self.set_data(data)
+        # only slices of multidimensional data have cached statistics
+        self._slice_key = None
+        if len(naxispath) > 0:
+            self._slice_key = tuple(naxispath)
+        BaseImage.set_data(self, data)
+
+    def set_data(self, data_np, metadata=None, order=None, astype=None):
+        # this data is not a slice, so it has no cached statistics
+        self._slice_key = None
+        super(AstroImage, self).set_data(data_np, metadata=metadata,
+                                         order=order, astype=astype)
+
+    def get_slice_stats(self, naxispath=None):
+        """Get the cached statistics of a slice of multidimensional data.
+
+        Returns a copy of a dict that may hold the min/max statistics of
+        the slice (`minmax`, see `get_minmax_stats`) and the auto cut
+        levels calculated for it (`cuts`, keyed by the method and
+        parameters of the auto cuts), or `None` if the data is not
+        multidimensional.  `naxispath` defaults to the current slice.
+        """
+        if naxispath is None:
+            key = self._slice_key
+        else:
+            key = tuple(naxispath)
+        if key is None or len(key) == 0:
+            return None
+        with self._slice_lock:
+            return self._copy_slice_stats(self._slice_stats.get(key, None))
+
+    def _copy_slice_stats(self, stats):
+        if stats is None:
+            return dict(cuts={})
+        stats = dict(stats, cuts=dict(stats['cuts']))
+        if 'minmax' in stats:
+            stats['minmax'] = dict(stats['minmax'])
+        return stats
+
+    def _store_slice_stats(self, key, slice_stats=None, minmax=None,
+                           cuts=None):
+        """Add statistics of the slice `key` to the cache.  If
+        `slice_stats` (the cache when they were calculated) is given and
+        the data has been replaced since, they are dropped.  Returns a copy
+        of the cached statistics of the slice, or `None` if dropped.
+        """
+        with self._slice_lock:
+            if slice_stats is None:
+                slice_stats = self._slice_stats
+            elif slice_stats is not self._slice_stats:
+                return None
+            stats = slice_stats.setdefault(key, dict(cuts={}))
+            if minmax is not None:
+                stats['minmax'] = dict(minmax)
+            if cuts is not None:
+                stats['cuts'].update(cuts)
+            return self._copy_slice_stats(stats)
+
+    def _reset_minmax(self):
+        super(AstroImage, self)._reset_minmax()
+
+        # use the statistics of this slice, if calculated before
+        stats = self.get_slice_stats()
+        if stats is not None and 'minmax' in stats:
+            self._minmax = stats['minmax']
+
+    def _set_minmax(self):
+        super(AstroImage, self)._set_minmax()
+
+        if self._slice_key:
+            self._store_slice_stats(self._slice_key, minmax=self._minmax)
+
+    def calc_cut_levels(self, autocuts):
+        stats = self.get_slice_stats()
+        if stats is None:
+            return super(AstroImage, self).calc_cut_levels(autocuts)
+
+        key = autocuts.get_params_key()
+        levels = stats['cuts'].get(key, None)
+        if levels is None:
+            levels = autocuts.calc_cut_levels(self)
+            self._store_slice_stats(self._slice_key, cuts={key: levels})
+        return levels
+
+    def calc_slice_stats(self, naxispath, autocuts=None):
+        """Calculate and cache the statistics of the slice of
+        multidimensional data at `naxispath`, if they are not cached
+        already (see `get_slice_stats`).
+
+        The min/max statistics are always calculated, and the auto cut
+        levels too if `autocuts` (an `~ginga.AutoCuts.AutoCutsBase`) is
+        given.  This reads the whole slice.  Returns the statistics, or
+        `None` if the data is not multidimensional or was replaced while
+        they were calculated.
+        """
+        mddata, slice_stats = self._get_slice_state()
+        return self._calc_slice_stats(mddata, slice_stats, naxispath,
+                                      autocuts)
+
+    def _calc_slice_stats(self, mddata, slice_stats, naxispath, autocuts):
+        # calculate the statistics of a slice of `mddata`, whose cached
+        # statistics are `slice_stats`
+        key = tuple(naxispath)
+        if len(key) == 0:
+            return None
+        with self._slice_lock:
+            stats = self._copy_slice_stats(slice_stats.get(key, None))
+
+        cuts_key = None
+        if autocuts is not None:
+            cuts_key = autocuts.get_params_key()
+        minmax = stats.get('minmax', None)
+        if minmax is not None and (cuts_key is None or
+                                   cuts_key in stats['cuts']):
+            return stats
+
+        revnaxis = list(naxispath)
+        revnaxis.reverse()
+        image = BaseImage(data_np=mddata[tuple(revnaxis)],
+                          logger=self.logger)
+        if minmax is not None:
+            image._minmax = minmax
+        else:
+            minmax = image.get_minmax_stats()
+        cuts = None
+        if cuts_key is not None and cuts_key not in stats['cuts']:
+            cuts = {cuts_key: autocuts.calc_cut_levels(image)}
+
+        return self._store_slice_stats(key, slice_stats=slice_stats,
+                                       minmax=minmax, cuts=cuts)
+
+    def precompute_slice_stats(self, autocuts=None, callback=None,
+                               ev_quit=None):
+        """Calculate and cache the statistics of all the slices of
+        multidimensional data, so that they need not be calculated when
+        the slices are viewed (see `calc_slice_stats`).
+
+        `callback`, if given, is called as
+        ``callback(image, num_done, num_total)`` after each slice.  The
+        calculation stops early if the `threading.Event` `ev_quit` is set,
+        or if the data is replaced.
+
+        This can take a long time for a large cube, and is meant to be
+        run in a separate thread (see `start_precompute_slice_stats`).
+        Returns the number of slices done.
+        """
+        # work on the data as it is now, even if it is replaced meanwhile
+        mddata, slice_stats = self._get_slice_state()
+        if mddata is None or mddata.ndim <= 2:
+            return 0
+        dims = mddata.shape[:-2]
+        num_total = int(numpy.prod(dims))
+
+        num_done = 0
+        for revnaxis in itertools.product(*[range(n) for n in dims]):
+            if ev_quit is not None and ev_quit.is_set():
+                break
+            naxispath = list(revnaxis)
+            naxispath.reverse()
+            stats = self._calc_slice_stats(mddata, slice_stats, naxispath,
+                                           autocuts)
+            if stats is None:
+                # data was replaced
+                break
+
+            num_done += 1
+            if callback is not None:
+                callback(self, num_done, num_total)
+
+        return num_done
+
+    def start_precompute_slice_stats(self, autocuts=None, callback=None):
+        """Start `precompute_slice_stats` in a background thread.
+
+        Returns a `threading.Event` that can be set to stop it.
+        """
+        ev_quit = threading.Event()
+        thread = threading.Thread(target=self.precompute_slice_stats,
+                                  args=(autocuts, callback, ev_quit))
+        thread.daemon = True
+        thread.start()
+        return ev_quit
 
     def set_wcs(self, wcs):
         self.wcs = wcs
@@ -292,7 +493,7 @@ class AstroImage(BaseImage):
         super(AstroImage, self).clear_all()
 
         # unreference full data array
-        self._md_data = self._data
+        self._set_mddata(self._data)
 
     def transfer(self, other, astype=None):
         data = self._get_data()
@@ -490,12 +691,27 @@ class AstroImage(BaseImage):
                 bg_inc = bg_ref - bg
                 data_np = data_np + bg_inc
 
-            # Determine max/min to update our values
-            if update_minmax:
-                maxval = numpy.nanmax(data_np)
-                minval = numpy.nanmin(data_np)
-                self.maxval = max(self.maxval, maxval)
-                self.minval = min(self.minval, minval)
+            # Determine max/min to update our values, if they have been
+            # calculated; otherwise they are calculated over the whole
+            # mosaic when they are needed
+            track_minmax = update_minmax and self._minmax is not None
+            if track_minmax:
+                stats = trcalc.calc_minmax(data_np)
+                # a piece without any (finite) values has no min/max,
+                # for which calc_minmax reports 0
+                keys = []
+                if stats['num_nan'] < data_np.size:
+                    keys.append(('minval', 'maxval'))
+                    if (numpy.isfinite(stats['minval']) or
+                            numpy.isfinite(stats['maxval']) or
+                            numpy.isfinite(data_np).any()):
+                        keys.append(('minval_noinf', 'maxval_noinf'))
+                for minkey, maxkey in keys:
+                    self._minmax[minkey] = min(self._minmax[minkey],
+                                               stats[minkey])
+                    self._minmax[maxkey] = max(self._minmax[maxkey],
+                                               stats[maxkey])
+            self._minmax_estimate = None
 
             # Get rotation and scale of piece
             header = image.get_header()
@@ -635,12 +851,19 @@ class AstroImage(BaseImage):
 
             # fit image piece into our array
             try:
+                region = mydata[ylo:yhi, xlo:xhi, ...]
+                if track_minmax:
+                    num_nan = numpy.count_nonzero(numpy.isnan(region))
                 if merge:
                     mydata[ylo:yhi, xlo:xhi, ...] += rotdata[0:ht, 0:wd, ...]
                 else:
                     idx = (mydata[ylo:yhi, xlo:xhi, ...] == 0.0)
                     mydata[ylo:yhi, xlo:xhi, ...][idx] = \
                         rotdata[0:ht, 0:wd, ...][idx]
+                if track_minmax:
+                    # keep the count of NaNs in step with the data
+                    self._minmax['num_nan'] += (
+                        numpy.count_nonzero(numpy.isnan(region)) - num_nan)
 
             except Exception as e:
                 self.logger.error("Error fitting tile: %s" % (str(e)))
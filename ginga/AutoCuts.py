@@ -8,6 +8,7 @@ import numpy as np
 import threading
 
 from ginga.misc import Bunch
+from ginga import trcalc
 #from ginga.misc.ParamSet import Param
 from ginga.util import zscale
 
@@ -45,6 +46,9 @@ class AutoCutsBase(object):
         self.logger = logger
         self.kind = 'base'
         self.crop_radius = 512
+        # calculate on a sample of the data (see get_sample)
+        self.usesample = False
+        self.max_sample_error = 0.01
 
     def update_params(self, **param_dict):
         # TODO: find a cleaner way to update these
@@ -53,6 +57,15 @@ class AutoCutsBase(object):
     def get_algorithms(self):
         return autocut_methods
 
+    def get_params_key(self):
+        """Get a key that identifies this method and its parameters, for
+        caching the cut levels calculated with them.
+        """
+        params = [(param.name, getattr(self, param.name, None))
+                  for param in self.get_params_metadata()]
+        params.sort()
+        return (self.kind, self.crop_radius, tuple(params))
+
     def get_autocut_levels(self, image):
         loval, hival = self.calc_cut_levels(image)
         return loval, hival
@@ -70,16 +83,53 @@ class AutoCutsBase(object):
                                                      crop_radius)
         return data
 
-    def cut_levels(self, data, loval, hival, vmin=0.0, vmax=255.0):
+    def get_sample(self, image):
+        """Get a sample of the data of `image` for fast calculations, or
+        all of it if the estimated error of the sample is larger than
+        `max_sample_error`.
+        """
+        sample = image.get_data_sample()
+        if sample.error > self.max_sample_error:
+            self.logger.debug("sample error %.4f too large--using full "
+                              "image data" % (sample.error))
+            return image.get_data()
+        return sample.data
+
+    def get_minmax(self, image):
+        """Get the minimum and maximum of `image`, estimated from a sample
+        of its data if `usesample` is True and the estimated error is no
+        larger than `max_sample_error`.
+        """
+        if self.usesample:
+            stats = image.get_minmax_stats(estimate=True)
+            if stats['error'] <= self.max_sample_error:
+                return (stats['minval'], stats['maxval'])
+        return image.get_minmax()
+
+    def cut_levels(self, data, loval, hival, vmin=0.0, vmax=255.0,
+                   out=None):
+        """Scale `data` between `loval` and `hival` to the range 0-`vmax`.
+
+        The result is float32 for float32 and narrower data, else float64.
+        If `out` is an array of that type and the shape of `data`, the
+        result is written to it instead of to a new array.
+        """
         loval, hival = float(loval), float(hival)
         self.logger.debug("loval=%.2f hival=%.2f" % (loval, hival))
+        dtype = trcalc.get_work_dtype(data.dtype)
+        if out is None or out.dtype != dtype or out.shape != data.shape:
+            out = np.empty(data.shape, dtype=dtype)
+        f = out
+
         delta = hival - loval
         if delta != 0.0:
-            data = data.clip(loval, hival)
-            f = ((data - loval) / delta)
+            # NOTE: in-place outputs to avoid temporary arrays
+            np.clip(data, loval, hival, out=f)
+            np.subtract(f, loval, out=f)
+            np.divide(f, delta, out=f)
         else:
             #f = (data - loval).clip(0.0, 1.0)
-            f = data - loval
+            np.subtract(data, loval, out=f)
             f.clip(0.0, 1.0, out=f)
             # threshold
             f[np.nonzero(f)] = 1.0
@@ -96,27 +146,40 @@ class AutoCutsBase(object):
 
 class Clip(AutoCutsBase):
 
-    def __init__(self, logger):
+    @classmethod
+    def get_params_metadata(cls):
+        return list(_sample_params)
+
+    def __init__(self, logger, usesample=False, max_sample_error=0.01):
         super(Clip, self).__init__(logger)
         self.kind = 'clip'
+        self.usesample = usesample
+        self.max_sample_error = max_sample_error
 
     def calc_cut_levels(self, image):
-        loval, hival = image.get_minmax()
+        loval, hival = self.get_minmax(image)
 
         return (float(loval), float(hival))
 
-    def cut_levels(self, data, loval, hival, vmin=0.0, vmax=255.0):
+    def cut_levels(self, data, loval, hival, vmin=0.0, vmax=255.0,
+                   out=None):
         return data.clip(vmin, vmax)
 
 
 class Minmax(AutoCutsBase):
 
-    def __init__(self, logger):
+    @classmethod
+    def get_params_metadata(cls):
+        return list(_sample_params)
+
+    def __init__(self, logger, usesample=False, max_sample_error=0.01):
         super(Minmax, self).__init__(logger)
         self.kind = 'minmax'
+        self.usesample = usesample
+        self.max_sample_error = max_sample_error
 
     def calc_cut_levels(self, image):
-        loval, hival = image.get_minmax()
+        loval, hival = self.get_minmax(image)
 
         return (float(loval), float(hival))
 
@@ -137,18 +200,23 @@ class Histogram(AutoCutsBase):
             Param(name='numbins', type=int,
                   min=100, max=10000, default=2048,
                   description="Number of bins for the histogram"),
-        ]
+        ] + _sample_params
 
-    def __init__(self, logger, usecrop=True, pct=0.999, numbins=2048):
+    def __init__(self, logger, usecrop=True, pct=0.999, numbins=2048,
+                 usesample=False, max_sample_error=0.01):
         super(Histogram, self).__init__(logger)
 
         self.kind = 'histogram'
         self.usecrop = usecrop
         self.pct = pct
         self.numbins = numbins
+        self.usesample = usesample
+        self.max_sample_error = max_sample_error
 
     def calc_cut_levels(self, image):
-        if self.usecrop:
+        if self.usesample:
+            data = self.get_sample(image)
+        elif self.usecrop:
             data = self.get_crop(image)
             count = np.count_nonzero(np.isfinite(data))
             if count < (self.crop_radius ** 2.0) * 0.50:
@@ -274,9 +342,10 @@ class StdDev(AutoCutsBase):
             ##             description="Low subtraction factor"),
             ## Param(name='hensa_hi', type=float, default=90.0,
             ##             description="High subtraction factor"),
-        ]
+        ] + _sample_params
 
-    def __init__(self, logger, usecrop=True):
+    def __init__(self, logger, usecrop=True, usesample=False,
+                 max_sample_error=0.01):
         super(StdDev, self).__init__(logger)
 
         self.kind = 'stddev'
@@ -285,9 +354,13 @@ class StdDev(AutoCutsBase):
         self.usecrop = usecrop
         self.hensa_lo = 35.0
         self.hensa_hi = 90.0
+        self.usesample = usesample
+        self.max_sample_error = max_sample_error
 
     def calc_cut_levels(self, image):
-        if self.usecrop:
+        if self.usesample:
+            data = self.get_sample(image)
+        elif self.usecrop:
             data = self.get_crop(image)
             count = np.count_nonzero(np.isfinite(data))
             if count < (self.crop_radius ** 2.0) * 0.50:
@@ -651,6 +724,19 @@ class ZScale2(AutoCutsBase):
 # funky boolean converter
 _bool = lambda st: str(st).lower() == 'true'  # noqa
 
+# parameters of the methods that can use a sample of the data
+_sample_params = [
+    Param(name='usesample', type=_bool,
+          valid=[True, False],
+          default=False,
+          description="Use a sample of the image data for speed"),
+    Param(name='max_sample_error', type=float,
+          widget='spinfloat', incr=0.001,
+          min=0.0, max=1.0, default=0.01,
+          description="Use the full image data if the estimated error "
+          "of the sample is larger"),
+]
+
 autocuts_table = {
     'clip': Clip,
     'minmax': Minmax,
@@ -6,6 +6,8 @@
 #
 from ginga.util.six.moves import map
 
+import math
+import itertools
 import numpy as np
 import logging
 
@@ -13,6 +15,15 @@ from ginga.misc import Bunch, Callback
 from ginga import trcalc, AutoCuts
 
 
+# source of the keys that identify the contents of image data
+_data_keys = itertools.count(1)
+
+# default method (see trcalc.sample_methods) and number of pixels of the
+# samples of the data used for fast calculations (see get_data_sample)
+fast_data_method = 'stride'
+fast_data_samples = 100000
+
+
 class ImageError(Exception):
     pass
 
@@ -91,12 +102,24 @@ class BaseImage(ViewerObjectBase):
         self._data = data_np
         self.order = ''
         self.name = name
-
-        self._set_minmax()
+        # lazily generated reduced resolution versions of the data
+        self._pyramid = None
+        # identifies the current contents of the data (see get_data_key)
+        self._data_key = next(_data_keys)
+
+        # minimum and maximum, calculated on demand (see get_minmax)
+        self._reset_minmax()
+        # sample of the data for fast calculations (see _get_fast_data)
+        self.fast_data_method = fast_data_method
+        self.fast_data_samples = fast_data_samples
+        self._fast_data = None
         self._calc_order(order)
 
         self.autocuts = AutoCuts.Histogram(self.logger)
 
+        # any change to our data invalidates the pyramid
+        self.add_callback('modified', self._drop_pyramid_cb)
+
     @property
     def shape(self):
         return self._get_data().shape
@@ -151,9 +174,45 @@ class BaseImage(ViewerObjectBase):
         Return an array similar to but possibly smaller than self._data,
         for fast calculation of the intensity distribution.
 
+        This is a sample of about `fast_data_samples` pixels, taken with
+        `fast_data_method` (see `~ginga.trcalc.get_sample`).
+
         NOTE: this is used by the Ginga plugin for Glue
         """
-        return self._data
+        sample = self._fast_data
+        if sample is None:
+            sample = trcalc.get_sample(self._get_data(),
+                                       self.fast_data_samples,
+                                       method=self.fast_data_method)
+            self._fast_data = sample
+        return sample
+
+    def set_fast_data_params(self, method=None, num_samples=None):
+        """Set the sampling method and the number of pixels of the data
+        used for fast calculations.
+        """
+        if method is not None:
+            if method not in trcalc.sample_methods:
+                raise ImageError("Unknown sampling method '%s'" % (method))
+            self.fast_data_method = method
+        if num_samples is not None:
+            self.fast_data_samples = num_samples
+        self._fast_data = None
+        self._minmax_estimate = None
+
+    def get_data_sample(self):
+        """Get a sample of the data for fast calculations.
+
+        Returns a bunch with the sample (`data`) and an estimated bound on
+        the error of statistics calculated from it (`error`), as a
+        fraction of the pixels (see `~ginga.trcalc.get_sample_error`).
+        Callers can use the bound to decide whether to calculate the
+        statistics on the full data instead.
+        """
+        data = self._get_data()
+        sample = self._get_fast_data()
+        error = trcalc.get_sample_error(sample.size, data.size)
+        return Bunch.Bunch(data=sample, error=error)
 
     def copy_data(self):
         data = self._get_data()
@@ -180,7 +239,10 @@ class BaseImage(ViewerObjectBase):
         if metadata:
             self.update_metadata(metadata)
 
-        self._set_minmax()
+        self._reset_minmax()
+        # also done by the 'modified' callback, but that may be blocked
+        # (e.g. while playing back the slices of a cube)
+        self._drop_pyramid_cb(self)
 
         self.make_callback('modified')
 
@@ -190,6 +252,68 @@ class BaseImage(ViewerObjectBase):
 
         # unreference data array
         self._data = np.zeros((1, 1))
+        self.clear_pyramid()
+
+    def clear_pyramid(self):
+        """Discard any reduced resolution levels of the data."""
+        self._pyramid = None
+
+    def _drop_pyramid_cb(self, image):
+        self.clear_pyramid()
+        self._fast_data = None
+        self._data_key = next(_data_keys)
+
+    def get_data_key(self):
+        """Return a number that identifies the current contents of the
+        data, for use as part of a key to cache results computed from it.
+        It is unique to this image and changes whenever the data is
+        modified.
+        """
+        return self._data_key
+
+    def get_pyramid(self, level):
+        """Return the list of pyramid levels of the data, down to level
+        `level` or as deep as the data size allows.
+
+        Level 0 is the full resolution data; each successive level is
+        reduced by a factor of two in X and Y by area averaging the
+        level above it.  Levels are generated on demand and kept until
+        the data is modified.  The list that is returned is not changed
+        afterwards, so it can be used from any thread while the data is
+        being replaced.
+        """
+        data = self._get_data()
+        pyramid = self._pyramid
+        if pyramid is None or pyramid[0] is not data:
+            pyramid = [data]
+
+        if len(pyramid) <= level:
+            pyramid = list(pyramid)
+            while len(pyramid) <= level:
+                data = pyramid[-1]
+                if min(data.shape[:2]) < 2:
+                    break
+                pyramid.append(trcalc.area_average_2x(data))
+            self._pyramid = pyramid
+        return pyramid
+
+    def get_pyramid_level(self, level):
+        """Return the data at pyramid level `level` (see `get_pyramid`).
+        If `level` is deeper than the data size allows, the deepest
+        possible level is returned.
+        """
+        pyramid = self.get_pyramid(level)
+        return pyramid[min(level, len(pyramid) - 1)]
+
+    def get_pyramid_level_for_scale(self, scale):
+        """Return the index of the coarsest pyramid level whose
+        resolution is still at or above `scale`.
+        """
+        if scale > 0.5:
+            return 0
+        # small fudge factor so that exact powers of two are not missed
+        # due to floating point roundoff
+        return int(math.floor(math.log(1.0 / scale, 2) + 1.0e-9))
 
     def _slice(self, view):
         return self._get_data()[view]
@@ -245,37 +369,123 @@ class BaseImage(ViewerObjectBase):
     def has_valid_wcs(self):
         return hasattr(self, 'wcs') and self.wcs.has_valid_wcs()
 
-    def _set_minmax(self):
-        data = self._get_fast_data()
-        try:
-            self.maxval = np.nanmax(data)
-            self.minval = np.nanmin(data)
-        except Exception:
-            self.maxval = 0
-            self.minval = 0
+    def _reset_minmax(self):
+        self._minmax = None
+        self._minmax_estimate = None
 
-        # TODO: see if there is a faster way to ignore infinity
+    def _set_minmax(self):
+        """Calculate the minimum and maximum of the data now."""
+        data = self._get_data()
         try:
-            if np.isfinite(self.maxval):
-                self.maxval_noinf = self.maxval
-            else:
-                self.maxval_noinf = np.nanmax(data[np.isfinite(data)])
-        except Exception:
-            self.maxval_noinf = self.maxval
-
+            stats = trcalc.calc_minmax(data)
+        except Exception as e:
+            self.logger.warning("Error calculating min/max: %s" % (str(e)))
+            stats = dict(minval=0, maxval=0, minval_noinf=0,
+                         maxval_noinf=0, num_nan=0)
+        stats['error'] = 0.0
+        self._minmax = stats
+        self._minmax_estimate = None
+
+    def _get_minmax_estimate(self):
+        sample = self.get_data_sample()
         try:
-            if np.isfinite(self.minval):
-                self.minval_noinf = self.minval
+            stats = trcalc.calc_minmax(sample.data)
+        except Exception as e:
+            self.logger.warning("Error estimating min/max: %s" % (str(e)))
+            stats = dict(minval=0, maxval=0, minval_noinf=0,
+                         maxval_noinf=0, num_nan=0)
+        stats['error'] = sample.error
+        return stats
+
+    def get_minmax_stats(self, estimate=False):
+        """Get the statistics of the data calculated along with its
+        minimum and maximum.
+
+        Returns a dict of the minimum and maximum (`minval`, `maxval`),
+        the same ignoring infinities (`minval_noinf`, `maxval_noinf`), the
+        number of NaNs (`num_nan`), whether these are only estimates
+        (`estimated`) and the estimated bound on their error (`error`, see
+        `get_data_sample`).  NaNs are always ignored.
+
+        The statistics are calculated in one pass over the data when they
+        are first needed.  If `estimate` is True and they have not been
+        calculated yet, an estimate from a sample of the data is returned
+        instead, which is much faster for large (e.g. memory mapped) data.
+        The number of NaNs of an estimate is that of the sample.
+        """
+        stats, estimated = self._minmax, False
+        if stats is None:
+            if estimate:
+                stats, estimated = self._minmax_estimate, True
+                if stats is None:
+                    stats = self._get_minmax_estimate()
+                    self._minmax_estimate = stats
             else:
-                self.minval_noinf = np.nanmin(data[np.isfinite(data)])
-        except Exception:
-            self.minval_noinf = self.minval
-
-    def get_minmax(self, noinf=False):
+                self._set_minmax()
+                stats = self._minmax
+        stats = dict(stats)
+        stats['estimated'] = estimated
+        return stats
+
+    def get_minmax(self, noinf=False, estimate=False):
+        """Get the minimum and maximum of the data, ignoring NaNs, and
+        also infinities if `noinf` is True.  See `get_minmax_stats` about
+        `estimate`.
+        """
+        stats = self.get_minmax_stats(estimate=estimate)
         if not noinf:
-            return (self.minval, self.maxval)
+            return (stats['minval'], stats['maxval'])
         else:
-            return (self.minval_noinf, self.maxval_noinf)
+            return (stats['minval_noinf'], stats['maxval_noinf'])
+
+    def calc_cut_levels(self, autocuts):
+        """Calculate the auto cut levels of the data with `autocuts` (an
+        `~ginga.AutoCuts.AutoCutsBase`).  Subclasses may return levels
+        that were calculated before.
+        """
+        return autocuts.calc_cut_levels(self)
+
+    def _get_minmax_value(self, key):
+        if self._minmax is None:
+            self._set_minmax()
+        return self._minmax[key]
+
+    def _set_minmax_value(self, key, value):
+        if self._minmax is None:
+            self._set_minmax()
+        self._minmax[key] = value
+
+    @property
+    def minval(self):
+        return self._get_minmax_value('minval')
+
+    @minval.setter
+    def minval(self, value):
+        self._set_minmax_value('minval', value)
+
+    @property
+    def maxval(self):
+        return self._get_minmax_value('maxval')
+
+    @maxval.setter
+    def maxval(self, value):
+        self._set_minmax_value('maxval', value)
+
+    @property
+    def minval_noinf(self):
+        return self._get_minmax_value('minval_noinf')
+
+    @minval_noinf.setter
+    def minval_noinf(self, value):
+        self._set_minmax_value('minval_noinf', value)
+
+    @property
+    def maxval_noinf(self):
+        return self._get_minmax_value('maxval_noinf')
+
+    @maxval_noinf.setter
+    def maxval_noinf(self, value):
+        self._set_minmax_value('maxval_noinf', value)
 
     def get_header(self):
         return self.get('header', Header())
@@ -459,14 +669,27 @@ class BaseImage(ViewerObjectBase):
         return res
 
     def get_scaled_cutout2(self, p1, p2, scales,
-                           method='basic', logger=None):
-
+                           method='basic', logger=None, use_pyramid=False):
+        """Extract a region of the image defined by points `p1` and `p2`
+        and scale it by the factors in `scales`.
+
+        If `use_pyramid` is True and the image is being reduced by at
+        least a factor of two, the cutout is taken from the closest
+        area-averaged pyramid level at or above the requested scale
+        instead of striding through the full resolution data.
+        """
         if method not in ('basic',) and len(scales) == 2:
             # for 2D images with alternate interpolation requirements
             return self.get_scaled_cutout(p1[0], p1[1], p2[0], p2[1],
                                           scales[0], scales[1],
                                           method=method)
 
+        if use_pyramid and len(scales) == 2:
+            level = self.get_pyramid_level_for_scale(max(scales))
+            if level > 0:
+                return self._get_scaled_cutout_pyramid(p1, p2, scales,
+                                                       level)
+
         shp = self.shape
 
         view, scales = trcalc.get_scaled_cutout_basic_view(
@@ -481,6 +704,28 @@ class BaseImage(ViewerObjectBase):
 
         return res
 
+    def _get_scaled_cutout_pyramid(self, p1, p2, scales, level):
+        pyramid = self.get_pyramid(level)
+        # the pyramid may not go as deep as was requested
+        level = min(level, len(pyramid) - 1)
+        data = pyramid[level]
+        ht, wd = data.shape[:2]
+        factor = float(2 ** level)
+
+        # map the region and scales into the coordinates of the level
+        x1, y1 = int(p1[0] / factor), int(p1[1] / factor)
+        x2 = min(int(p2[0] / factor), wd - 1)
+        y2 = min(int(p2[1] / factor), ht - 1)
+        scale_x, scale_y = scales[0] * factor, scales[1] * factor
+
+        view, (scale_x, scale_y) = trcalc.get_scaled_cutout_basic_view(
+            data.shape, (x1, y1), (x2, y2), (scale_x, scale_y))
+        newdata = data[view]
+
+        res = Bunch.Bunch(data=newdata, scale_x=scale_x / factor,
+                          scale_y=scale_y / factor)
+        return res
+
     def get_thumbnail(self, length):
         wd, ht = self.get_size()
         if ht == 0:
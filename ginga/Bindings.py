@@ -1729,6 +1729,7 @@ class ImageViewBindings(object):
 
         x, y = viewer.get_last_win_xy()
         if event.state == 'move':
+            viewer.note_interaction()
             data_x, data_y = self.get_new_pan(viewer, x, y,
                                               ptype=self._pantype)
             viewer.panset_xy(data_x, data_y)
@@ -1751,6 +1752,7 @@ class ImageViewBindings(object):
 
         x, y = viewer.get_last_win_xy()
         if event.state == 'move':
+            viewer.note_interaction()
             data_x, data_y = self.get_new_pan(viewer, x, y,
                                               ptype=self._pantype)
             viewer.panset_xy(data_x, data_y)
@@ -1933,6 +1935,7 @@ class ImageViewBindings(object):
 
         msg = self.settings.get('msg_zoom', msg)
 
+        viewer.note_interaction()
         self.zoom_step(viewer, event, msg=msg, origin=origin,
                        adjust=1.5)
         return True
@@ -1963,6 +1966,7 @@ class ImageViewBindings(object):
         zoom_accel = self.settings.get('scroll_zoom_acceleration', 1.0)
         # change scale by 20%
         amount = self._scale_adjust(1.2, event.amount, zoom_accel, max_limit=4.0)
+        viewer.note_interaction()
         self._scale_image(viewer, event.direction, amount, msg=msg)
         return True
 
@@ -1976,6 +1980,7 @@ class ImageViewBindings(object):
         zoom_accel = self.settings.get('scroll_zoom_acceleration', 1.0)
         # change scale by 5%
         amount = self._scale_adjust(1.05, event.amount, zoom_accel, max_limit=4.0)
+        viewer.note_interaction()
         self._scale_image(viewer, event.direction, amount, msg=msg)
         return True
 
@@ -1998,6 +2003,7 @@ class ImageViewBindings(object):
         scr_pan_adj_factor = 1.4142135623730951
         amount = (event.amount * scr_pan_adj_factor * pan_accel) / 360.0
 
+        viewer.note_interaction()
         self.pan_omni(viewer, direction, amount)
         return True
 
@@ -2138,6 +2144,8 @@ class ImageViewBindings(object):
                 self._start_rot = viewer.get_rotation()
                 return True
 
+            viewer.note_interaction()
+
             if origin is not None:
                 # get cartesian canvas coords of data item under cursor
                 data_x, data_y = origin[:2]
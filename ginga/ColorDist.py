@@ -13,6 +13,8 @@ These algorithms are modeled after the ones described for ds9 here:
 import math
 import numpy
 
+from ginga import trcalc
+
 
 class ColorDistError(Exception):
     pass
@@ -42,6 +44,10 @@ class ColorDistBase(object):
     def get_hash_size(self):
         return self.hashsize
 
+    def get_hash_dtype(self):
+        # the hash holds indexes into the color map
+        return trcalc.get_index_dtype(self.colorlen - 1)
+
     def set_hash_size(self, size):
         assert (size >= self.colorlen) and (size <= self.maxhashsize), \
             ColorDistError("Bad hash size!")
@@ -74,7 +80,7 @@ class LinearDist(ColorDistBase):
         base = numpy.arange(0.0, float(self.hashsize), 1.0) / self.hashsize
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -102,7 +108,7 @@ class LogDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -131,7 +137,7 @@ class PowerDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -159,7 +165,7 @@ class SqrtDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -186,7 +192,7 @@ class SquaredDist(ColorDistBase):
         base = (base ** 2.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -217,7 +223,7 @@ class AsinhDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -249,7 +255,7 @@ class SinhDist(ColorDistBase):
         base = base.clip(0.0, 1.0)
         # normalize to color range
         l = base * (self.colorlen - 1)
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
 
         self.check_hash()
 
@@ -295,7 +301,7 @@ class HistogramEqualizationDist(ColorDistBase):
         # normalize to color range
         l = (cdf - cdf.min()) * (self.colorlen - 1) / (
             cdf.max() - cdf.min())
-        self.hash = l.astype(numpy.uint, copy=False)
+        self.hash = l.astype(self.get_hash_dtype(), copy=False)
         self.check_hash()
 
         arr = self.hash[idx]
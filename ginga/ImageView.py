@@ -17,13 +17,13 @@ import time
 
 import numpy as np
 
-from ginga.misc import Callback, Settings
+from ginga.misc import Callback, Settings, Bunch
 from ginga import BaseImage, AstroImage
 from ginga import RGBMap, AutoCuts, ColorDist
 from ginga import cmap, imap, colors, trcalc
 from ginga.canvas import coordmap, transform
 from ginga.canvas.types.layer import DrawingCanvas
-from ginga.util import rgb_cms, addons
+from ginga.util import rgb_cms, addons, timing
 
 __all__ = ['ImageViewBase']
 
@@ -40,6 +40,71 @@ class ImageViewNoDataError(ImageViewError):
     pass
 
 
+class _RenderCancelled(Exception):
+    # raised to abandon a stale render in the render thread
+    pass
+
+
+class _SettingsSnapshot(object):
+    # read-only copy of the values of a SettingGroup, which the render
+    # thread renders against while the GUI thread goes on changing them
+
+    def __init__(self, settings):
+        self._d = settings.get_dict()
+
+    def get(self, *args):
+        key = args[0]
+        if (len(args) == 1) or (key in self._d):
+            return self._d[key]
+        return args[1]
+
+    def get_dict(self):
+        return dict(self._d)
+
+    def __getitem__(self, key):
+        return self._d[key]
+
+    def has_key(self, key):
+        return key in self._d
+
+    def __contains__(self, key):
+        return key in self._d
+
+
+# Attributes of the viewer that are calculated by a rendering, and
+# describe the geometry of the frame (see ImageViewBase._get_view)
+_frame_geometry = ('_org_x', '_org_y', '_org_z', '_org_xoff', '_org_yoff',
+                   '_org_x1', '_org_y1', '_org_x2', '_org_y2',
+                   '_org_scale_x', '_org_scale_y', '_org_scale_z',
+                   '_dst_x', '_dst_y')
+
+
+def _view_property(name):
+    # attribute of the viewer that the render thread reads and writes in
+    # its snapshot of the view, instead of the one the GUI thread uses
+    def _get(self):
+        return self._get_view().geom[name]
+
+    def _set(self, value):
+        self._get_view().geom[name] = value
+
+    return property(_get, _set)
+
+
+# Settings that only affect the later stages of rendering (see
+# ImageViewBase.get_rgb_object), by the kind of change that they make.
+# Changes to any other setting are assumed to need a full redraw.
+_stage_settings = dict(
+    cuts=('cuts', 'autocuts', 'autocut_method', 'autocut_params'),
+    rgbmap=('color_map', 'intensity_map', 'color_algorithm',
+            'color_hashsize'),
+    transform=('flip_x', 'flip_y', 'swap_xy', 'rot_deg',
+               'icc_output_profile', 'icc_output_intent',
+               'icc_proof_profile', 'icc_proof_intent',
+               'icc_black_point_compensation', 'icc_lut_size'),
+)
+
+
 class ImageViewBase(Callback.Callbacks):
     """An abstract base class for displaying images represented by
     Numpy data arrays.
@@ -66,6 +131,26 @@ class ImageViewBase(Callback.Callbacks):
     vname = 'Ginga Image'
     vtypes = [BaseImage.BaseImage]
 
+    # geometry of the view, kept per rendering (see _get_view)
+    _imgwin_wd = _view_property('_imgwin_wd')
+    _imgwin_ht = _view_property('_imgwin_ht')
+    _ctr_x = _view_property('_ctr_x')
+    _ctr_y = _view_property('_ctr_y')
+    _org_x = _view_property('_org_x')
+    _org_y = _view_property('_org_y')
+    _org_z = _view_property('_org_z')
+    _org_xoff = _view_property('_org_xoff')
+    _org_yoff = _view_property('_org_yoff')
+    _org_x1 = _view_property('_org_x1')
+    _org_y1 = _view_property('_org_y1')
+    _org_x2 = _view_property('_org_x2')
+    _org_y2 = _view_property('_org_y2')
+    _org_scale_x = _view_property('_org_scale_x')
+    _org_scale_y = _view_property('_org_scale_y')
+    _org_scale_z = _view_property('_org_scale_z')
+    _dst_x = _view_property('_dst_x')
+    _dst_y = _view_property('_dst_y')
+
     def __init__(self, logger=None, rgbmap=None, settings=None):
         Callback.Callbacks.__init__(self)
 
@@ -78,8 +163,11 @@ class ImageViewBase(Callback.Callbacks):
         if settings is None:
             settings = Settings.SettingGroup(logger=self.logger)
         self.settings = settings
-        # to be eventually deprecated
-        self.t_ = settings
+        # state of the view that is shown; the render thread renders
+        # against a snapshot of it instead (see _get_view)
+        self._render_local = threading.local()
+        self._live_view = Bunch.Bunch(settings=settings, geom={},
+                                      rgbmap_version=None)
 
         # RGB mapper
         if rgbmap:
@@ -152,6 +240,50 @@ class ImageViewBase(Callback.Callbacks):
         self.t_.get_setting('interpolation').add_callback(
             'set', self.interpolation_change_cb)
 
+        # use reduced resolution image pyramid when zoomed out
+        self.t_.add_defaults(use_image_pyramid=False)
+        self.t_.get_setting('use_image_pyramid').add_callback(
+            'set', self.pyramid_change_cb)
+
+        # cache color mapped tiles of the image for faster panning
+        self.t_.add_defaults(use_render_tiles=False, render_tile_size=256,
+                             render_tile_cache_mb=64)
+        # color map small integer data through a single lookup table
+        self.t_.add_defaults(use_fused_lut=True)
+        for name in ('use_render_tiles', 'render_tile_size', 'use_fused_lut'):
+            self.t_.get_setting(name).add_callback(
+                'set', self.render_optimize_change_cb)
+
+        # scroll the backing array when only the pan position changes
+        self.t_.add_defaults(use_scroll_blit=False)
+
+        # number of threads for rendering images in bands of rows
+        self.t_.add_defaults(render_num_threads=1)
+
+        # render a quick, coarse preview during interactive gestures
+        self.t_.add_defaults(use_preview_render=False, preview_lagtime=0.25,
+                             preview_reduction=2)
+
+        # render frames in a worker thread, to keep the GUI responsive
+        self.t_.add_defaults(render_in_thread=False)
+
+        # share cutouts and color mapped arrays of images with other viewers
+        # showing the same image with the same settings
+        self.t_.add_defaults(use_shared_render_cache=False)
+        self.t_.get_setting('use_shared_render_cache').add_callback(
+            'set', self.render_optimize_change_cb)
+
+        # raise the level of redraws to what has actually changed
+        self.t_.add_defaults(use_change_tracking=True)
+
+        # number of recent redraws for which the times of the rendering
+        # stages are kept (see get_render_stats())
+        self.t_.add_defaults(render_stats_frames=100)
+        self.render_times = timing.StageTimes(
+            num_frames=self.t_['render_stats_frames'])
+        self.t_.get_setting('render_stats_frames').add_callback(
+            'set', self.render_stats_change_cb)
+
         # max/min scaling
         self.t_.add_defaults(scale_max=10000.0, scale_min=0.00001)
 
@@ -194,7 +326,7 @@ class ImageViewBase(Callback.Callbacks):
         # ICC profile support
         d = dict(icc_output_profile=None, icc_output_intent='perceptual',
                  icc_proof_profile=None, icc_proof_intent='perceptual',
-                 icc_black_point_compensation=False)
+                 icc_black_point_compensation=False, icc_lut_size=33)
         self.t_.add_defaults(**d)
         for key in d:
             # Note: transform_cb will redraw enough to pick up
@@ -256,6 +388,20 @@ class ImageViewBase(Callback.Callbacks):
         self._rgbarr = None
         self._rgbarr2 = None
         self._rgbobj = None
+        # the RGB object being shown, which is not the same as the one
+        # being rendered while rendering in the render thread
+        self._front_rgbobj = None
+        # geometry of the last render, for scrolling the backing array
+        self._scroll_state = None
+        # canvas image objects whose areas need to be recomposited
+        self._dirty_objs = []
+        # inputs of the last redraw, and counts of their changes (see
+        # _track_changes)
+        self._render_state = None
+        self._render_versions = dict(data=0, cuts=0, rgbmap=0, transform=0,
+                                     canvas=0)
+        # count of changes to the canvas that affect its images
+        self._canvas_version = 0
 
         # optimization of redrawing
         self.defer_redraw = self.t_.get('defer_redraw', True)
@@ -263,10 +409,18 @@ class ImageViewBase(Callback.Callbacks):
         self.time_last_redraw = time.time()
         self._defer_whence = 0
         self._defer_whence_reset = 5
+        # lowest whence asked for explicitly since the last redraw, which
+        # is not downgraded (see _track_changes)
+        self._redraw_exact = self._defer_whence_reset
         self._defer_lock = threading.RLock()
         self._defer_flag = False
         self._hold_redraw_cnt = 0
         self.suppress_redraw = SuppressRedraw(self)
+        # preview rendering during interactive gestures
+        self._preview_until = 0.0
+        self._previewing = False
+        self._preview_drawn = False
+        self._preview_pending = False
 
         # last known window mouse position
         self.last_win_x = 0
@@ -353,6 +507,29 @@ class ImageViewBase(Callback.Callbacks):
             self.rf_timer.add_callback('expired', self.refresh_timer_cb,
                                        self.rf_flags)
 
+        # for rendering in a worker thread
+        self._render_cond = threading.Condition()
+        # serializes rendering of the backing arrays
+        self._render_lock = threading.RLock()
+        self._render_gen = 0
+        self._render_req = None
+        # geometry of the backing arrays, as last rendered
+        self._backing_geom = None
+        self._render_res = None
+        self._render_busy = False
+        self._render_thread = None
+        self._render_polling = False
+        self._time_last_present = time.time()
+        # how often the GUI thread checks for a finished frame
+        self.render_poll_interval = 0.005
+        # stale renders are not cancelled if no frame has been shown
+        # for this long, so that something is shown while the view
+        # changes continuously
+        self.render_max_stale = 0.25
+        self._render_timer = self.make_timer()
+        if self._render_timer is not None:
+            self._render_timer.add_callback('expired', self._render_poll_cb)
+
     def set_window_size(self, width, height):
         """Report the size of the window to display the image.
 
@@ -448,6 +625,12 @@ class ImageViewBase(Callback.Callbacks):
             raise ImageViewNoDataError("No data found")
         return image.get_size()
 
+    @property
+    def t_(self):
+        # settings of the view being rendered in this thread
+        # (to be eventually deprecated)
+        return self._get_view().settings
+
     def get_settings(self):
         """Get the settings used by this instance.
 
@@ -1021,6 +1204,9 @@ class ImageViewBase(Callback.Callbacks):
     def redraw(self, whence=0):
         """Redraw the canvas.
 
+        The redraw is carried out in full, even if nothing that the viewer
+        keeps track of has changed (e.g. image data changed in place).
+
         Parameters
         ----------
         whence
@@ -1028,7 +1214,15 @@ class ImageViewBase(Callback.Callbacks):
 
         """
         with self._defer_lock:
-            whence = min(self._defer_whence, whence)
+            self._redraw_exact = min(self._redraw_exact, whence)
+        self._redraw(whence)
+
+    def _redraw(self, whence):
+        """Redraw the canvas, as far as changes since the last redraw
+        need it (see :meth:`_track_changes`).
+        """
+        with self._defer_lock:
+            whence = self._merge_whence(self._defer_whence, whence)
 
             if not self.defer_redraw:
                 if self._hold_redraw_cnt == 0:
@@ -1040,8 +1234,11 @@ class ImageViewBase(Callback.Callbacks):
 
             elapsed = time.time() - self.time_last_redraw
 
-            # If there is no redraw scheduled, or we are overdue for one:
-            if (not self._defer_flag) or (elapsed > self.defer_lagtime):
+            # If there is no redraw scheduled (other than the one to replace
+            # a preview), or we are overdue for one:
+            if ((not self._defer_flag) or self._preview_pending or
+                    (elapsed > self.defer_lagtime)):
+                self._preview_pending = False
                 # If more time than defer_lagtime has passed since the
                 # last redraw then just do the redraw immediately
                 if elapsed > self.defer_lagtime:
@@ -1070,6 +1267,34 @@ class ImageViewBase(Callback.Callbacks):
                 self._defer_whence = whence
                 self.logger.debug("update whence=%.2f" % (whence))
 
+    def redraw_image_object(self, obj):
+        """Redraw the canvas after a change to a canvas image object,
+        recompositing only the area of the backing array that the object
+        covers, if possible.
+
+        Parameters
+        ----------
+        obj : `~ginga.canvas.types.image.Image`
+            Image object that has changed.
+
+        """
+        with self._defer_lock:
+            if obj not in self._dirty_objs:
+                self._dirty_objs.append(obj)
+
+        self.redraw(whence=2.25)
+
+    def _merge_whence(self, whence1, whence2):
+        """Combine two redraw requests into the lowest necessary level
+        of redrawing.
+        """
+        whence = min(whence1, whence2)
+        if (0.0 < whence < 1.0) and (whence < max(whence1, whence2) < 2.5):
+            # a pan-only redraw (see get_rgb_object) cannot scroll the
+            # backing array if the image rendering has also changed
+            whence = 0
+        return whence
+
     def is_redraw_pending(self):
         """Indicates whether a deferred redraw has been scheduled.
 
@@ -1099,7 +1324,13 @@ class ImageViewBase(Callback.Callbacks):
         except KeyError:
             self._imgobj = None
 
-        self.redraw(whence=whence)
+        if whence < 3:
+            objs = self._get_image_objects(self.private_canvas)
+            if not all([hasattr(obj, 'get_render_key') for obj in objs]):
+                # the change may be to image objects that are not tracked
+                # by their render keys (see _get_render_state)
+                self._canvas_version += 1
+        self._redraw(whence)
 
     def delayed_redraw(self):
         """Handle delayed redrawing of the canvas."""
@@ -1111,11 +1342,99 @@ class ImageViewBase(Callback.Callbacks):
             self._defer_whence = self._defer_whence_reset
             flag = self._defer_flag
             self._defer_flag = False
+            self._preview_pending = False
 
         if flag:
             # If a redraw was scheduled, do it now
             self.redraw_now(whence=whence)
 
+    def note_interaction(self):
+        """Note that an interactive gesture (panning, zooming, etc.) is
+        changing the view.
+
+        If the `use_preview_render` setting is True, redraws render only a
+        quick, coarse preview until no gesture has been noted for
+        `preview_lagtime` seconds, after which the view is redrawn at full
+        quality.
+        """
+        if not self.t_.get('use_preview_render', False):
+            return
+        with self._defer_lock:
+            self._preview_until = (time.time() +
+                                   self.t_.get('preview_lagtime', 0.25))
+
+    def is_previewing(self):
+        """Returns True if the current redraw is rendering a preview
+        (see :meth:`note_interaction`).
+        """
+        return self._previewing
+
+    def _schedule_preview_redraw(self):
+        # schedule the full quality redraw after the interaction stops,
+        # unless some other redraw is already scheduled
+        with self._defer_lock:
+            if self._defer_flag and not self._preview_pending:
+                return
+            self._defer_flag = True
+            self._preview_pending = True
+            secs = max(self._preview_until - time.time(), 0.0) + 0.001
+
+        self.logger.debug("redraw after preview in %.3f sec" % (secs))
+        self.reschedule_redraw(secs)
+
+    def get_render_stats(self, percentiles=None):
+        """Get statistics of the time spent in each stage of rendering,
+        over recent redraws.
+
+        The stages are:
+
+            pan_rect. Calculating the visible area of images
+            cutout. Cutting out and scaling image data
+            cut_levels. Applying cut levels and color distribution
+            color_map. Color mapping
+            composite. Compositing images into the backing array
+            backing. Allocating and copying backing arrays
+            icc. Conversion to the output ICC profile
+            transforms. Flips, swaps and rotation
+            encode. Preparing the backend's offscreen surface
+            blit. Updating the window from the offscreen surface
+            canvas. Drawing the canvas objects
+            total. The whole redraw
+
+        Parameters
+        ----------
+        percentiles : sequence of float or None
+            Percentiles to report (default: 50, 90 and 99).
+
+        Returns
+        -------
+        stats : dict
+            The number of redraws recorded (``num_frames``) and a dict of
+            statistics, keyed by stage (``stages``).  The statistics of a
+            stage are the number of redraws in which it ran (``count``) and
+            the ``mean``, ``min``, ``max`` and percentiles (e.g. ``p90``)
+            of its time per redraw, in seconds.
+
+            Also the counts of events (``counts``), such as the number of
+            redraws that were ``downgraded`` to a higher level than was
+            asked for, and the number of changes seen to each kind of
+            input to rendering (``versions``: ``data``, ``cuts``,
+            ``rgbmap``, ``transform`` and ``canvas``).
+
+        """
+        stats = self.render_times.get_stats(percentiles=percentiles)
+        stats['versions'] = dict(self._render_versions)
+        return stats
+
+    def clear_render_stats(self):
+        """Discard the recorded rendering times."""
+        self.render_times.clear()
+
+    def render_stats_change_cb(self, setting, value):
+        """Handle callback related to changes in the number of redraws
+        kept for rendering statistics."""
+        self.render_times.set_num_frames(value)
+
     def set_redraw_lag(self, lag_sec):
         """Set lag time for redrawing the canvas.
 
@@ -1253,12 +1572,30 @@ class ImageViewBase(Callback.Callbacks):
             See :meth:`get_rgb_object`.
 
         """
+        whence = self._track_changes(whence)
+
+        if (self.t_.get('render_in_thread', False) and
+                (self._render_timer is not None) and
+                self._imgwin_set and not self._self_scaling):
+            self._request_render(whence)
+            return
+
         try:
             time_start = time.time()
-            self.redraw_data(whence=whence)
+            self.render_times.start_frame()
+            whence, previewing = self._start_frame(whence, time_start)
+
+            try:
+                self.redraw_data(whence=whence)
+            finally:
+                self._previewing = False
+            if previewing:
+                self._schedule_preview_redraw()
 
             # finally update the window drawable from the offscreen surface
-            self.update_image()
+            with self.render_times.time('blit'):
+                self.update_image()
+            self.render_times.end_frame()
 
             time_done = time.time()
             time_delta = time_start - self.time_last_redraw
@@ -1269,15 +1606,301 @@ class ImageViewBase(Callback.Callbacks):
                     self.name, whence, time_delta, time_elapsed))
 
         except Exception as e:
-            self.logger.error("Error redrawing image: %s" % (str(e)))
+            # don't trust the last state for the next redraw
+            self._render_state = None
+            self._log_render_error(e)
+
+    def _get_render_state(self):
+        """Get keys of the current inputs to rendering, by the kind of
+        change that they make (see :meth:`_track_changes`).
+        """
+        settings = self.t_.get_dict()
+        state = dict()
+        for name, keys in _stage_settings.items():
+            state[name] = [settings.pop(key, None) for key in keys]
+        state['cuts'].append(type(self.autocuts))
+        state['rgbmap'].append((id(self.rgbmap), self.rgbmap.get_version()))
+
+        objs = [obj.get_render_key()
+                for obj in self._get_image_objects(self.private_canvas)
+                if hasattr(obj, 'get_render_key')]
+
+        state['data'] = [settings, self.get_window_size(), objs]
+        state['canvas'] = self._canvas_version
+        return state
+
+    def _track_changes(self, whence):
+        """Find out what has changed since the last redraw, and raise
+        `whence` (see :meth:`get_rgb_object`) to the level that the changes
+        actually need, if the `use_change_tracking` setting is True.
+
+        Callers often ask for a full redraw when only the overlays or
+        something else that does not affect the images has changed.
+        Only redraws for changes to the canvas and periodic redraws are
+        raised; those asked for with :meth:`redraw` are not.
+        """
+        with self._defer_lock:
+            exact, self._redraw_exact = (self._redraw_exact,
+                                         self._defer_whence_reset)
+        if whence >= 3:
+            return whence
+        state = self._get_render_state()
+        last, self._render_state = self._render_state, state
+
+        changed = set()
+        for name, key in state.items():
             try:
-                # log traceback, if possible
-                (type, value, tb) = sys.exc_info()
-                tb_str = "".join(traceback.format_tb(tb))
-                self.logger.error("Traceback:\n%s" % (tb_str))
-            except Exception:
-                tb_str = "Traceback information unavailable."
-                self.logger.error(tb_str)
+                if (last is None) or (key != last[name]):
+                    changed.add(name)
+            except ValueError:
+                # e.g. a setting that is an array
+                changed.add(name)
+        for name in changed:
+            self._render_versions[name] += 1
+
+        if (last is None) or not self.t_.get('use_change_tracking', True):
+            return whence
+
+        if changed & set(['data', 'transform', 'canvas']):
+            need = 0
+        elif 'cuts' in changed:
+            need = 1
+        elif 'rgbmap' in changed:
+            need = 2
+        elif len(self._dirty_objs) > 0:
+            need = 2.25
+        else:
+            need = 3
+        need = min(need, exact)
+
+        if need <= whence:
+            return whence
+        self.render_times.count('downgraded')
+        self.logger.debug("redraw whence=%.2f downgraded to %.2f" % (
+            whence, need))
+        return need
+
+    def _log_render_error(self, e):
+        self.logger.error("Error redrawing image: %s" % (str(e)))
+        try:
+            # log traceback, if possible
+            (type, value, tb) = sys.exc_info()
+            tb_str = "".join(traceback.format_tb(tb))
+            self.logger.error("Traceback:\n%s" % (tb_str))
+        except Exception:
+            tb_str = "Traceback information unavailable."
+            self.logger.error(tb_str)
+
+    def _start_frame(self, whence, time_start):
+        # decide whether the frame starting now is a preview
+        with self._defer_lock:
+            previewing = (time_start < self._preview_until)
+            if self._preview_drawn and not previewing:
+                # replace the preview with a full quality rendering
+                whence = 0
+            self._previewing = self._preview_drawn = previewing
+        return (whence, previewing)
+
+    def _get_view(self):
+        # state of the view being rendered in this thread
+        view = getattr(self._render_local, 'view', None)
+        if view is None:
+            return self._live_view
+        return view
+
+    def _snapshot_view(self):
+        # copy of the state of the view, for the render thread to render
+        # against while the GUI thread goes on changing it
+        return Bunch.Bunch(settings=_SettingsSnapshot(self.settings),
+                           geom=dict(self._live_view.geom),
+                           rgbmap_version=self.rgbmap.get_version())
+
+    def _request_render(self, whence):
+        """Ask the render thread to render a frame of the view as it is
+        now.  Any frame that it is still rendering is stale, and is
+        cancelled if possible.
+        """
+        view = self._snapshot_view()
+        with self._render_cond:
+            if self._render_req is not None:
+                # superseded request that was never started
+                whence = self._merge_whence(self._render_req[1], whence)
+            self._render_gen += 1
+            self._render_req = (self._render_gen, whence, view)
+            self._render_cond.notify()
+
+            if self._render_thread is None:
+                self._render_thread = threading.Thread(
+                    target=self._render_loop, name='render-%s' % (self.name))
+                self._render_thread.daemon = True
+                self._render_thread.start()
+
+        if not self._render_polling:
+            self._render_polling = True
+            self._render_timer.set(self.render_poll_interval)
+
+    def _render_loop(self):
+        # body of the render thread
+        while True:
+            with self._render_cond:
+                while self._render_req is None:
+                    self._render_cond.wait()
+                gen, whence, view = self._render_req
+                self._render_req = None
+                self._render_busy = True
+
+            res = None
+            try:
+                res = self._render_frame(gen, whence, view)
+
+            except _RenderCancelled:
+                self.logger.debug("stale render (whence=%.2f) cancelled" % (
+                    whence))
+                # the partly rendered arrays have to be redone by the
+                # request that superseded this one
+                if 0.0 < whence < 1.0:
+                    whence = 0
+                elif 2.0 < whence < 2.5:
+                    whence = 2
+                with self._render_cond:
+                    if self._render_req is not None:
+                        gen, _whence, view = self._render_req
+                        self._render_req = (gen, min(whence, _whence), view)
+
+            except Exception as e:
+                # don't trust the last state for the next redraw
+                self._render_state = None
+                if gen == self._render_gen:
+                    self._log_render_error(e)
+                else:
+                    # probably the state changed underneath a stale render
+                    self.logger.debug("stale render failed: %s" % (str(e)))
+                    # the request that superseded this one has to redo it
+                    with self._render_cond:
+                        if self._render_req is not None:
+                            gen, _whence, view = self._render_req
+                            self._render_req = (gen, 0, view)
+
+            with self._render_cond:
+                self._render_busy = False
+                if res is not None:
+                    self._render_res = res
+
+    def _render_frame(self, gen, whence, view):
+        # render a frame of the snapshot `view` in the render thread.
+        # The geometry it calculates stays in `view`, and is only applied
+        # to the viewer when the frame is presented.
+        self.render_times.start_frame()
+        self._render_local.view = view
+        try:
+            whence, previewing = self._start_frame(whence, time.time())
+            try:
+                with self._render_lock:
+                    if self._backing_geom is not None:
+                        # the backing arrays that are reused were rendered
+                        # in this geometry, which may not have been shown
+                        view.geom.update(self._backing_geom)
+                    rgbobj = self._get_rgb_object(whence, gen=gen)
+            finally:
+                self._previewing = False
+        finally:
+            self._render_local.view = None
+            # the frame is finished in the GUI thread
+            frame_times = self.render_times.detach_frame()
+        return (whence, previewing, rgbobj, view, frame_times)
+
+    def _check_cancel(self, gen):
+        """Raise `_RenderCancelled` if the frame for request `gen` is
+        being rendered in the render thread and has been superseded.
+        """
+        if ((gen is not None) and (gen != self._render_gen) and
+                (time.time() - self._time_last_present <
+                 self.render_max_stale)):
+            raise _RenderCancelled()
+
+    def _render_poll_cb(self, timer):
+        """Handle timer callback (in the GUI thread) for checking on the
+        render thread, showing any frame that it has finished.
+        """
+        with self._render_cond:
+            res, self._render_res = self._render_res, None
+            busy = self._render_busy or (self._render_req is not None)
+
+        if res is not None:
+            self._present_frame(*res)
+
+        if busy:
+            timer.set(self.render_poll_interval)
+        else:
+            self._render_polling = False
+
+    def _present_frame(self, whence, previewing, rgbobj, view=None,
+                       frame_times=None):
+        # show a frame rendered in the render thread, of the snapshot
+        # `view` (if given)
+        if frame_times is not None:
+            self.render_times.attach_frame(frame_times)
+        try:
+            time_start = time.time()
+            if view is not None:
+                # graphics are drawn in the geometry of the frame shown
+                geom = self._live_view.geom
+                for name in _frame_geometry:
+                    geom[name] = view.geom[name]
+            self._front_rgbobj = rgbobj
+            with self.render_times.time('encode'):
+                self.render_image(rgbobj, self._dst_x, self._dst_y)
+
+            with self.render_times.time('canvas'):
+                self.private_canvas.draw(self)
+
+            if whence < 1:
+                self.make_callback('redraw')
+
+            if previewing:
+                self._schedule_preview_redraw()
+
+            with self.render_times.time('blit'):
+                self.update_image()
+            self.render_times.end_frame()
+
+            time_done = time.time()
+            self._time_last_present = self.time_last_redraw = time_done
+            self.logger.debug(
+                "widget '%s' presented frame (whence=%.2f) in %.4f sec" % (
+                    self.name, whence, time_done - time_start))
+
+            if ((view is not None) and
+                    (view.rgbmap_version != self.rgbmap.get_version())):
+                # the color map changed while the frame was rendered, so
+                # that it may be partly in the old colors
+                self.redraw(whence=2)
+
+        except Exception as e:
+            self._log_render_error(e)
+
+    def show_rgb_object(self, rgbobj):
+        """Show an RGB object rendered elsewhere in place of a rendering
+        of the current image, e.g. a frame rendered ahead of time for data
+        that has been set since, with the same view settings.  Graphical
+        overlays are drawn over it.
+
+        The next redraw that renders the image recalculates everything.
+
+        Parameters
+        ----------
+        rgbobj : `~ginga.RGBMap.RGBPlanes`
+            RGB object of the size of the window.
+
+        """
+        with self._render_lock:
+            # drop the backing arrays of the previous rendering
+            self._rgbarr = self._rgbarr2 = None
+            self._rgbobj = rgbobj
+            self._render_state = None
+            self._backing_geom = None
+        self.render_times.start_frame()
+        self._present_frame(0, False, rgbobj)
 
     def redraw_data(self, whence=0):
         """Render image from RGB map and redraw private canvas.
@@ -1298,12 +1921,14 @@ class ImageViewBase(Callback.Callbacks):
 
         if not self._self_scaling:
             rgbobj = self.get_rgb_object(whence=whence)
-            self.render_image(rgbobj, self._dst_x, self._dst_y)
+            with self.render_times.time('encode'):
+                self.render_image(rgbobj, self._dst_x, self._dst_y)
 
-        self.private_canvas.draw(self)
+        with self.render_times.time('canvas'):
+            self.private_canvas.draw(self)
 
         # TODO: see if we can deprecate this fake callback
-        if whence <= 0:
+        if whence < 1:
             self.make_callback('redraw')
 
         if whence < 2:
@@ -1358,7 +1983,7 @@ class ImageViewBase(Callback.Callbacks):
             dtype = self.rgbmap.dtype
 
         # Prepare data array for rendering
-        data = self._rgbobj.get_array(order, dtype=dtype)
+        data = self._front_rgbobj.get_array(order, dtype=dtype)
 
         # NOTE [A]
         height, width, depth = data.shape
@@ -1474,14 +2099,18 @@ class ImageViewBase(Callback.Callbacks):
 
         Parameters
         ----------
-        whence : {0, 1, 2, 3}
+        whence : {0, 0.5, 1, 2, 2.25, 3}
             Optimization flag that reduces the time to create
             the RGB object by only recalculating what is necessary:
 
                 0. New image, pan/scale has changed, or rotation/transform
                    has changed; Recalculate everything
+                0.5. Only the pan position has changed; Scroll the
+                   backing array and render the exposed areas, if possible
                 1. Cut levels or similar has changed
                 2. Color mapping has changed
+                2.25. Some canvas image objects have changed; Recomposite
+                   only the areas they cover
                 3. Graphical overlays have changed
 
         Returns
@@ -1490,10 +2119,32 @@ class ImageViewBase(Callback.Callbacks):
             RGB object.
 
         """
+        with self._render_lock:
+            return self._get_rgb_object(whence)
+
+    def _get_rgb_object(self, whence, gen=None):
+        # If `gen` is given we are in the render thread, rendering the
+        # frame for that request: the frame may be cancelled between
+        # stages, and its array must not be changed after it is returned,
+        # as it is shown by the GUI thread while the next one is rendered
         time_start = time.time()
         win_wd, win_ht = self.get_window_size()
         order = self.get_rgb_order()
 
+        if 0.0 < whence < 1.0:
+            # only the pan position has changed
+            if self._scroll_rgbarr(win_wd, win_ht):
+                whence = 2.5
+            else:
+                whence = 0
+
+        if 2.0 < whence < 2.5:
+            # only some canvas image objects have changed
+            if self._recomposite_dirty():
+                whence = 2.5
+            else:
+                whence = 2
+
         if (whence <= 0.0) or (self._rgbarr is None):
             # calculate dimensions of window RGB backing image
             pan_x, pan_y = self.get_pan(coord='data')[:2]
@@ -1504,38 +2155,214 @@ class ImageViewBase(Callback.Callbacks):
 
             # create backing image
             depth = len(order)
-            rgba = np.zeros((ht, wd, depth), dtype=self.rgbmap.dtype)
+            with self.render_times.time('backing'):
+                rgba = np.zeros((ht, wd, depth), dtype=self.rgbmap.dtype)
             self._rgbarr = rgba
 
+            self._scroll_state = Bunch.Bunch(
+                scale=(scale_x, scale_y),
+                origin=self._get_backing_origin(wd, ht),
+                rect=self._get_backing_rect(wd, ht, pad=-2))
+
+        self._check_cancel(gen)
+
         if (whence <= 2.0) or (self._rgbarr2 is None):
+            # everything is being recomposited
+            with self._defer_lock:
+                self._dirty_objs = []
+
             # Apply any RGB image overlays
-            self._rgbarr2 = np.copy(self._rgbarr)
+            with self.render_times.time('backing'):
+                self._rgbarr2 = np.copy(self._rgbarr)
             self.overlay_images(self.private_canvas, self._rgbarr2,
                                 whence=whence)
 
             # convert to output ICC profile, if one is specified
-            output_profile = self.t_.get('icc_output_profile', None)
-            working_profile = rgb_cms.working_profile
-            if (working_profile is not None) and (output_profile is not None):
-                self.convert_via_profile(self._rgbarr2, order,
-                                         working_profile, output_profile)
+            self._convert_output_profile(self._rgbarr2, order)
+
+        self._check_cancel(gen)
 
         if (whence <= 2.5) or (self._rgbobj is None):
             rotimg = self._rgbarr2
 
             # Apply any viewing transformations or rotations
             # if not applied earlier
-            rotimg = self.apply_transforms(rotimg,
-                                           self.t_['rot_deg'])
-            rotimg = np.ascontiguousarray(rotimg)
+            with self.render_times.time('transforms'):
+                rotimg = self.apply_transforms(rotimg,
+                                               self.t_['rot_deg'])
+                rotimg = np.ascontiguousarray(rotimg)
+                if (gen is not None) and np.may_share_memory(rotimg,
+                                                             self._rgbarr2):
+                    rotimg = rotimg.copy()
 
             self._rgbobj = RGBMap.RGBPlanes(rotimg, order)
 
+        if gen is None:
+            self._front_rgbobj = self._rgbobj
+        geom = self._get_view().geom
+        self._backing_geom = dict([(name, geom[name])
+                                   for name in _frame_geometry])
+
         time_end = time.time()
         self.logger.debug("times: total=%.4f" % (
             (time_end - time_start)))
         return self._rgbobj
 
+    def _convert_output_profile(self, data, order):
+        # convert to output ICC profile, if one is specified
+        output_profile = self.t_.get('icc_output_profile', None)
+        working_profile = rgb_cms.working_profile
+        if (working_profile is not None) and (output_profile is not None):
+            with self.render_times.time('icc'):
+                self.convert_via_profile(data, order,
+                                         working_profile, output_profile)
+
+    def _get_backing_origin(self, wd, ht):
+        """Get the position, rounded to whole pixels, of the data origin
+        in a pre-transformed backing array of size `wd` x `ht`.
+        """
+        pan_x, pan_y = self.get_pan(coord='data')[:2]
+        scale_x, scale_y = self.get_scale_xy()
+        pan_x, pan_y = pan_x + self.data_off, pan_y + self.data_off
+        return (int(np.floor(wd / 2.0 - pan_x * scale_x + 0.5)),
+                int(np.floor(ht / 2.0 - pan_y * scale_y + 0.5)))
+
+    def _get_backing_rect(self, wd, ht, pad=0):
+        """Get the bounding box (x1, y1, x2, y2) of the area of the
+        pre-transformed backing array that is shown in the window,
+        enlarged by `pad` pixels on each side (shrunk, if negative).
+        """
+        pan_x, pan_y = self.get_pan(coord='data')[:2]
+        scale_x, scale_y = self.get_scale_xy()
+        pan_x, pan_y = pan_x + self.data_off, pan_y + self.data_off
+
+        pts = np.asarray(self.get_pan_rect()).T
+        xs = wd / 2.0 + (pts[0] - pan_x) * scale_x
+        ys = ht / 2.0 + (pts[1] - pan_y) * scale_y
+        x1 = max(0, int(np.floor(np.min(xs))) - pad)
+        y1 = max(0, int(np.floor(np.min(ys))) - pad)
+        x2 = min(wd, int(np.ceil(np.max(xs))) + pad)
+        y2 = min(ht, int(np.ceil(np.max(ys))) + pad)
+        return (x1, y1, x2, y2)
+
+    def _scroll_rgbarr(self, win_wd, win_ht):
+        """Try to update the backing array for a change in pan position
+        only, by shifting its contents and rendering just the areas that
+        were exposed.
+
+        Returns True if this was done, False if a full render is needed.
+        """
+        state = self._scroll_state
+        if ((not self.t_.get('use_scroll_blit', False)) or (state is None) or
+                (self._rgbarr is None) or (self._rgbarr2 is None)):
+            return False
+
+        pan_x, pan_y = self.get_pan(coord='data')[:2]
+        scale_x, scale_y = self.get_scale_xy()
+        if (scale_x, scale_y) != state.scale:
+            return False
+        # interpolated pixels depend on their neighbors, so the exposed
+        # areas would not match up with the scrolled contents
+        if self.t_.get('interpolation', 'basic') not in ('basic', 'nearest'):
+            return False
+        # at fractional scales the rendered pixels only line up exactly
+        # after a scroll if all of the images are rendered on a grid
+        # fixed in data coordinates (i.e. in tiles)
+        if (not (float(scale_x).is_integer() and
+                 float(scale_y).is_integer()) and
+                not self._images_grid_aligned(self.private_canvas)):
+            return False
+        wd, ht = self._calc_bg_dimensions(scale_x, scale_y,
+                                          pan_x, pan_y, win_wd, win_ht)
+        if self._rgbarr2.shape[:2] != (ht, wd):
+            return False
+
+        # shift of the contents in pixels
+        origin = self._get_backing_origin(wd, ht)
+        dx, dy = origin[0] - state.origin[0], origin[1] - state.origin[1]
+
+        # part of the needed area that is still valid after the shift
+        # (allowing a little slop for roundoff at the edges)
+        x1, y1, x2, y2 = self._get_backing_rect(wd, ht, pad=2)
+        ox1, oy1, ox2, oy2 = state.rect
+        vx1, vy1 = max(x1, ox1 + dx), max(y1, oy1 + dy)
+        vx2, vy2 = min(x2, ox2 + dx), min(y2, oy2 + dy)
+        if (vx2 <= vx1) or (vy2 <= vy1):
+            # nothing can be reused
+            return False
+
+        arr = self._rgbarr2
+        arr[vy1:vy2, vx1:vx2] = arr[vy1 - dy:vy2 - dy, vx1 - dx:vx2 - dx]
+
+        # render the exposed areas
+        clips = [(x1, y1, x2, vy1), (x1, vy2, x2, y2),
+                 (x1, vy1, vx1, vy2), (vx2, vy1, x2, vy2)]
+        order = self.get_rgb_order()
+        for clip in clips:
+            cx1, cy1, cx2, cy2 = clip
+            if (cx2 <= cx1) or (cy2 <= cy1):
+                continue
+            arr[cy1:cy2, cx1:cx2] = self._rgbarr[cy1:cy2, cx1:cx2]
+            self.overlay_images(self.private_canvas, arr, whence=0,
+                                clip=clip)
+            self._convert_output_profile(arr[cy1:cy2, cx1:cx2], order)
+
+        self.logger.debug("scrolled backing array by %d,%d" % (dx, dy))
+        state.origin = origin
+        state.rect = self._get_backing_rect(wd, ht, pad=-2)
+        return True
+
+    def _get_image_objects(self, canvas):
+        # the canvas image objects on `canvas`, including those in its
+        # compound objects
+        objs = []
+        if not hasattr(canvas, 'objects'):
+            return objs
+
+        for obj in canvas.get_objects():
+            if hasattr(obj, 'draw_image'):
+                objs.append(obj)
+            elif obj.is_compound() and (obj != canvas):
+                objs.extend(self._get_image_objects(obj))
+        return objs
+
+    def _images_grid_aligned(self, canvas):
+        # whether all of the canvas image objects on `canvas` are rendered
+        # on a grid fixed in data coordinates (see _scroll_rgbarr)
+        for obj in self._get_image_objects(canvas):
+            if not obj.is_grid_aligned(self):
+                return False
+        return True
+
+    def _recomposite_dirty(self):
+        """Try to update the backing array for changes to some canvas
+        image objects, by recompositing only the areas they cover (before
+        and after the change) on top of the unchanged background.
+
+        Returns True if this was done, False if a full composite is needed.
+        """
+        with self._defer_lock:
+            objs, self._dirty_objs = self._dirty_objs, []
+
+        if (self._rgbarr is None) or (self._rgbarr2 is None):
+            return False
+
+        arr = self._rgbarr2
+        clips = [obj.get_dirty_rect(self, arr) for obj in objs]
+        order = self.get_rgb_order()
+        for clip in clips:
+            if clip is None:
+                continue
+            x1, y1, x2, y2 = clip
+            arr[y1:y2, x1:x2] = self._rgbarr[y1:y2, x1:x2]
+            self.overlay_images(self.private_canvas, arr, whence=3,
+                                clip=clip)
+            self._convert_output_profile(arr[y1:y2, x1:x2], order)
+
+        self.logger.debug("recomposited %d image object areas" % (
+            len(clips)))
+        return True
+
     def _calc_bg_dimensions(self, scale_x, scale_y,
                             pan_x, pan_y, win_wd, win_ht):
         """
@@ -1587,10 +2414,21 @@ class ImageViewBase(Callback.Callbacks):
         self._org_x2 = x2
         self._org_y2 = y2
 
-        # Make a square from the scaled cutout, with room to rotate
-        slop = 20
-        side = int(math.sqrt(win_wd**2 + win_ht**2) + slop)
-        wd = ht = side
+        if self.t_['rot_deg'] != 0:
+            # Make a square from the scaled cutout, with room to rotate
+            slop = 20
+            side = int(math.sqrt(win_wd**2 + win_ht**2) + slop)
+            wd = ht = side
+        else:
+            # No rotation: just cover the window, with a little slop
+            # for roundoff at the edges.  Flips and swaps are done as
+            # views of this array, so it is in the data orientation.
+            # Even sizes keep the center on a pixel boundary.
+            slop = 4
+            wd, ht = win_wd + slop, win_ht + slop
+            wd, ht = wd + wd % 2, ht + ht % 2
+            if self.t_['swap_xy']:
+                wd, ht = ht, wd
 
         # Find center of new array
         ncx, ncy = wd // 2, ht // 2
@@ -1640,8 +2478,9 @@ class ImageViewBase(Callback.Callbacks):
         flip_x, flip_y = self.t_['flip_x'], self.t_['flip_y']
         swap_xy = self.t_['swap_xy']
 
-        data = trcalc.transform(data, flip_x=flip_x, flip_y=flip_y,
-                                swap_xy=swap_xy)
+        if rot_deg == 0:
+            data = trcalc.transform(data, flip_x=flip_x, flip_y=flip_y,
+                                    swap_xy=swap_xy)
         if flip_y:
             yoff = ht - yoff
         if flip_x:
@@ -1657,8 +2496,11 @@ class ImageViewBase(Callback.Callbacks):
         if rot_deg != 0:
             # This is the slowest part of the rendering--install the OpenCv or pyopencl
             # packages to speed it up
-            data = np.ascontiguousarray(data)
-            data = trcalc.rotate_clip(data, -rot_deg, out=data,
+            # NOTE: not rotated in place, because the unrotated array
+            # may be reused (see _scroll_rgbarr).  Flips and swap are
+            # done in the same step.
+            data = trcalc.rotate_clip(data, -rot_deg, flip_x=flip_x,
+                                      flip_y=flip_y, swap_xy=swap_xy,
                                       logger=self.logger)
 
         split2_time = time.time()
@@ -1687,7 +2529,7 @@ class ImageViewBase(Callback.Callbacks):
 
         return data
 
-    def overlay_images(self, canvas, data, whence=0.0):
+    def overlay_images(self, canvas, data, whence=0.0, clip=None):
         """Overlay data from any canvas image objects.
 
         Parameters
@@ -1701,6 +2543,10 @@ class ImageViewBase(Callback.Callbacks):
         whence
              See :meth:`get_rgb_object`.
 
+        clip : tuple or None
+            If given as (x1, y1, x2, y2), only render that region of
+            `data`.
+
         """
         #if not canvas.is_compound():
         if not hasattr(canvas, 'objects'):
@@ -1708,9 +2554,15 @@ class ImageViewBase(Callback.Callbacks):
 
         for obj in canvas.get_objects():
             if hasattr(obj, 'draw_image'):
-                obj.draw_image(self, data, whence=whence)
+                if self._previewing and (obj is not self._imgobj):
+                    # skip overlaid images in a preview
+                    continue
+                if clip is None:
+                    obj.draw_image(self, data, whence=whence)
+                else:
+                    obj.draw_image(self, data, whence=whence, clip=clip)
             elif obj.is_compound() and (obj != canvas):
-                self.overlay_images(obj, data, whence=whence)
+                self.overlay_images(obj, data, whence=whence, clip=clip)
 
     def convert_via_profile(self, data_np, order, inprof_name, outprof_name):
         """Convert the given RGB data from the working ICC profile
@@ -1733,9 +2585,26 @@ class ImageViewBase(Callback.Callbacks):
         proofprof_name = self.t_.get('icc_proof_profile', None)
         proof_intent = self.t_.get('icc_proof_intent', 'perceptual')
         use_black_pt = self.t_.get('icc_black_point_compensation', False)
+        lut_size = self.t_.get('icc_lut_size', 33)
 
         try:
             rgbobj = RGBMap.RGBPlanes(data_np, order)
+            ri, gi, bi = rgbobj.get_order_indexes('RGB')
+
+            if (lut_size > 1) and (data_np.dtype == np.uint8):
+                # convert in-place through a 3D color lookup table
+                rgb_cms.convert_profile_lut(data_np, inprof_name,
+                                            outprof_name,
+                                            to_intent=to_intent,
+                                            proof_name=proofprof_name,
+                                            proof_intent=proof_intent,
+                                            use_black_pt=use_black_pt,
+                                            indexes=(ri, gi, bi),
+                                            size=lut_size)
+                self.logger.debug("Converted from '%s' to '%s' profile" % (
+                    inprof_name, outprof_name))
+                return
+
             arr_np = rgbobj.get_array('RGB')
 
             arr = rgb_cms.convert_profile_fromto(arr_np, inprof_name, outprof_name,
@@ -1744,7 +2613,6 @@ class ImageViewBase(Callback.Callbacks):
                                                  proof_intent=proof_intent,
                                                  use_black_pt=use_black_pt,
                                                  logger=self.logger)
-            ri, gi, bi = rgbobj.get_order_indexes('RGB')
 
             out = data_np
             out[..., ri] = arr[..., 0]
@@ -2355,6 +3223,16 @@ class ImageViewBase(Callback.Callbacks):
         canvas_img.reset_optimize()
         self.redraw(whence=0)
 
+    def pyramid_change_cb(self, setting, value):
+        """Handle callback related to use of the image pyramid."""
+        self.redraw(whence=0)
+
+    def render_optimize_change_cb(self, setting, value):
+        """Handle callback related to changes in rendering optimizations."""
+        canvas_img = self.get_canvas_image()
+        canvas_img.reset_optimize()
+        self.redraw(whence=0)
+
     def set_name(self, name):
         """Set viewer name."""
         self.name = name
@@ -2447,7 +3325,11 @@ class ImageViewBase(Callback.Callbacks):
         pan_x, pan_y = value
 
         self.logger.debug("pan set to %.2f,%.2f" % (pan_x, pan_y))
-        self.redraw(whence=0)
+        whence = 0
+        if self.t_.get('use_scroll_blit', False):
+            # only the pan position changed (see get_rgb_object)
+            whence = 0.5
+        self.redraw(whence=whence)
 
     def get_pan(self, coord='data'):
         """Get pan positions.
@@ -2655,7 +3537,7 @@ class ImageViewBase(Callback.Callbacks):
         if image is None:
             return
 
-        loval, hival = autocuts.calc_cut_levels(image)
+        loval, hival = image.calc_cut_levels(autocuts)
 
         # this will invoke cut_levels_cb()
         self.t_.set(cuts=(loval, hival))
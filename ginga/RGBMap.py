@@ -4,10 +4,13 @@
 # This is open-source software licensed under a BSD license.
 # Please see the file LICENSE.txt for details.
 #
+import hashlib
+
 import numpy as np
 
 from ginga.misc import Callback
 from ginga import ColorDist
+from ginga.util import parallel
 
 
 class RGBMapError(Exception):
@@ -94,6 +97,14 @@ class RGBMapper(Callback.Callbacks):
         self.scale_pct = 1.0
         # length of the color map
         self.maxc = 255
+        # incremented whenever the mapping changes
+        self._version = 0
+        # packed 32-bit lookup table, see get_packed_lut()
+        self._packed_lut = None
+        self._packed_key = None
+        # see get_signature()
+        self._signature = None
+        self._signature_key = None
 
         # targeted bit depth per-pixel band of the output RGB array
         # (can be less than the data size of the output array)
@@ -218,6 +229,7 @@ class RGBMapper(Callback.Callbacks):
         maxlen = self.maxc + 1
         self.sarr = np.arange(maxlen)
         self.scale_pct = 1.0
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
@@ -228,6 +240,7 @@ class RGBMapper(Callback.Callbacks):
         self.sarr = sarr.astype(np.uint, copy=False)
         self.scale_pct = 1.0
 
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
@@ -245,14 +258,41 @@ class RGBMapper(Callback.Callbacks):
 
         # NOTE: don't reset shift array
         #self.reset_sarr(callback=False)
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
+    def get_version(self):
+        """
+        Return a counter that is incremented every time the mapping
+        from index values to colors is changed.  This can be used as part
+        of a key to cache results of color mapping.
+        """
+        return self._version
+
+    def get_signature(self):
+        """
+        Return a key that identifies the mapping from index values to
+        colors by its contents.  Unlike the version (see get_version()),
+        it is the same for different mappers with the same settings, so
+        that the results of color mapping can be shared between them.
+        """
+        key = (self._version, id(self.dist))
+        if self._signature_key != key:
+            md5 = hashlib.md5()
+            for arr in (self.arr, self.sarr, self.dist.hash):
+                md5.update(np.ascontiguousarray(arr).tobytes())
+            self._signature = (type(self).__name__, md5.hexdigest(),
+                               self.maxc, self.bpp, self.get_hash_size())
+            self._signature_key = key
+        return self._signature
+
     def get_hash_size(self):
         return self.dist.get_hash_size()
 
     def set_hash_size(self, size, callback=True):
         self.dist.set_hash_size(size)
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
@@ -270,6 +310,7 @@ class RGBMapper(Callback.Callbacks):
 
     def set_dist(self, dist, callback=True):
         self.dist = dist
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
@@ -287,7 +328,57 @@ class RGBMapper(Callback.Callbacks):
         cs = cs.upper()
         return [order.index(c) for c in cs]
 
+    def get_packed_lut(self, order):
+        """
+        Return a lookup table that maps an index in the range 0-maxc
+        directly to a 32-bit packed pixel in the color plane order
+        `order` (e.g. "RGBA"), with the shift map already applied and
+        the alpha channel (if any) fully opaque.
+
+        The table is only rebuilt when the mapping or `order` changes.
+        Only available for 4-plane orders and 8 bits per band.
+        """
+        order = order.upper()
+        key = (order, self._version)
+        if self._packed_key == key:
+            return self._packed_lut
+
+        assert (len(order) == 4) and (self.dtype == np.uint8), \
+            RGBMapError("Packed lookup table requires 4 bands of 8 bits")
+
+        # fold the shift map into the color map
+        sidx = self.sarr.clip(0, self.maxc)
+        tbl = np.empty((len(sidx), 4), dtype=np.uint8)
+        for i, c in enumerate(order):
+            if c == 'A':
+                tbl[:, i] = self.maxv
+            else:
+                tbl[:, i] = self.arr['RGB'.index(c)][sidx]
+
+        self._packed_lut = tbl.view(np.uint32).reshape(-1)
+        self._packed_key = key
+        return self._packed_lut
+
+    def _can_pack(self, rgbobj, image_order):
+        if type(self)._get_rgbarray != RGBMapper._get_rgbarray:
+            # a subclass maps the colors in its own way
+            return False
+        out = rgbobj.rgbarr
+        return ((image_order is None or len(image_order) < 3) and
+                len(rgbobj.get_order()) == 4 and
+                self.dtype == np.uint8 and out.dtype == np.uint8 and
+                out.flags.c_contiguous)
+
     def _get_rgbarray(self, idx, rgbobj, image_order=''):
+        if self._can_pack(rgbobj, image_order):
+            # map each index to a whole pixel with a single gather,
+            # written through a 32-bit view of the output.
+            # NOTE: mode='clip' takes care of clipping the indexes
+            lut = self.get_packed_lut(rgbobj.get_order())
+            out = rgbobj.rgbarr.view(np.uint32).reshape(idx.shape)
+            lut.take(idx, out=out, mode='clip')
+            return
+
         # NOTE: data is assumed to be in the range 0-maxv at this point
         # but clip as a precaution
         # See NOTE [A]: idx is always an array calculated in the caller and
@@ -316,7 +407,8 @@ class RGBMapper(Callback.Callbacks):
             out[..., gi] = self.arr[1][idx[..., gj]]
             out[..., bi] = self.arr[2][idx[..., bj]]
 
-    def get_rgbarray(self, idx, out=None, order='RGB', image_order=''):
+    def get_rgbarray(self, idx, out=None, order='RGB', image_order='',
+                     num_threads=1):
         """
         Parameters
         ----------
@@ -331,6 +423,10 @@ class RGBMapper(Callback.Callbacks):
 
         image_order : str or None
             The order of channels if indexes already contain RGB info.
+
+        num_threads : int
+            If more than one, map the array in bands of rows on this
+            many threads.
         """
         # prepare output array
         shape = idx.shape
@@ -352,14 +448,26 @@ class RGBMapper(Callback.Callbacks):
 
         res = RGBPlanes(out, order)
 
-        # set alpha channel
-        if res.hasAlpha:
+        # set alpha channel (the packed lookup table includes alpha)
+        if res.hasAlpha and not self._can_pack(res, image_order):
             aa = res.get_slice('A')
             aa.fill(self.maxv)
 
         idx = self.get_hasharray(idx)
 
-        self._get_rgbarray(idx, res, image_order=image_order)
+        if (num_threads > 1) and (idx.ndim > 0):
+            if self._can_pack(res, image_order):
+                # build the shared table before the bands need it
+                self.get_packed_lut(order)
+
+            def _map_band(y1, y2):
+                self._get_rgbarray(idx[y1:y2], RGBPlanes(out[y1:y2], order),
+                                   image_order=image_order)
+
+            parallel.run_in_bands(_map_band, idx.shape[0], num_threads,
+                                  logger=self.logger)
+        else:
+            self._get_rgbarray(idx, res, image_order=image_order)
 
         return res
 
@@ -396,6 +504,7 @@ class RGBMapper(Callback.Callbacks):
         assert len(work) == maxlen, \
             RGBMapError("shifted shift map is != %d" % maxlen)
         self.sarr = work
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
@@ -434,6 +543,7 @@ class RGBMapper(Callback.Callbacks):
             RGBMapError("shifted shift map is != %d" % maxlen)
 
         self.sarr = work
+        self._version += 1
         if callback:
             self.make_callback('changed')
 
@@ -4,6 +4,10 @@
 # This is open-source software licensed under a BSD license.
 # Please see the file LICENSE.txt for details.
 #
+import time
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
 from ginga.canvas.CanvasObject import (CanvasObjectBase, _bool, _color,
@@ -13,10 +17,74 @@ from ginga.canvas.CanvasObject import (CanvasObjectBase, _bool, _color,
 from ginga.misc.ParamSet import Param
 from ginga.misc import Bunch
 from ginga import trcalc
+from ginga.util import parallel
 
 from .mixins import OnePointMixin
 
 
+class TileCache(object):
+    """A least-recently-used cache of rendered tiles, bounded by the
+    total number of bytes held by the tile arrays.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """Return the tile for `key`, or None if it is not cached."""
+        with self._lock:
+            arr = self._tiles.pop(key, None)
+            if arr is not None:
+                # reinsert to mark as most recently used
+                self._tiles[key] = arr
+            return arr
+
+    def put(self, key, arr):
+        """Add tile `arr` under `key`, evicting the least recently
+        used tiles until the cache fits within its byte budget.
+        A view of another array is cached as a copy, since it would keep
+        all of that array alive, which is not counted in the budget.
+        """
+        if not arr.flags.owndata:
+            arr = arr.copy()
+        with self._lock:
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._tiles[key] = arr
+            self.nbytes += arr.nbytes
+
+            while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+                _key, _arr = self._tiles.popitem(last=False)
+                self.nbytes -= _arr.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+def _get_buffer(buf, shape, dtype):
+    # `buf` if it is an array of `shape` and `dtype`, else a new array
+    if (buf is None) or (buf.shape != shape) or (buf.dtype != dtype):
+        buf = np.empty(shape, dtype=dtype)
+    return buf
+
+
+# Cache of intermediate rendering results (cutouts, index and RGB arrays)
+# shared by all of the viewers in the process that have the
+# `use_shared_render_cache` setting, so that viewers showing the same
+# image with the same geometry, cut levels and color mapping reuse each
+# other's results.  Set `max_bytes` to change its memory budget.
+shared_render_cache = TileCache(256 * 1024 * 1024)
+
+
 class Image(OnePointMixin, CanvasObjectBase):
     """Draws an image on a ImageViewCanvas.
     Parameters are:
@@ -102,11 +170,21 @@ class Image(OnePointMixin, CanvasObjectBase):
     def in_cache(self, viewer):
         return viewer in self._cache
 
+    def get_render_key(self):
+        """Return a key of everything about this object that affects how
+        it is rendered, so that viewers can tell whether it has changed.
+        """
+        image = self.image
+        if image is not None:
+            image = (id(image), image.get_data_key())
+        return (id(self), image, self.x, self.y, self.scale_x, self.scale_y,
+                self.alpha, self.interpolation, self.flipy, self.optimize)
+
     def get_cache(self, viewer):
         if viewer in self._cache:
             cache = self._cache[viewer]
         else:
-            cache = self._reset_cache(Bunch.Bunch())
+            cache = self._reset_cache(Bunch.Bunch(extent=None))
             self._cache[viewer] = cache
         return cache
 
@@ -123,8 +201,9 @@ class Image(OnePointMixin, CanvasObjectBase):
         cache = self.get_cache(viewer)
 
         if not cache.drawn:
+            # recomposite just the area of the viewer that we affect
             cache.drawn = True
-            viewer.redraw(whence=2)
+            viewer.redraw_image_object(self)
 
         cpoints = self.get_cpoints(viewer)
         cr = viewer.renderer.setup_cr(self)
@@ -136,49 +215,46 @@ class Image(OnePointMixin, CanvasObjectBase):
         if self.showcap:
             self.draw_caps(cr, self.cap, cpoints)
 
-    def draw_image(self, viewer, dstarr, whence=0.0):
-        if self.image is None:
-            return
+    def draw_image(self, viewer, dstarr, whence=0.0, clip=None):
+        """Composite our image into `dstarr`, the viewer's pre-transformed
+        RGB array.
 
+        If `clip` is given as (x1, y1, x2, y2) only that region of
+        `dstarr` is rendered.  With `whence` 0 this is used by the viewer
+        to fill in the areas exposed after scrolling its backing array;
+        otherwise it recomposites the area of a changed image object.
+        """
         cache = self.get_cache(viewer)
+        if clip is None:
+            self._set_composited(cache)
+
+        if self.image is None:
+            return
 
         dst_order = viewer.get_rgb_order()
         image_order = self.image.get_order()
 
-        if (whence <= 0.0) or (cache.cutout is None) or (not self.optimize):
-            # get extent of our data coverage in the window
-            pts = np.asarray(viewer.get_pan_rect()).T
-            xmin = int(np.min(pts[0]))
-            ymin = int(np.min(pts[1]))
-            xmax = int(np.ceil(np.max(pts[0])))
-            ymax = int(np.ceil(np.max(pts[1])))
-
-            # get destination location in data_coords
-            dst_x, dst_y = self.crdmap.to_data((self.x, self.y))
-
-            a1, b1, a2, b2 = 0, 0, self.image.width - 1, self.image.height - 1
-
-            # calculate the cutout that we can make and scale to merge
-            # onto the final image--by only cutting out what is necessary
-            # this speeds scaling greatly at zoomed in sizes
-            ((dst_x, dst_y), (a1, b1), (a2, b2)) = \
-                trcalc.calc_image_merge_clip((xmin, ymin), (xmax, ymax),
-                                             (dst_x, dst_y),
-                                             (a1, b1), (a2, b2))
-
-            # is image completely off the screen?
-            if (a2 - a1 <= 0) or (b2 - b1 <= 0):
-                # no overlay needed
+        if (clip is not None) and (whence <= 0.0):
+            res = self._get_cutout(viewer, dstarr, clip=clip)
+            if res is None:
                 return
+            data, cvs_pos, _key = res
+            if self.flipy:
+                data = np.flipud(data)
 
-            # cutout and scale the piece appropriately by the viewer scale
-            scale_x, scale_y = viewer.get_scale_xy()
-            # scale additionally by our scale
-            _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
+            # cached results are for the previous pan position
+            self._clear_render_cache(cache)
 
-            res = self.image.get_scaled_cutout2((a1, b1), (a2, b2),
-                                                (_scale_x, _scale_y),
-                                                method=self.interpolation)
+            self._overlay_clip(viewer, dstarr, clip, cvs_pos, data,
+                               dst_order=dst_order, src_order=image_order)
+            return
+
+        if (whence <= 0.0) or (cache.cutout is None) or (not self.optimize):
+            res = self._get_cutout(viewer, dstarr)
+            if res is None:
+                # image is completely off the screen--no overlay needed
+                return
+            data, cache.cvs_pos, _key = res
 
             # don't ask for an alpha channel from overlaid image if it
             # doesn't have one
@@ -191,32 +267,196 @@ class Image(OnePointMixin, CanvasObjectBase):
             ##                                          image_order)
             ## else:
             ##     cache.cutout = res.data
-            data = res.data
             if self.flipy:
                 data = np.flipud(data)
             cache.cutout = data
 
-            # calculate our offset from the pan position
-            pan_x, pan_y = viewer.get_pan()
-            pan_off = viewer.data_off
-            pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
-            off_x, off_y = dst_x - pan_x, dst_y - pan_y
-            # scale offset
-            off_x *= scale_x
-            off_y *= scale_y
-
-            # dst position in the pre-transformed array should be calculated
-            # from the center of the array plus offsets
-            ht, wd, dp = dstarr.shape
-            cvs_x = int(np.round(wd / 2.0 + off_x))
-            cvs_y = int(np.round(ht / 2.0 + off_y))
-            cache.cvs_pos = (cvs_x, cvs_y)
-
         # composite the image into the destination array at the
         # calculated position
-        trcalc.overlay_image(dstarr, cache.cvs_pos, cache.cutout,
-                             dst_order=dst_order, src_order=image_order,
-                             alpha=self.alpha, flipy=False)
+        if clip is not None:
+            self._overlay_clip(viewer, dstarr, clip, cache.cvs_pos, cache.cutout,
+                               dst_order=dst_order, src_order=image_order)
+            return
+        self._overlay(viewer, dstarr, cache.cvs_pos, cache.cutout,
+                      dst_order=dst_order, src_order=image_order)
+
+    def _get_cutout(self, viewer, dstarr, clip=None, reduction=1):
+        """Cut out and scale the part of our image that is visible in the
+        viewer window, or in region `clip` of `dstarr` if it is given.
+
+        If `reduction` is greater than 1, a quick preview cutout is made
+        at that fraction of the scale, by nearest neighbor sampling from
+        the image pyramid.
+
+        Returns a tuple of the scaled cutout, the position in `dstarr` at
+        which it should be placed and the key of the cutout in the shared
+        render cache (None, if it is not used), or None if no part of the
+        image is visible.
+        """
+        time_start = time.time()
+        scale_x, scale_y = viewer.get_scale_xy()
+
+        # our offset from the pan position
+        pan_x, pan_y = viewer.get_pan()
+        pan_off = viewer.data_off
+        pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
+
+        ht, wd = dstarr.shape[:2]
+        if clip is None:
+            # get extent of our data coverage in the window
+            pts = np.asarray(viewer.get_pan_rect()).T
+        else:
+            # get extent of the data covered by the region, with an
+            # extra pixel all around to allow for roundoff
+            x1, y1, x2, y2 = clip
+            pts = np.asarray([(pan_x + (x1 - wd / 2.0) / scale_x - 1,
+                               pan_x + (x2 - wd / 2.0) / scale_x + 1),
+                              (pan_y + (y1 - ht / 2.0) / scale_y - 1,
+                               pan_y + (y2 - ht / 2.0) / scale_y + 1)])
+        xmin = int(np.min(pts[0]))
+        ymin = int(np.min(pts[1]))
+        xmax = int(np.ceil(np.max(pts[0])))
+        ymax = int(np.ceil(np.max(pts[1])))
+
+        # get destination location in data_coords
+        dst_x, dst_y = self.crdmap.to_data((self.x, self.y))
+
+        a1, b1, a2, b2 = 0, 0, self.image.width - 1, self.image.height - 1
+
+        # calculate the cutout that we can make and scale to merge
+        # onto the final image--by only cutting out what is necessary
+        # this speeds scaling greatly at zoomed in sizes
+        ((dst_x, dst_y), (a1, b1), (a2, b2)) = \
+            trcalc.calc_image_merge_clip((xmin, ymin), (xmax, ymax),
+                                         (dst_x, dst_y),
+                                         (a1, b1), (a2, b2))
+
+        viewer.render_times.add('pan_rect', time.time() - time_start)
+
+        # is image completely off the screen?
+        if (a2 - a1 <= 0) or (b2 - b1 <= 0):
+            return None
+
+        # cutout and scale the piece appropriately by the viewer scale
+        # and additionally by our scale
+        _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
+
+        use_pyramid = viewer.t_.get('use_image_pyramid', False)
+        method = self.interpolation
+        if reduction > 1:
+            _scale_x, _scale_y = _scale_x / reduction, _scale_y / reduction
+            use_pyramid, method = True, 'basic'
+        key = None
+        if (clip is None) and (reduction == 1):
+            key = self._get_shared_key(viewer, (
+                'cutout', self.image.get_data_key(), a1, b1, a2, b2,
+                _scale_x, _scale_y, method, use_pyramid))
+
+        def _cutout():
+            with viewer.render_times.time('cutout'):
+                return self.image.get_scaled_cutout2((a1, b1), (a2, b2),
+                                                     (_scale_x, _scale_y),
+                                                     method=method,
+                                                     use_pyramid=use_pyramid
+                                                     ).data
+
+        data = self._get_shared(key, _cutout)
+
+        # scale offset
+        off_x, off_y = dst_x - pan_x, dst_y - pan_y
+        off_x *= scale_x
+        off_y *= scale_y
+
+        # dst position in the pre-transformed array should be calculated
+        # from the center of the array plus offsets
+        cvs_x = int(np.floor(wd / 2.0 + off_x + 0.5))
+        cvs_y = int(np.floor(ht / 2.0 + off_y + 0.5))
+        return (data, (cvs_x, cvs_y), key)
+
+    def _get_shared_key(self, viewer, key):
+        # `key` if the viewer uses the shared render cache, else None
+        if not viewer.t_.get('use_shared_render_cache', False):
+            return None
+        return key
+
+    def _get_shared(self, key, func):
+        # get the array for `key` from the shared render cache, or
+        # compute it by calling `func` and add it to the cache
+        if key is None:
+            return func()
+        arr = shared_render_cache.get(key)
+        if arr is None:
+            arr = func()
+            shared_render_cache.put(key, arr)
+        return arr
+
+    def _overlay(self, viewer, dstarr, pos, srcarr, **kwargs):
+        # overlay `srcarr` at `pos` in `dstarr`, in parallel bands of
+        # rows if the viewer is configured for it
+        def _overlay_band(y1, y2):
+            trcalc.overlay_image(dstarr, (pos[0], pos[1] + y1),
+                                 srcarr[y1:y2], alpha=self.alpha,
+                                 flipy=False, **kwargs)
+
+        num_threads = viewer.t_.get('render_num_threads', 1)
+        with viewer.render_times.time('composite'):
+            parallel.run_in_bands(_overlay_band, srcarr.shape[0],
+                                  num_threads, logger=self.logger)
+
+    def _overlay_clip(self, viewer, dstarr, clip, pos, srcarr, **kwargs):
+        # overlay `srcarr` at `pos` in `dstarr`, but only within `clip`
+        x1, y1, x2, y2 = clip
+        with viewer.render_times.time('composite'):
+            trcalc.overlay_image(dstarr[y1:y2, x1:x2],
+                                 (pos[0] - x1, pos[1] - y1), srcarr,
+                                 alpha=self.alpha, flipy=False, **kwargs)
+
+    def _clear_render_cache(self, cache):
+        cache.cutout = None
+
+    def _set_composited(self, cache):
+        # our whole area has been composited into the viewer
+        cache.drawn = True
+        cache.extent = self._get_extent()
+
+    def _get_extent(self):
+        if self.image is None:
+            return None
+        return self.get_coords()
+
+    def get_dirty_rect(self, viewer, dstarr):
+        """Get the region (x1, y1, x2, y2) of `dstarr`, the viewer's
+        pre-transformed RGB array, that needs to be recomposited because
+        we have changed since we were last drawn there.
+
+        This covers both the area that we used to occupy and the area
+        that we occupy now; the caller is expected to recomposite it.
+        Returns None if neither area is visible.
+        """
+        cache = self.get_cache(viewer)
+        extents = [ext for ext in (cache.extent, self._get_extent())
+                   if ext is not None]
+        self._set_composited(cache)
+        if len(extents) == 0:
+            return None
+
+        pts = np.asarray(extents, dtype=np.float)
+        dx1, dy1 = np.min(pts[:, 0]), np.min(pts[:, 1])
+        dx2, dy2 = np.max(pts[:, 2]), np.max(pts[:, 3])
+
+        # convert data extent to pixels, with a little slop for roundoff
+        ht, wd = dstarr.shape[:2]
+        scale_x, scale_y = viewer.get_scale_xy()
+        pan_x, pan_y = viewer.get_pan()
+        pan_off = viewer.data_off
+        pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
+        x1 = max(0, int(np.floor(wd / 2.0 + (dx1 - pan_x) * scale_x)) - 2)
+        y1 = max(0, int(np.floor(ht / 2.0 + (dy1 - pan_y) * scale_y)) - 2)
+        x2 = min(wd, int(np.ceil(wd / 2.0 + (dx2 - pan_x) * scale_x)) + 2)
+        y2 = min(ht, int(np.ceil(ht / 2.0 + (dy2 - pan_y) * scale_y)) + 2)
+        if (x2 <= x1) or (y2 <= y1):
+            return None
+        return (x1, y1, x2, y2)
 
     def _reset_cache(self, cache):
         cache.setvals(cutout=None, drawn=False, cvs_pos=(0, 0))
@@ -226,6 +466,13 @@ class Image(OnePointMixin, CanvasObjectBase):
         for cache in self._cache.values():
             self._reset_cache(cache)
 
+    def is_grid_aligned(self, viewer):
+        """Whether this object is rendered in `viewer` on a grid fixed in
+        data coordinates, so that its rendered pixels are the same when
+        the view is panned, at any scale.
+        """
+        return False
+
     def get_image(self):
         return self.image
 
@@ -382,115 +629,456 @@ class NormImage(Image):
         self.rgbmap = rgbmap
         self.autocuts = autocuts
 
-    def draw_image(self, viewer, dstarr, whence=0.0):
+    def get_render_key(self):
+        key = super(NormImage, self).get_render_key()
+        rgbmap = self.rgbmap
+        if rgbmap is not None:
+            rgbmap = (id(rgbmap), rgbmap.get_version())
+        return key + (rgbmap, id(self.autocuts))
+
+    def draw_image(self, viewer, dstarr, whence=0.0, clip=None):
+        cache = self.get_cache(viewer)
+        if clip is None:
+            self._set_composited(cache)
+
         if self.image is None:
             return
 
-        cache = self.get_cache(viewer)
+        if (clip is None) and viewer.is_previewing():
+            self._draw_image_preview(viewer, dstarr, cache)
+            return
+
+        if self.is_grid_aligned(viewer):
+            self._draw_image_tiles(viewer, dstarr, cache, clip=clip)
+            return
+
+        if (clip is not None) and (whence <= 0.0):
+            res = self._get_cutout(viewer, dstarr, clip=clip)
+            if res is None:
+                return
+            cutout, cvs_pos, _key = res
+
+            # cached results are for the previous pan position
+            self._clear_render_cache(cache)
+
+            rgbarr, get_order = self._get_rgbarr(viewer, cutout)
+            self._overlay_clip(viewer, dstarr, clip, cvs_pos, rgbarr,
+                               dst_order=viewer.get_rgb_order(),
+                               src_order=get_order)
+            return
 
         if (whence <= 0.0) or (cache.cutout is None) or (not self.optimize):
-            # get extent of our data coverage in the window
-            pts = np.asarray(viewer.get_pan_rect()).T
-            xmin = int(np.min(pts[0]))
-            ymin = int(np.min(pts[1]))
-            xmax = int(np.ceil(np.max(pts[0])))
-            ymax = int(np.ceil(np.max(pts[1])))
-
-            # destination location in data_coords
-            dst_x, dst_y = self.crdmap.to_data((self.x, self.y))
-
-            a1, b1, a2, b2 = 0, 0, self.image.width - 1, self.image.height - 1
-
-            # calculate the cutout that we can make and scale to merge
-            # onto the final image--by only cutting out what is necessary
-            # this speeds scaling greatly at zoomed in sizes
-            ((dst_x, dst_y), (a1, b1), (a2, b2)) = \
-                trcalc.calc_image_merge_clip((xmin, ymin), (xmax, ymax),
-                                             (dst_x, dst_y),
-                                             (a1, b1), (a2, b2))
-
-            # is image completely off the screen?
-            if (a2 - a1 <= 0) or (b2 - b1 <= 0):
-                # no overlay needed
+            res = self._get_cutout(viewer, dstarr)
+            if res is None:
+                # image is completely off the screen--no overlay needed
                 return
+            cache.cutout, cache.cvs_pos, cache.cutout_key = res
 
-            # cutout and scale the piece appropriately by viewer scale
-            scale_x, scale_y = viewer.get_scale_xy()
-            # scale additionally by our scale
-            _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
-
-            res = self.image.get_scaled_cutout2((a1, b1), (a2, b2),
-                                                (_scale_x, _scale_y),
-                                                method=self.interpolation)
-            cache.cutout = res.data
-
-            # calculate our offset from the pan position
-            pan_x, pan_y = viewer.get_pan()
-            pan_off = viewer.data_off
-            pan_x, pan_y = pan_x + pan_off, pan_y + pan_off
-            off_x, off_y = dst_x - pan_x, dst_y - pan_y
-            # scale offset
-            off_x *= scale_x
-            off_y *= scale_y
-
-            # dst position in the pre-transformed array should be calculated
-            # from the center of the array plus offsets
-            ht, wd, dp = dstarr.shape
-            cvs_x = int(np.round(wd / 2.0 + off_x))
-            cvs_y = int(np.round(ht / 2.0 + off_y))
-            cache.cvs_pos = (cvs_x, cvs_y)
+        rgbmap = self.get_rgbmap(viewer)
+        dst_order = viewer.get_rgb_order()
+        image_order = self.image.get_order()
+        get_order = self._get_order(dst_order, image_order)
+        num_threads = viewer.t_.get('render_num_threads', 1)
+        times = viewer.render_times
+
+        # keys of the results in the shared render cache, if it is used
+        cuts_key = None
+        if cache.cutout_key is not None:
+            cuts_key = (cache.cutout_key, tuple(viewer.t_['cuts']),
+                        type(self.get_autocuts(viewer)))
+
+        with times.time('color_map'):
+            lut = self.get_fused_lut(viewer, cache.cutout)
+        if lut is not None:
+            # cut levels and color mapping done in one step
+            if (whence <= 2.5) or (cache.rgbarr is None) or (not self.optimize):
+                key = None
+                if cuts_key is not None:
+                    key = ('lut', cuts_key, rgbmap.get_signature(),
+                           dst_order, image_order, get_order)
+
+                def _map_lut():
+                    # reuse the previous output unless it is shared
+                    out = None
+                    if key is None:
+                        out = _get_buffer(cache.rgb_buf,
+                                          cache.cutout.shape + lut.shape[1:],
+                                          lut.dtype)
+                    with times.time('color_map'):
+                        return self.apply_fused_lut(lut, cache.cutout,
+                                                    num_threads=num_threads,
+                                                    out=out)
+
+                cache.rgbarr = self._get_shared(key, _map_lut)
+                cache.rgb_buf = cache.rgbarr if key is None else None
+                cache.prergb = cache.index_key = None
 
-        if self.rgbmap is not None:
-            rgbmap = self.rgbmap
         else:
-            rgbmap = viewer.get_rgbmap()
+            if (whence <= 1.0) or (cache.prergb is None) or (not self.optimize):
+                key = None
+                if cuts_key is not None:
+                    key = ('index', cuts_key, rgbmap.get_hash_size())
+
+                # apply visual changes prior to color mapping (cut levels, etc)
+                def _visuals():
+                    # reuse the previous index array unless it is shared
+                    out = None
+                    if key is None and cache.index_key is None:
+                        out = cache.prergb
+                    with times.time('cut_levels'):
+                        idx, cache.scratch = self.get_index_array(
+                            viewer, cache.cutout, out=out,
+                            scratch=cache.scratch, num_threads=num_threads)
+                    return idx
+
+                idx = self._get_shared(key, _visuals)
+                self.logger.debug("shape of index is %s" % (str(idx.shape)))
+                cache.prergb, cache.index_key = idx, key
+
+            if (whence <= 2.5) or (cache.rgbarr is None) or (not self.optimize):
+                key = None
+                if cache.index_key is not None:
+                    key = ('rgb', cache.index_key, rgbmap.get_signature(),
+                           dst_order, image_order, get_order)
+
+                # get RGB mapped array
+                def _map_rgb():
+                    # reuse the previous output unless it is shared
+                    out = None
+                    if key is None:
+                        shape = cache.prergb.shape
+                        if (image_order is not None) and (len(image_order) > 1):
+                            # indexes contain RGB axis
+                            shape = shape[:-1]
+                        out = _get_buffer(cache.rgb_buf,
+                                          shape + (len(dst_order),),
+                                          rgbmap.dtype)
+                    with times.time('color_map'):
+                        rgbobj = rgbmap.get_rgbarray(cache.prergb, out=out,
+                                                     order=dst_order,
+                                                     image_order=image_order,
+                                                     num_threads=num_threads)
+                        cache.rgb_buf = out
+                        return rgbobj.get_array(get_order)
+
+                cache.rgbarr = self._get_shared(key, _map_rgb)
+
+        # composite the image into the destination array at the
+        # calculated position
+        if clip is not None:
+            self._overlay_clip(viewer, dstarr, clip, cache.cvs_pos, cache.rgbarr,
+                               dst_order=dst_order, src_order=get_order)
+            return
+        self._overlay(viewer, dstarr, cache.cvs_pos, cache.rgbarr,
+                      dst_order=dst_order, src_order=get_order)
+
+    def get_index_array(self, viewer, data, out=None, scratch=None,
+                        num_threads=1):
+        """Apply the visual changes (cut levels, etc) to `data` and make
+        an array of indexes into the color map hash from the result.
+
+        The indexes are of the smallest unsigned type of at least 16 bits
+        that fits the hash, and the intermediate values are float32 for
+        float32 and narrower data.  `out` and `scratch` are optional arrays
+        from a previous call that are reused for the indexes and the
+        intermediate values, if they are of the right type and shape.
+
+        Returns a tuple of the index array and the scratch array.
+        """
+        rgbmap = self.get_rgbmap(viewer)
+        vmax = rgbmap.get_hash_size() - 1
+        out = _get_buffer(out, data.shape, trcalc.get_index_dtype(vmax))
+        scratch = _get_buffer(scratch, data.shape,
+                              trcalc.get_work_dtype(data.dtype))
+
+        def _index_band(y1, y2):
+            newdata = self.apply_visuals(viewer, data[y1:y2], 0, vmax,
+                                         out=scratch[y1:y2])
+            if newdata.dtype.kind == 'f':
+                # NaNs would be undefined as indexes; map them to the
+                # top of the range
+                np.fmin(newdata, vmax, out=newdata)
+            np.copyto(out[y1:y2], newdata, casting='unsafe')
+
+        if num_threads > 1:
+            parallel.run_in_bands(_index_band, data.shape[0], num_threads,
+                                  logger=self.logger)
+        else:
+            _index_band(0, data.shape[0])
+        return (out, scratch)
+
+    def _draw_image_preview(self, viewer, dstarr, cache):
+        """Render a quick, coarse preview of the image into `dstarr` while
+        the viewer is being interactively changed.
 
-        if (whence <= 1.0) or (cache.prergb is None) or (not self.optimize):
-            # apply visual changes prior to color mapping (cut levels, etc)
-            vmax = rgbmap.get_hash_size() - 1
-            newdata = self.apply_visuals(viewer, cache.cutout, 0, vmax)
+        The cutout is made at a fraction (`preview_reduction` setting) of
+        the scale, so that only a fraction of the pixels need to be color
+        mapped, and the result is enlarged by replicating pixels.
+        """
+        # cached results would not be at full quality
+        self._clear_render_cache(cache)
 
-            # result becomes an index array fed to the RGB mapper
-            if not np.issubdtype(newdata.dtype, np.dtype('uint')):
-                newdata = newdata.astype(np.uint)
-            idx = newdata
+        factor = max(int(viewer.t_.get('preview_reduction', 2)), 1)
+        res = self._get_cutout(viewer, dstarr, reduction=factor)
+        if res is None:
+            # image is completely off the screen--no overlay needed
+            return
+        cutout, cvs_pos, _key = res
+
+        rgbarr, get_order = self._get_rgbarr(viewer, cutout)
+        if factor > 1:
+            rgbarr = np.repeat(np.repeat(rgbarr, factor, axis=0),
+                               factor, axis=1)
+
+        self._overlay(viewer, dstarr, cvs_pos, rgbarr,
+                      dst_order=viewer.get_rgb_order(), src_order=get_order)
+
+    def _draw_image_tiles(self, viewer, dstarr, cache, clip=None):
+        """Render the image into `dstarr` from a cache of color mapped
+        tiles.
+
+        Tiles are laid out on a grid of output pixels anchored at the
+        image origin, so that when the image is panned at a constant
+        scale most of the tiles can be reused and only the newly exposed
+        ones need to be cut out and color mapped.  If `clip` is given,
+        only that region of `dstarr` is rendered.
+
+        The data is sampled as in a cutout of the whole image (see
+        `_get_cutout`), so the result is the same as without tiles
+        whenever the whole image is in view, or the scale is a whole
+        number.
+        """
+        image = self.image
+        ht, wd = dstarr.shape[:2]
+        if clip is None:
+            clip = (0, 0, wd, ht)
+        cx1, cy1, cx2, cy2 = clip
+        dstarr = dstarr[cy1:cy2, cx1:cx2]
+        img_wd, img_ht = image.width, image.height
+
+        # scale of data to output pixels
+        scale_x, scale_y = viewer.get_scale_xy()
+        _scale_x, _scale_y = scale_x * self.scale_x, scale_y * self.scale_y
+
+        # position of the image origin in the pre-transformed array
+        dst_x, dst_y = self.crdmap.to_data((self.x, self.y))
+        pan_x, pan_y = viewer.get_pan()
+        pan_off = viewer.data_off
+        org_x = int(np.floor(wd / 2.0 + (dst_x - (pan_x + pan_off)) * scale_x +
+                             0.5))
+        org_y = int(np.floor(ht / 2.0 + (dst_y - (pan_y + pan_off)) * scale_y +
+                             0.5))
+
+        level = 0
+        if viewer.t_.get('use_image_pyramid', False):
+            level = image.get_pyramid_level_for_scale(max(_scale_x, _scale_y))
+        pyramid = image.get_pyramid(level)
+        # the pyramid may not go as deep as was requested
+        level = min(level, len(pyramid) - 1)
+        data = pyramid[level]
+        factor = float(2 ** level)
+        max_x, max_y = data.shape[1] - 1, data.shape[0] - 1
+
+        # size of the whole image in the pyramid level and scaled, with
+        # the same rounding as trcalc.get_scaled_cutout_basic_view
+        old_wd = min(int((img_wd - 1) / factor), max_x) + 1
+        old_ht = min(int((img_ht - 1) / factor), max_y) + 1
+        n_x = max(int(round(_scale_x * factor * old_wd)), 1)
+        n_y = max(int(round(_scale_y * factor * old_ht)), 1)
+        iscale_x = float(old_wd) / float(n_x)
+        iscale_y = float(old_ht) / float(n_y)
+
+        # range of output pixels covered by the image that are visible
+        x1, x2 = max(0, cx1 - org_x), min(n_x, cx2 - org_x)
+        y1, y2 = max(0, cy1 - org_y), min(n_y, cy2 - org_y)
+        if (x2 <= x1) or (y2 <= y1):
+            # image is completely off the screen
+            return
 
-            self.logger.debug("shape of index is %s" % (str(idx.shape)))
-            cache.prergb = idx
+        rgbmap = self.get_rgbmap(viewer)
+        autocuts = self.get_autocuts(viewer)
+        loval, hival = viewer.t_['cuts']
 
+        dst_order = viewer.get_rgb_order()
+        image_order = image.get_order()
+        get_order = self._get_order(dst_order, image_order)
+
+        tile_size = max(int(viewer.t_.get('render_tile_size', 256)), 16)
+        max_bytes = viewer.t_.get('render_tile_cache_mb', 64) * 1024 * 1024
+        if cache.tiles is None:
+            cache.tiles = TileCache(max_bytes)
+        tiles = cache.tiles
+        tiles.max_bytes = max_bytes
+
+        # everything that affects the contents of a tile, except for
+        # the tile index
+        key_base = (image.get_data_key(), level, _scale_x, _scale_y,
+                    tile_size, loval, hival, id(autocuts), id(rgbmap),
+                    rgbmap.get_version(), get_order)
+
+        for ty in range(y1 // tile_size, (y2 - 1) // tile_size + 1):
+            i1 = ty * tile_size
+            i2 = min(i1 + tile_size, n_y)
+            for tx in range(x1 // tile_size, (x2 - 1) // tile_size + 1):
+                j1 = tx * tile_size
+                j2 = min(j1 + tile_size, n_x)
+
+                key = key_base + (tx, ty)
+                rgbarr = tiles.get(key)
+                if rgbarr is None:
+                    # cut out the data under this tile
+                    xi = (np.arange(j1, j2) * iscale_x).clip(0, max_x)
+                    yi = (np.arange(i1, i2) * iscale_y).clip(0, max_y)
+                    xi = xi.astype(np.int).reshape(1, -1)
+                    yi = yi.astype(np.int).reshape(-1, 1)
+                    with viewer.render_times.time('cutout'):
+                        cutout = data[yi, xi]
+
+                    # apply cut levels and color map it
+                    rgbarr, _order = self._get_rgbarr(viewer, cutout)
+                    tiles.put(key, rgbarr)
+
+                pos = (org_x + j1 - cx1, org_y + i1 - cy1)
+                with viewer.render_times.time('composite'):
+                    trcalc.overlay_image(dstarr, pos, rgbarr,
+                                         dst_order=dst_order,
+                                         src_order=get_order,
+                                         alpha=self.alpha, flipy=False)
+
+        self.logger.debug("%d tiles (%d bytes) in render cache" % (
+            len(tiles), tiles.nbytes))
+
+    def _get_rgbarr(self, viewer, data):
+        # cut levels and color map `data` without using the cache
         dst_order = viewer.get_rgb_order()
         image_order = self.image.get_order()
-        get_order = dst_order
-        if ('A' in dst_order) and not ('A' in image_order):
-            get_order = dst_order.replace('A', '')
-
-        if (whence <= 2.5) or (cache.rgbarr is None) or (not self.optimize):
-            # get RGB mapped array
-            rgbobj = rgbmap.get_rgbarray(cache.prergb, order=dst_order,
+        get_order = self._get_order(dst_order, image_order)
+        times = viewer.render_times
+
+        with times.time('color_map'):
+            lut = self.get_fused_lut(viewer, data)
+            if lut is not None:
+                return (self.apply_fused_lut(lut, data), get_order)
+
+        rgbmap = self.get_rgbmap(viewer)
+        with times.time('cut_levels'):
+            newdata, _scratch = self.get_index_array(viewer, data)
+        with times.time('color_map'):
+            rgbobj = rgbmap.get_rgbarray(newdata, order=dst_order,
                                          image_order=image_order)
-            cache.rgbarr = rgbobj.get_array(get_order)
+            return (rgbobj.get_array(get_order), get_order)
 
-        # composite the image into the destination array at the
-        # calculated position
-        trcalc.overlay_image(dstarr, cache.cvs_pos, cache.rgbarr,
-                             dst_order=dst_order, src_order=get_order,
-                             alpha=self.alpha, flipy=False)
+    def _clear_render_cache(self, cache):
+        cache.setvals(cutout=None, prergb=None, rgbarr=None,
+                      cutout_key=None, index_key=None)
+
+    def get_fused_lut(self, viewer, data):
+        """Get a lookup table that maps every possible value of `data`
+        directly to an output pixel, combining the cut levels, color
+        distribution, shift and color map steps.
+
+        Returns None if the viewer does not allow it, or `data` is not
+        a 2D array of 8 or 16 bit integers.  The table is cached in the
+        viewer's cache and only rebuilt when one of the steps changes.
+        """
+        if not (viewer.t_.get('use_fused_lut', True) and
+                data.ndim == 2 and data.dtype.kind in ('u', 'i') and
+                data.dtype.itemsize <= 2):
+            return None
+
+        rgbmap = self.get_rgbmap(viewer)
+        autocuts = self.get_autocuts(viewer)
+        dst_order = viewer.get_rgb_order()
+        image_order = self.image.get_order()
+        get_order = self._get_order(dst_order, image_order)
 
-    def apply_visuals(self, viewer, data, vmin, vmax):
+        key = (data.dtype.kind, data.dtype.itemsize, tuple(viewer.t_['cuts']),
+               id(autocuts), id(rgbmap), rgbmap.get_version(),
+               dst_order, image_order, get_order)
+        cache = self.get_cache(viewer)
+        if cache.lut_key == key:
+            return cache.lut
+
+        # the table is indexed by the unsigned bit pattern of the value
+        # (see apply_fused_lut)
+        nbits = 8 * data.dtype.itemsize
+        values = np.arange(2 ** nbits, dtype='u%d' % (data.dtype.itemsize))
+        if data.dtype.kind == 'i':
+            values = values.view('i%d' % (data.dtype.itemsize))
+
+        newdata, _scratch = self.get_index_array(viewer, values)
+        rgbobj = rgbmap.get_rgbarray(newdata, order=dst_order,
+                                     image_order=image_order)
+
+        cache.lut = np.ascontiguousarray(rgbobj.get_array(get_order))
+        cache.lut_key = key
+        self.logger.debug("rebuilt fused lookup table (%d entries)" % (
+            len(cache.lut)))
+        return cache.lut
+
+    def apply_fused_lut(self, lut, data, num_threads=1, out=None):
+        """Map `data` to an RGB array through `lut` (see get_fused_lut),
+        in parallel bands of rows if `num_threads` is more than one.
+        The result is written to `out`, if given.
+        """
+        if data.dtype.kind == 'i':
+            # view signed values by their unsigned bit pattern
+            data = data.view('%su%d' % (data.dtype.byteorder,
+                                        data.dtype.itemsize))
+        if (num_threads <= 1) and (out is None):
+            return lut.take(data, axis=0)
+
+        if out is None:
+            out = np.empty(data.shape + lut.shape[1:], dtype=lut.dtype)
+        if num_threads <= 1:
+            lut.take(data, axis=0, out=out, mode='clip')
+            return out
+
+        def _lut_band(y1, y2):
+            # NOTE: every value of data is a valid index into lut, and
+            # mode='clip' avoids buffering the output
+            lut.take(data[y1:y2], axis=0, out=out[y1:y2], mode='clip')
+
+        parallel.run_in_bands(_lut_band, data.shape[0], num_threads,
+                              logger=self.logger)
+        return out
+
+    def _get_order(self, dst_order, image_order):
+        # don't ask for an alpha channel from the mapped image if the
+        # source image doesn't have one
+        if ('A' in dst_order) and not ('A' in image_order):
+            return dst_order.replace('A', '')
+        return dst_order
+
+    def get_rgbmap(self, viewer):
+        if self.rgbmap is not None:
+            return self.rgbmap
+        return viewer.get_rgbmap()
+
+    def get_autocuts(self, viewer):
         if self.autocuts is not None:
-            autocuts = self.autocuts
-        else:
-            autocuts = viewer.autocuts
+            return self.autocuts
+        return viewer.autocuts
+
+    def apply_visuals(self, viewer, data, vmin, vmax, out=None):
+        autocuts = self.get_autocuts(viewer)
 
         # Apply cut levels
         loval, hival = viewer.t_['cuts']
         newdata = autocuts.cut_levels(data, loval, hival,
-                                      vmin=vmin, vmax=vmax)
+                                      vmin=vmin, vmax=vmax, out=out)
         return newdata
 
+    def is_grid_aligned(self, viewer):
+        # rendered in tiles (see _draw_image_tiles)
+        return (self.optimize and self.interpolation == 'basic' and
+                viewer.t_.get('use_render_tiles', False))
+
     def _reset_cache(self, cache):
         cache.setvals(cutout=None, prergb=None, rgbarr=None,
-                      drawn=False, cvs_pos=(0, 0))
+                      cutout_key=None, index_key=None,
+                      drawn=False, cvs_pos=(0, 0), tiles=None,
+                      lut=None, lut_key=None, scratch=None, rgb_buf=None)
         return cache
 
     def set_image(self, image):
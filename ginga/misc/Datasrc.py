@@ -4,9 +4,17 @@
 # This is open-source software licensed under a BSD license.
 # Please see the file LICENSE.txt for details.
 #
-# TODO: use (or subclass) python collections.deque instead?
-#
+import bisect
+import itertools
 import threading
+import weakref
+from collections import OrderedDict
+
+# ordering of the uses of entries, shared by all data sources so that the
+# least recently used entry can be found across several of them
+_use_count = itertools.count()
+# ordering of the pushes of entries
+_push_count = itertools.count()
 
 
 class TimeoutError(Exception):
@@ -17,16 +25,128 @@ class Empty(Exception):
     pass
 
 
+def get_nbytes(value):
+    """Get the number of bytes of the data held by `value`.
+
+    Images are measured by the ``nbytes`` of all of their data (from
+    ``get_mddata``, which for a data cube is more than the slice returned
+    by ``get_data``), arrays by their own ``nbytes``.  Anything else
+    counts as 0.
+    """
+    for name in ('get_mddata', 'get_data'):
+        if hasattr(value, name):
+            try:
+                data = getattr(value, name)()
+            except Exception:
+                continue
+            if data is not None:
+                return getattr(data, 'nbytes', 0)
+    return getattr(value, 'nbytes', 0)
+
+
+class MemoryBudget(object):
+    """A limit on the total bytes held by several data sources.
+
+    When the total is exceeded, the least recently used entries of all
+    the member sources are evicted first.  The most recently used entry
+    of each source is never evicted.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum number of bytes (0 = unlimited).
+
+    """
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.members = weakref.WeakSet()
+
+    def add_member(self, datasrc):
+        with self.lock:
+            self.members.add(datasrc)
+
+    def remove_member(self, datasrc):
+        with self.lock:
+            self.members.discard(datasrc)
+
+    def get_nbytes(self):
+        with self.lock:
+            return sum([datasrc.get_nbytes() for datasrc in self.members])
+
+    def get_max_bytes(self):
+        return self.max_bytes
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.enforce()
+
+    def enforce(self):
+        """Evict entries until the members are within the budget."""
+        # NOTE: sources must not hold their own lock when calling this
+        with self.lock:
+            if (self.max_bytes is None) or (self.max_bytes <= 0):
+                return
+            members = list(self.members)
+            while self.get_nbytes() > self.max_bytes:
+                res = [(datasrc.get_lru_entry(), datasrc)
+                       for datasrc in members]
+                res = [(entry[0], entry[1], datasrc)
+                       for entry, datasrc in res if entry is not None]
+                if len(res) == 0:
+                    # nothing left that can be evicted
+                    break
+                used, key, datasrc = min(res, key=lambda tup: tup[0])
+                try:
+                    datasrc.remove(key)
+                except KeyError:
+                    # removed in the meantime
+                    pass
+
+
 class Datasrc(object):
-    """Class to handle internal data cache."""
-    def __init__(self, length=0):
+    """Class to handle internal data cache.
+
+    Parameters
+    ----------
+    length : int
+        Maximum number of entries (0 = unlimited).
+
+    max_bytes : int
+        Maximum number of bytes held by the entries, as measured by
+        :func:`get_nbytes` (0 = unlimited).
+
+    budget : `MemoryBudget` or `None`
+        A budget shared with other data sources.
+
+    When a limit is exceeded, the least recently used entries (see
+    :meth:`touch`) are evicted first.  The most recently used entry is
+    never evicted because of the byte limits.
+
+    """
+    def __init__(self, length=0, max_bytes=0, budget=None):
         self.length = length
+        self.max_bytes = max_bytes
         self.cursor = -1
         self.datums = {}
-        self.history = []
+        # keys in the order they were pushed, mapped to their push counts
+        self.history = OrderedDict()
+        # push counts of the keys in ascending order, and the key of each,
+        # so that positions in the history are found by bisection
+        self.pushes = []
+        self.pushed_keys = {}
+        # keys in sorted order, kept up to date on every change
         self.sortedkeys = []
+        # keys in the order of their last use, mapped to their use counts
+        self.lru = OrderedDict()
+        # sizes of the entries in bytes
+        self.sizes = {}
+        self.nbytes = 0
         self.cond = threading.Condition()
         self.newdata = threading.Event()
+        self.budget = None
+        if budget is not None:
+            self.set_budget(budget)
 
     def __getitem__(self, key):
         with self.cond:
@@ -53,22 +173,72 @@ class Datasrc(object):
 
     def push(self, key, value):
         with self.cond:
-            if key in self.history:
-                self.history.remove(key)
-
-            self.history.append(key)
+            if key in self.datums:
+                self._unpush(key)
+            else:
+                bisect.insort(self.sortedkeys, key)
+            count = next(_push_count)
+            self.history[key] = count
+            self.pushes.append(count)
+            self.pushed_keys[count] = key
 
             self.datums[key] = value
+            self._use(key)
             self._eject_old()
 
             self.newdata.set()
             self.cond.notify()
 
+        self._enforce_budget()
+
+    def touch(self, key):
+        """Mark entry `key` as the most recently used one.  Its size is
+        measured again, in case its data has changed.
+        """
+        with self.cond:
+            if key not in self.datums:
+                return
+            self._use(key)
+            self._eject_old()
+
+        self._enforce_budget()
+
+    def _unpush(self, key):
+        # remove `key` from the history
+        count = self.history.pop(key)
+        idx = bisect.bisect_left(self.pushes, count)
+        del self.pushes[idx]
+        del self.pushed_keys[count]
+
+    def _use(self, key):
+        # (re)insert at the young end
+        self.lru.pop(key, None)
+        self.lru[key] = next(_use_count)
+
+        size = get_nbytes(self.datums[key])
+        self.nbytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+
+    def _enforce_budget(self):
+        budget = self.budget
+        if budget is not None:
+            budget.enforce()
+
+    def get_lru_entry(self):
+        """Get the use count and key of the least recently used entry,
+        or `None` if there are fewer than two entries.
+        """
+        with self.cond:
+            if len(self.lru) < 2:
+                return None
+            key = next(iter(self.lru))
+            return (self.lru[key], key)
+
     def pop_one(self):
         with self.cond:
             if len(self.history) == 0:
                 raise Empty("No items")
-            return self.remove(self.history[0])
+            return self.remove(next(iter(self.history)))
 
     def pop(self, *args):
         if len(args) == 0:
@@ -80,57 +250,62 @@ class Datasrc(object):
 
     def remove(self, key):
         with self.cond:
-            val = self.datums[key]
-            self.history.remove(key)
-            del self.datums[key]
+            return self._remove(key)
 
-            self.sortedkeys = list(self.datums.keys())
-            self.sortedkeys.sort()
-            return val
+    def _remove(self, key):
+        val = self.datums.pop(key)
+        self._unpush(key)
+        del self.lru[key]
+        self.nbytes -= self.sizes.pop(key)
+
+        idx = bisect.bisect_left(self.sortedkeys, key)
+        del self.sortedkeys[idx]
+        return val
 
     def _eject_old(self):
-        # Eject oldest cache unless there is no cache limit
+        # Eject least recently used unless there is no cache limit
         if (self.length is not None) and (self.length > 0):
-            while len(self.history) > self.length:
-                oldest = self.history.pop(0)
-                del self.datums[oldest]
+            while len(self.lru) > self.length:
+                self._remove(next(iter(self.lru)))
 
-        # Update sorted keys regardless
-        self.sortedkeys = list(self.datums.keys())
-        self.sortedkeys.sort()
+        if (self.max_bytes is not None) and (self.max_bytes > 0):
+            while self.nbytes > self.max_bytes and len(self.lru) > 1:
+                self._remove(next(iter(self.lru)))
 
     def index(self, key):
         with self.cond:
-            return self.history.index(key)
+            if key not in self.history:
+                raise ValueError("%r is not in history" % (key,))
+            return bisect.bisect_left(self.pushes, self.history[key])
 
     def index2key(self, index):
         with self.cond:
-            return self.history[index]
+            return self.pushed_keys[self.pushes[index]]
 
     def index2value(self, index):
         with self.cond:
-            return self.datums[self.history[index]]
+            return self.datums[self.index2key(index)]
 
     def youngest(self):
-        return self.datums[self.history[-1]]
+        return self.index2value(-1)
 
     def oldest(self):
-        return self.datums[self.history[0]]
+        return self.index2value(0)
 
     def pop_oldest(self):
-        return self.pop(self.history[0])
+        return self.pop(self.index2key(0))
 
     def pop_youngest(self):
-        return self.pop(self.history[-1])
+        return self.pop(self.index2key(-1))
 
     def keys(self, sort='alpha'):
         with self.cond:
             if sort == 'alpha':
-                return self.sortedkeys
+                return list(self.sortedkeys)
             elif sort == 'time':
-                return self.history
+                return list(self.history)
             else:
-                return self.datums.keys()
+                return list(self.datums.keys())
 
     def wait(self, timeout=None):
         with self.cond:
@@ -140,7 +315,7 @@ class Datasrc(object):
                 raise TimeoutError("Timed out waiting for datum")
 
             self.newdata.clear()
-            return self.history[-1]
+            return self.index2key(-1)
 
     def get_bufsize(self):
         with self.cond:
@@ -151,4 +326,29 @@ class Datasrc(object):
             self.length = length
             self._eject_old()
 
+    def get_nbytes(self):
+        """Get the total size of the entries in bytes."""
+        with self.cond:
+            return self.nbytes
+
+    def get_max_bytes(self):
+        with self.cond:
+            return self.max_bytes
+
+    def set_max_bytes(self, max_bytes):
+        with self.cond:
+            self.max_bytes = max_bytes
+            self._eject_old()
+
+    def set_budget(self, budget):
+        """Share `budget` (a `MemoryBudget`) with other data sources, or
+        stop sharing one if `budget` is `None`.
+        """
+        if self.budget is not None:
+            self.budget.remove_member(self)
+        self.budget = budget
+        if budget is not None:
+            budget.add_member(self)
+            budget.enforce()
+
 #END
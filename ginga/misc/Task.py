@@ -1060,15 +1060,14 @@ class ThreadPool(object):
             # Start all worker threads
             self.logger.debug("adding %d threads to thread pool" % (
                 numthreads))
+            self.numthreads += numthreads
             for i in range(numthreads):
                 t = self.workerClass(self.queue, logger=self.logger,
-                                     ev_quit=self.ev_quit, tpool=self.tpool,
+                                     ev_quit=self.ev_quit, tpool=self,
                                      **kwdargs)
                 self.workers.append(t)
                 t.start()
 
-            self.numthreads += numthreads
-
     def stopall(self, wait=False):
         """Stop all threads in the worker pool.  If _wait_ is True
         then don't return until all threads are down.
@@ -0,0 +1,115 @@
+"""Unit Tests for the Datasrc class."""
+
+import numpy as np
+import pytest
+
+from ginga.misc import Datasrc
+from ginga.AstroImage import AstroImage
+
+
+def _make_data(kb):
+    return np.zeros(kb * 1024, dtype=np.uint8)
+
+
+class TestDatasrc(object):
+
+    def test_length(self):
+        datasrc = Datasrc.Datasrc(3)
+        for key in 'abcd':
+            datasrc[key] = key
+        assert datasrc.keys() == ['b', 'c', 'd']
+
+        # the least recently used entry is evicted first
+        datasrc.touch('b')
+        datasrc['e'] = 'e'
+        assert datasrc.keys() == ['b', 'd', 'e']
+        assert datasrc.youngest() == 'e'
+
+    def test_order(self):
+        datasrc = Datasrc.Datasrc(0)
+        for key in 'dbeac':
+            datasrc[key] = key.upper()
+        datasrc['e'] = 'E2'
+        assert datasrc.keys(sort='alpha') == ['a', 'b', 'c', 'd', 'e']
+        assert datasrc.keys(sort='time') == ['d', 'b', 'a', 'c', 'e']
+        assert datasrc.index('a') == 2
+        assert datasrc.index2key(-2) == 'c'
+        assert datasrc.oldest() == 'D'
+        assert datasrc.youngest() == 'E2'
+
+        assert datasrc.pop_oldest() == 'D'
+        assert datasrc.pop() == 'B'
+        del datasrc['c']
+        assert datasrc.keys(sort='alpha') == ['a', 'e']
+        assert len(datasrc) == 2
+        assert datasrc.index('e') == 1
+        assert datasrc.index2key(0) == 'a'
+        with pytest.raises(ValueError):
+            datasrc.index('c')
+        with pytest.raises(IndexError):
+            datasrc.index2key(2)
+
+    def test_max_bytes(self):
+        datasrc = Datasrc.Datasrc(0, max_bytes=100 * 1024)
+        datasrc['a'] = _make_data(40)
+        datasrc['b'] = _make_data(40)
+        assert datasrc.get_nbytes() == 80 * 1024
+
+        datasrc.touch('a')
+        datasrc['c'] = _make_data(40)
+        assert datasrc.keys() == ['a', 'c']
+        assert datasrc.get_nbytes() == 80 * 1024
+
+        # replacing an entry accounts for its new size
+        datasrc['c'] = _make_data(10)
+        assert datasrc.get_nbytes() == 50 * 1024
+
+        # the most recently used entry is kept, even if too large
+        datasrc['d'] = _make_data(200)
+        assert datasrc.keys() == ['d']
+
+        datasrc.set_max_bytes(0)
+        datasrc['e'] = _make_data(200)
+        assert datasrc.keys() == ['d', 'e']
+        datasrc.remove('d')
+        assert datasrc.get_nbytes() == 200 * 1024
+
+    def test_budget(self):
+        budget = Datasrc.MemoryBudget(100 * 1024)
+        src1 = Datasrc.Datasrc(0, budget=budget)
+        src2 = Datasrc.Datasrc(0, budget=budget)
+
+        src1['a'] = _make_data(30)
+        src2['b'] = _make_data(30)
+        src1['c'] = _make_data(30)
+        src2.touch('b')
+        src1.touch('a')
+        assert budget.get_nbytes() == 90 * 1024
+
+        # least recently used entry across both sources is evicted
+        src2['d'] = _make_data(30)
+        assert src1.keys() == ['a']
+        assert src2.keys() == ['b', 'd']
+
+        # but not the most recently used entry of a source
+        budget.set_max_bytes(10 * 1024)
+        assert src1.keys() == ['a']
+        assert src2.keys() == ['d']
+
+        src2.set_budget(None)
+        budget.set_max_bytes(1)
+        src2['e'] = _make_data(30)
+        assert budget.get_nbytes() == 30 * 1024
+        assert src2.get_nbytes() == 60 * 1024
+
+    def test_cube_nbytes(self):
+        # a data cube counts with all of its slices, not just the one shown
+        image = AstroImage()
+        image.load_data(np.zeros((10, 64, 64), dtype=np.float32))
+        image.set_naxispath([3])
+        assert Datasrc.get_nbytes(image) == 10 * 64 * 64 * 4
+
+        datasrc = Datasrc.Datasrc(0, max_bytes=180 * 1024)
+        datasrc['a'] = image
+        datasrc['b'] = _make_data(40)
+        assert datasrc.keys() == ['b']
@@ -53,7 +53,9 @@ class Channel(Callback.Callbacks):
         self.viewer_dict = {}
         if datasrc is None:
             num_images = self.settings.get('numImages', 1)
-            datasrc = Datasrc.Datasrc(num_images)
+            max_mb = self.settings.get('image_cache_mb', 0)
+            datasrc = Datasrc.Datasrc(num_images,
+                                      max_bytes=int(max_mb * 1024 ** 2))
         self.datasrc = datasrc
         self.cursor = -1
         self.history = []
@@ -64,6 +66,9 @@ class Channel(Callback.Callbacks):
         self._configure_sort()
         self.settings.get_setting('sort_order').add_callback(
             'set', self._sort_changed_ext_cb)
+        if 'image_cache_mb' in self.settings:
+            self.settings.get_setting('image_cache_mb').add_callback(
+                'set', self._cache_size_changed_ext_cb)
 
     def connect_viewer(self, viewer):
         if viewer not in self.viewers:
@@ -366,6 +371,9 @@ class Channel(Callback.Callbacks):
 
     def switch_image(self, image):
 
+        # keep the viewed image from being evicted from the cache
+        self.datasrc.touch(image.get('name'))
+
         curimage = self.get_current_image()
         if curimage != image:
             self.logger.debug("updating viewer...")
@@ -471,6 +479,11 @@ class Channel(Callback.Callbacks):
 
         self.history.sort(key=self.hist_sort)
 
+    def _cache_size_changed_ext_cb(self, setting, value):
+        # images evicted from the cache are reloaded from their image
+        # futures when they are switched to again
+        self.datasrc.set_max_bytes(int(value * 1024 ** 2))
+
     def __len__(self):
         return len(self.history)
 
@@ -22,7 +22,7 @@ from collections import deque
 from ginga import cmap, imap
 from ginga import AstroImage, RGBImage, BaseImage
 from ginga.table import AstroTable
-from ginga.misc import Bunch, Timer, Future
+from ginga.misc import Bunch, Timer, Future, Datasrc
 from ginga.util import catalog, iohelper, io_fits, toolbox
 from ginga.canvas.CanvasObject import drawCatalog
 from ginga.canvas.types.layer import DrawingCanvas
@@ -135,6 +135,8 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
                                    scrollbars='off',
                                    share_readout=True,
                                    numImages=10,
+                                   image_cache_mb=0,
+                                   total_image_cache_mb=0,
                                    # Offset to add to numpy-based coords
                                    pixel_coords_offset=1.0,
                                    # inherit from primary header
@@ -143,6 +145,13 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
                                    save_layout=False,
                                    channel_prefix="Image")
         self.settings.load(onError='silent')
+
+        # limit on the memory used by the images of all channels
+        max_mb = self.settings.get('total_image_cache_mb', 0)
+        self.image_budget = Datasrc.MemoryBudget(int(max_mb * 1024 ** 2))
+        self.settings.get_setting('total_image_cache_mb').add_callback(
+            'set', self._image_budget_changed_cb)
+
         # Load bindings preferences
         bindprefs = self.prefs.create_category('bindings')
         bindprefs.load(onError='silent')
@@ -1206,6 +1215,8 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
                 num_images = settings.get('numImages',
                                           self.settings.get('numImages', 1))
             settings.set_defaults(switchnew=True, numImages=num_images,
+                                  image_cache_mb=self.settings.get(
+                                      'image_cache_mb', 0),
                                   raisenew=True, genthumb=True,
                                   focus_indicator=False,
                                   preload_images=False, sort_order='loadtime')
@@ -1213,6 +1224,7 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
             self.logger.debug("Adding channel '%s'" % (chname))
             channel = Channel(chname, self, datasrc=None,
                               settings=settings)
+            channel.datasrc.set_budget(self.image_budget)
 
             bnch = self.add_viewer(chname, settings,
                                    workspace=workspace)
@@ -1277,6 +1289,7 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
             self.ds.remove_tab(chname)
             del self.channel[name]
             self.prefs.remove_settings('channel_' + chname)
+            channel.datasrc.set_budget(None)
 
             # pick new channel
             num_channels = len(self.channel_names)
@@ -1293,6 +1306,9 @@ class GingaShell(GwMain.GwMain, Widgets.Application):
         with self.lock:
             return self.channel_names
 
+    def _image_budget_changed_cb(self, setting, value):
+        self.image_budget.set_max_bytes(int(value * 1024 ** 2))
+
     def scale2text(self, scalefactor):
         if scalefactor >= 1.0:
             #text = '%dx' % (int(scalefactor))
@@ -130,7 +130,8 @@ class Cursor(GingaPlugin.GlobalPlugin):
         # Set size of coordinate areas (4 is "." + precision 3)
         readout.maxx = len(str(width)) + 4
         readout.maxy = len(str(height)) + 4
-        minval, maxval = image.get_minmax()
+        # an estimate is enough to size the value area
+        minval, maxval = image.get_minmax(estimate=True)
         readout.maxv = max(len(str(minval)), len(str(maxval)))
         return True
 
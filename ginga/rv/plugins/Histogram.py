@@ -16,7 +16,9 @@ calculate the histogram.  To take the histogram of the full image, click
 the button in the UI labeled "Full Image".
 
 .. note:: Depending on the size of the image, calculating the
-          full histogram may take time.
+          full histogram may take time.  If the "sample_full_image"
+          setting is True, the histogram of the full image is
+          estimated from a sample of the data instead.
 
 If a new image is selected for the channel, the histogram plot will be
 recalculated based on the current parameters with the new data.
@@ -79,7 +81,8 @@ class Histogram(GingaPlugin.LocalPlugin):
         prefs = self.fv.get_preferences()
         self.settings = prefs.create_category('plugin_Histogram')
         self.settings.add_defaults(draw_then_move=True, num_bins=2048,
-                                   hist_color='aquamarine')
+                                   hist_color='aquamarine',
+                                   sample_full_image=False)
         self.settings.load(onError='silent')
 
         # Set up histogram control parameters
@@ -288,6 +291,20 @@ class Histogram(GingaPlugin.LocalPlugin):
         self.draw_cb(canvas, tag)
 
     def histogram(self, image, x1, y1, x2, y2, z=None, pct=1.0, numbins=2048):
+        wd, ht = image.get_size()
+        if (z is None and self.settings.get('sample_full_image', False) and
+                x1 <= 0 and y1 <= 0 and x2 >= wd - 1 and y2 >= ht - 1):
+            # estimate the histogram of the full image from a sample
+            sample = image.get_data_sample()
+            res = self.autocuts.calc_histogram(sample.data, pct=pct,
+                                               numbins=numbins)
+            # scale the counts to the full image
+            res.dist = res.dist * (float(image.get_data().size) /
+                                   sample.data.size)
+            self.logger.info("histogram estimated from a sample "
+                             "(error %.2f%%)" % (sample.error * 100))
+            return res
+
         if z is not None:
             data = image.get_data()
             data = data[y1:y2, x1:x2, z]
@@ -35,6 +35,10 @@ select an HDU to open in the channel.
 Use the controls in the lower part of the UI to select the axis and
 to step through the planes in that axis.
 
+While playing through the planes, the next few are read (and rendered,
+if the view does not change) ahead of time on worker threads.  The
+achieved and requested frame rates are shown next to the interval.
+
 **User Configuration**
 
 """
@@ -48,6 +52,7 @@ from ginga.gw import Widgets
 from ginga.misc import Future
 from ginga import GingaPlugin
 from ginga.util.iohelper import get_hdu_suffix
+from ginga.util import prefetch
 from ginga.util.videosink import VideoSink
 
 import numpy as np
@@ -82,13 +87,18 @@ class MultiDim(GingaPlugin.LocalPlugin):
         self.play_min_sec = 1.0 / 30
         self.play_last_time = 0.0
         self.play_fps = 0
+        self.play_prefetcher = None
         self.timer = fv.get_timer()
         self.timer.set_callback('expired', self._play_next_cb)
 
         # Load plugin preferences
         prefs = self.fv.get_preferences()
         self.settings = prefs.create_category('plugin_MultiDim')
-        self.settings.set_defaults(auto_start_naxis=False)
+        self.settings.set_defaults(auto_start_naxis=False,
+                                   play_prefetch=4,
+                                   play_prefetch_threads=2,
+                                   play_prerender=True,
+                                   play_drop_frames=False)
         self.settings.load(onError='silent')
 
         self.gui_up = False
@@ -436,9 +446,10 @@ class MultiDim(GingaPlugin.LocalPlugin):
             self.logger.error(errmsg)
             self.fv.show_error(errmsg, raisetab=True)
 
-    def set_naxis(self, idx, n):
+    def set_naxis(self, idx, n, redraw=True):
         """Change the slice shown in the channel viewer.
         `idx` is the slice index (0-based); `n` is the axis (0-based)
+        If `redraw` is False the viewer is not redrawn.
         """
         self.play_idx = idx
         self.logger.debug("naxis %d index is %d" % (n + 1, idx + 1))
@@ -469,8 +480,9 @@ class MultiDim(GingaPlugin.LocalPlugin):
                     self.w[slidername].set_value(text)
             self.w.slice.set_text(str(text))
 
-            # schedule a redraw
-            self.fitsimage.redraw(whence=0)
+            if redraw:
+                # schedule a redraw
+                self.fitsimage.redraw(whence=0)
 
         except Exception as e:
             errmsg = "Error loading NAXIS%d slice %d: %s" % (
@@ -486,8 +498,39 @@ class MultiDim(GingaPlugin.LocalPlugin):
         self._isplaying = True
         image.block_callback('modified')
         self.play_last_time = time.time()
+        self.start_prefetch()
         self.play_next(self.timer)
 
+    def start_prefetch(self):
+        """Start reading (and rendering, if possible) the slices that are
+        about to be played on worker threads.
+        """
+        self.stop_prefetch()
+        num_ahead = self.settings.get('play_prefetch', 4)
+        image = self.fitsimage.get_image()
+        if (num_ahead <= 0 or image is None or
+                image is not self.play_image):
+            return
+
+        render_func = None
+        if (self.settings.get('play_prerender', True) and
+                prefetch.shows_only_image(self.fitsimage)):
+            # NOTE: the cut levels are not recalculated during playback,
+            # so the slices can be rendered as they will be shown, as long
+            # as the view does not change
+            render_func = prefetch.SliceRenderer(self.fitsimage, image)
+
+        self.play_prefetcher = prefetch.SlicePrefetcher(
+            image, self.play_axis - 2, self.logger, num_ahead=num_ahead,
+            num_threads=self.settings.get('play_prefetch_threads', 2),
+            render_func=render_func)
+        self.play_prefetcher.start()
+
+    def stop_prefetch(self):
+        if self.play_prefetcher is not None:
+            self.play_prefetcher.stop()
+            self.play_prefetcher = None
+
     def _play_next_cb(self, timer):
         # this is the playback timer callback
         # timer is run in a non-gui thread
@@ -506,21 +549,84 @@ class MultiDim(GingaPlugin.LocalPlugin):
         time_start = time.time()
         deadline = time_start + self.play_int_sec
 
+        # if we have fallen behind, skip the slices that are overdue
+        num_dropped = 0
+        if self.settings.get('play_drop_frames', False):
+            num_late = int((time_start - self.play_last_time) /
+                           self.play_int_sec)
+            num_dropped = max(0, num_late - 1)
+
         # calculate fps
         fps = 1.0 / (time_start - self.play_last_time)
         self.play_last_time = time_start
-        if int(fps) != int(self.play_fps):
-            self.play_fps = fps
-            self.w.fps.set_text(str("%.2f fps" % fps))
 
-        self.next_slice()
+        if np.isscalar(self.play_idx):
+            play_idx = self.play_idx
+        else:
+            play_idx = self.play_idx[self.play_axis - 2]
+        play_idx = (play_idx + 1 + num_dropped) % (self.play_max + 1)
+
+        prefetcher = self.play_prefetcher
+        if prefetcher is not None:
+            naxispath = list(self.naxispath)
+            naxispath[self.play_axis - 2] = play_idx
+            if (prefetcher.image is not image or
+                    prefetcher.axis != self.play_axis - 2 or
+                    prefetcher.get_naxispath(play_idx) != naxispath):
+                # playing another image, axis or slice now
+                self.start_prefetch()
+                prefetcher = self.play_prefetcher
+
+        if prefetcher is None:
+            self.set_naxis(play_idx, self.play_axis)
+        else:
+            bnch = prefetcher.get(play_idx)
+            renderer = prefetcher.render_func
+            if renderer is None:
+                self.set_naxis(play_idx, self.play_axis)
+
+            elif renderer.signature != prefetch.get_view_signature(
+                    self.fitsimage):
+                # view has changed--render ahead with the new one
+                self.set_naxis(play_idx, self.play_axis)
+                self.start_prefetch()
+                prefetcher = self.play_prefetcher
+
+            elif (bnch is not None and bnch.rgbobj is not None and
+                    prefetch.shows_only_image(self.fitsimage)):
+                # show the slice rendered ahead of time, which would hide
+                # any other objects on the canvas
+                self.set_naxis(play_idx, self.play_axis, redraw=False)
+                self.fitsimage.show_rgb_object(bnch.rgbobj)
+
+            else:
+                self.set_naxis(play_idx, self.play_axis)
+
+            prefetcher.frame_shown(dropped=num_dropped)
+            fps = prefetcher.get_stats()['fps'] or fps
+
+        if int(fps) != int(self.play_fps) or num_dropped > 0:
+            self.play_fps = fps
+            self._show_fps()
 
         # set timer for next turnaround
         delta = deadline - time.time()
         timer.set(max(delta, 0.001))
 
+    def _show_fps(self):
+        text = "%.2f/%.2f fps" % (self.play_fps, 1.0 / self.play_int_sec)
+        if self.play_prefetcher is not None:
+            num_dropped = self.play_prefetcher.get_stats()['dropped']
+            if num_dropped > 0:
+                text += " (%d dropped)" % (num_dropped)
+        self.w.fps.set_text(text)
+
     def play_stop(self):
         self._isplaying = False
+        if self.play_prefetcher is not None:
+            self.stop_prefetch()
+            # replace any slice rendered ahead with a regular rendering
+            self.fitsimage.redraw(whence=0)
         if self.play_image is not None:
             self.play_image.unblock_callback('modified')
             self.play_image = None
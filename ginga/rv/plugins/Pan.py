@@ -64,7 +64,8 @@ class Pan(GingaPlugin.GlobalPlugin):
                                    pan_position_color='yellow',
                                    pan_rectangle_color='red',
                                    compass_color='skyblue',
-                                   rotate_pan_image=True)
+                                   rotate_pan_image=True,
+                                   use_image_pyramid=True)
         self.settings.load(onError='silent')
         # share canvas with channel viewer?
         self.use_shared_canvas = self.settings.get('use_shared_canvas', False)
@@ -87,6 +88,9 @@ class Pan(GingaPlugin.GlobalPlugin):
         pi.define_cursor('pick', hand)
         pi.set_bg(0.4, 0.4, 0.4)
         pi.set_desired_size(self._wd, self._ht)
+        # pan image is always zoomed to fit, so render from the pyramid
+        pi.get_settings().set(
+            use_image_pyramid=self.settings.get('use_image_pyramid', True))
         pi.set_callback('cursor-down', self.btndown)
         pi.set_callback('cursor-move', self.drag_cb)
         pi.set_callback('none-move', self.motion_cb)
@@ -111,6 +111,11 @@ Change intensity map::
 
         $ ggrc channel FOO set_intensity_map neg
 
+Get statistics of the time spent in each stage of rendering over the
+recent redraws (see ``ImageView.get_render_stats()``)::
+
+        $ ggrc channel FOO get_render_stats
+
 In some cases, you may need to resort to shell escapes to be able to
 pass certain characters to Ginga.  For example, a leading dash character is
 usually interpreted as a program option.  In order to pass a signed
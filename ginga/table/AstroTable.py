@@ -113,7 +113,7 @@ class AstroTable(ViewerObjectBase):
         # unreference data
         self._data = None
 
-    def get_minmax(self, noinf=False):
+    def get_minmax(self, noinf=False, estimate=False):
         # TODO: what should this mean for a table?
         return (0, 0)
 
@@ -0,0 +1,122 @@
+"""Unit Tests for the AstroImage.py functions"""
+
+import logging
+import threading
+
+import numpy as np
+
+from ginga import AutoCuts
+from ginga.AstroImage import AstroImage
+
+
+class TestAstroImage(object):
+
+    def setup_class(self):
+        self.logger = logging.getLogger("TestAstroImage")
+
+    def test_slice_stats(self):
+        cube = np.random.rand(4, 3, 20, 30)
+        cube[1, 2, 5, 5] = np.nan
+        image = AstroImage(logger=self.logger)
+        image.load_data(cube)
+        autocuts = AutoCuts.Histogram(self.logger)
+
+        image.set_naxispath([2, 1])
+        assert image.get_minmax() == (np.nanmin(cube[1, 2]),
+                                      np.nanmax(cube[1, 2]))
+        levels = image.calc_cut_levels(autocuts)
+        stats = image.get_slice_stats()
+        assert stats['minmax']['num_nan'] == 1
+        assert stats['cuts'][autocuts.get_params_key()] == levels
+
+        # going back to a slice uses its cached statistics
+        image.set_naxispath([0, 0])
+        image.set_naxispath([2, 1])
+        assert image._minmax is not None
+        assert image.calc_cut_levels(autocuts) == levels
+
+        # different parameters are cached separately
+        autocuts.update_params(pct=0.9)
+        assert autocuts.get_params_key() not in stats['cuts']
+
+        # data that is not a slice has no cached statistics
+        image.set_data(np.zeros((5, 5)))
+        assert image.get_slice_stats() is None
+
+    def test_precompute_slice_stats(self):
+        cube = np.random.rand(5, 20, 30)
+        image = AstroImage(logger=self.logger)
+        image.load_data(cube)
+        autocuts = AutoCuts.Minmax(self.logger)
+
+        progress = []
+        num = image.precompute_slice_stats(
+            autocuts=autocuts,
+            callback=lambda img, n, total: progress.append((n, total)))
+        assert num == 5
+        assert progress[-1] == (5, 5)
+        key = autocuts.get_params_key()
+        for i in range(5):
+            stats = image.get_slice_stats([i])
+            assert stats['minmax']['maxval'] == np.max(cube[i])
+            assert stats['cuts'][key] == (np.min(cube[i]), np.max(cube[i]))
+
+        image.set_naxispath([3])
+        assert image._minmax is not None
+
+        # stopped before the first slice
+        image.load_data(cube)
+        ev_quit = threading.Event()
+        ev_quit.set()
+        assert image.precompute_slice_stats(ev_quit=ev_quit) == 0
+
+    def test_slice_stats_replaced(self):
+        cube = np.random.rand(5, 20, 30)
+        image = AstroImage(logger=self.logger)
+        image.load_data(cube)
+
+        # data replaced by a smaller cube while the statistics of the
+        # old one are being calculated
+        cube2 = np.random.rand(2, 20, 30) + 10.0
+
+        def replace(img, n, total):
+            if n == 1:
+                img.load_data(cube2)
+
+        num = image.precompute_slice_stats(callback=replace)
+        assert num == 1
+        for i in range(2):
+            assert 'minmax' not in image.get_slice_stats([i])
+
+        stats = image.calc_slice_stats([1])
+        assert stats['minmax']['maxval'] == np.max(cube2[1])
+
+    def test_mosaic_minmax(self):
+        def make_image(data, crpix):
+            header = dict(NAXIS=2, NAXIS1=data.shape[1],
+                          NAXIS2=data.shape[0], CTYPE1='RA---TAN',
+                          CTYPE2='DEC--TAN', CRVAL1=10.0, CRVAL2=20.0,
+                          CRPIX1=crpix[0], CRPIX2=crpix[1],
+                          CDELT1=-0.001, CDELT2=0.001, EQUINOX=2000.0)
+            image = AstroImage(logger=self.logger)
+            image.load_data(data)
+            image.update_keywords(header)
+            return image
+
+        mosaic = make_image(np.zeros((100, 100)), (50.0, 50.0))
+        tile = np.random.rand(10, 10) + 2.0
+        tile[0, 0] = np.nan
+        mosaic.mosaic_inline([make_image(tile, (25.0, 25.0))])
+        assert mosaic.get_minmax() == (0.0, np.nanmax(tile))
+        assert mosaic.get_minmax_stats()['num_nan'] == 1
+
+        # a piece with only NaNs does not change the min/max
+        tile = np.full((10, 10), np.nan)
+        mosaic.mosaic_inline([make_image(tile, (75.0, 75.0))])
+        stats = mosaic.get_minmax_stats()
+        assert mosaic.get_minmax() == (0.0, stats['maxval'])
+        assert stats['maxval'] > 2.0
+        assert stats['num_nan'] == 101
+        stats.pop('estimated')
+        mosaic._set_minmax()
+        assert mosaic._minmax == stats
@@ -0,0 +1,126 @@
+"""Unit Tests for the BaseImage.py functions"""
+
+import logging
+
+import numpy as np
+
+from ginga.BaseImage import BaseImage
+
+
+class TestBaseImage(object):
+
+    def setup_class(self):
+        self.logger = logging.getLogger("TestBaseImage")
+
+    def test_pyramid_levels(self):
+        data = np.arange(64, dtype=np.float32).reshape((8, 8))
+        image = BaseImage(data_np=data, logger=self.logger)
+
+        assert image.get_pyramid_level(0) is data
+
+        level1 = image.get_pyramid_level(1)
+        assert level1.shape == (4, 4)
+        assert level1.dtype == data.dtype
+        assert level1[0, 0] == np.mean(data[0:2, 0:2])
+
+        # asking for a level deeper than possible returns the deepest
+        deepest = image.get_pyramid_level(10)
+        assert deepest.shape == (1, 1)
+        assert np.isclose(deepest[0, 0], np.mean(data))
+
+    def test_pyramid_level_for_scale(self):
+        image = BaseImage(logger=self.logger)
+        assert image.get_pyramid_level_for_scale(1.0) == 0
+        assert image.get_pyramid_level_for_scale(0.6) == 0
+        assert image.get_pyramid_level_for_scale(0.5) == 1
+        assert image.get_pyramid_level_for_scale(0.3) == 1
+        assert image.get_pyramid_level_for_scale(0.25) == 2
+
+    def test_pyramid_invalidated_on_modify(self):
+        data = np.ones((16, 16), dtype=np.uint16)
+        image = BaseImage(data_np=data, logger=self.logger)
+        assert image.get_pyramid_level(1)[0, 0] == 1
+
+        image.set_data(data * 3)
+        assert image.get_pyramid_level(1)[0, 0] == 3
+
+    def test_pyramid_snapshot(self):
+        data = np.ones((16, 16), dtype=np.float32)
+        image = BaseImage(data_np=data, logger=self.logger)
+        pyramid = image.get_pyramid(1)
+        assert len(pyramid) == 2
+
+        # a pyramid that was returned is not changed by later calls, or
+        # by the data being replaced
+        deeper = image.get_pyramid(3)
+        assert len(pyramid) == 2
+        assert len(deeper) == 4
+        assert deeper[1] is pyramid[1]
+        image.set_data(data * 3)
+        assert len(deeper) == 4 and deeper[3][0, 0] == 1
+        assert image.get_pyramid(3)[3][0, 0] == 3
+
+    def test_pyramid_cutout(self):
+        data = np.arange(1024 * 1024, dtype=np.float64).reshape((1024, 1024))
+        image = BaseImage(data_np=data, logger=self.logger)
+
+        res = image.get_scaled_cutout2((0, 0), (1023, 1023), (0.25, 0.25),
+                                       use_pyramid=True)
+        assert res.data.shape == (256, 256)
+        assert np.isclose(res.scale_x, 0.25)
+        # each output pixel is the average of a 4x4 block
+        assert res.data[0, 0] == np.mean(data[0:4, 0:4])
+
+        # no pyramid is used for scales of 1/2 or more
+        res = image.get_scaled_cutout2((0, 0), (1023, 1023), (0.75, 0.75),
+                                       use_pyramid=True)
+        assert res.data[0, 0] == data[0, 0]
+
+    def test_interpolated_cutout(self):
+        data = np.arange(100 * 100, dtype=np.float64).reshape((100, 100))
+        image = BaseImage(data_np=data, logger=self.logger)
+
+        for method in ('linear', 'bicubic', 'lanczos', 'area'):
+            res = image.get_scaled_cutout2((10, 10), (49, 49), (1.5, 1.5),
+                                           method=method)
+            assert res.data.shape == (60, 60)
+            assert np.isclose(res.scale_x, 1.5)
+
+    def test_minmax(self):
+        data = np.arange(10000, dtype=np.float32).reshape((100, 100))
+        data[0, 0] = np.nan
+        data[5, 5] = -np.inf
+        data[99, 98] = np.inf
+        image = BaseImage(data_np=data, logger=self.logger)
+        # nothing is calculated until it is needed
+        assert image._minmax is None
+
+        # an estimate comes from a sample of the data
+        stats = image.get_minmax_stats(estimate=True)
+        assert stats['estimated']
+        assert image._minmax is None
+
+        assert image.get_minmax() == (-np.inf, np.inf)
+        assert image.get_minmax(noinf=True) == (1, 9999)
+        stats = image.get_minmax_stats(estimate=True)
+        assert stats['num_nan'] == 1
+        assert not stats['estimated']
+
+        image.set_data(np.full((10, 10), np.nan))
+        assert image.get_minmax() == (0, 0)
+        assert image.get_minmax_stats()['num_nan'] == 100
+
+    def test_data_sample(self):
+        data = np.random.rand(1000, 1000)
+        image = BaseImage(data_np=data, logger=self.logger)
+        for method in ('random', 'tile', 'stride'):
+            image.set_fast_data_params(method=method, num_samples=10000)
+            sample = image.get_data_sample()
+            assert 5000 <= sample.data.size <= 20000
+            assert 0 < sample.error < 0.05
+            assert image._get_fast_data() is sample.data
+
+        image.set_fast_data_params(num_samples=10 ** 7)
+        sample = image.get_data_sample()
+        assert sample.data is data
+        assert sample.error == 0.0
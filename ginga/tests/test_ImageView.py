@@ -1,11 +1,35 @@
 import logging
+import time
 
 import numpy
 
-from ginga import AstroImage
+from ginga import AstroImage, RGBImage
+from ginga.canvas.types import image as image_types
+from ginga.misc import Callback
 from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
 
 
+class FakeTimer(Callback.Callbacks):
+    # stands in for a GUI timer, which the mock backend lacks
+    def __init__(self):
+        super(FakeTimer, self).__init__()
+        self.enable_callback('expired')
+        self.is_set = False
+
+    def set(self, secs):
+        self.is_set = True
+
+    def run(self):
+        # fire until the viewer stops setting the timer
+        for i in range(500):
+            if not self.is_set:
+                break
+            time.sleep(0.01)
+            self.is_set = False
+            self.make_callback('expired')
+        assert not self.is_set
+
+
 class TestImageView(object):
 
     def setup_class(self):
@@ -50,4 +74,530 @@ class TestImageView(object):
         ## print (x1, y2)
         ## print (dst_x, dst_y)
 
+    def test_backing_size(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(201, 117)
+        viewer.set_image(image)
+
+        # without rotation the backing array just covers the window
+        ht, wd = viewer._rgbarr.shape[:2]
+        assert (wd, ht) == (206, 122)
+        assert viewer.get_image_as_array().shape[:2] == (117, 201)
+
+        viewer.transform(False, False, True)
+        ht, wd = viewer._rgbarr.shape[:2]
+        assert (wd, ht) == (122, 206)
+
+        # with rotation there is room to rotate
+        viewer.transform(False, False, False)
+        viewer.rotate(30)
+        ht, wd = viewer._rgbarr.shape[:2]
+        assert wd == ht and wd > 232
+
+    def test_render_tiles(self):
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.configure_window(300, 200)
+        data = numpy.random.rand(500, 600).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        viewer.set_image(image)
+        viewer.get_settings().set(render_tile_size=64)
+
+        for zoom in (1, 3, -2):
+            viewer.zoom_to(zoom)
+            viewer.set_pan(250.3, 190.7)
+            out = []
+            for flag in (False, True):
+                viewer.get_settings().set(use_render_tiles=flag)
+                viewer.redraw_now(whence=0)
+                out.append(viewer.get_image_as_array())
+            # tiled rendering should give the same result
+            assert numpy.array_equal(out[0], out[1])
+
+        # tiles should be reused after a pan
+        viewer.zoom_to(1)
+        viewer.set_pan(150.3, 190.7)
+        viewer.redraw_now(whence=0)
+        canvas_img = viewer.get_canvas_image()
+        tiles = canvas_img.get_cache(viewer).tiles
+        n = len(tiles)
+        viewer.set_pan(350.3, 190.7)
+        viewer.redraw_now(whence=0)
+        assert 0 < len(tiles) - n < n
+
+        # changing the color map invalidates the tiles
+        viewer.get_rgbmap().invert_cmap()
+        viewer.redraw_now(whence=0)
+        arr = viewer.get_image_as_array()
+        viewer.get_settings().set(use_render_tiles=False)
+        viewer.redraw_now(whence=0)
+        assert numpy.array_equal(arr, viewer.get_image_as_array())
+
+    def test_render_tiles_fractional(self):
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.configure_window(300, 220)
+        data = numpy.random.rand(83, 97).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        viewer.enable_autocuts('off')
+        viewer.set_image(image)
+        viewer.get_settings().set(render_tile_size=32)
+
+        def _render():
+            out = []
+            for flag in (False, True):
+                viewer.get_settings().set(use_render_tiles=flag)
+                viewer.redraw_now(whence=0)
+                out.append(viewer.get_image_as_array())
+            return out
+
+        # the whole image is in view: the same pixels are sampled
+        for pyramid in (False, True):
+            viewer.get_settings().set(use_image_pyramid=pyramid)
+            for scale in (0.3, 0.47, 0.5, 1.7, 2.5):
+                viewer.scale_to(scale, scale)
+                viewer.set_pan(48.3, 41.7)
+                out = _render()
+                assert numpy.array_equal(out[0], out[1])
+
+        # tiles of data that has been replaced are not reused
+        image.set_data(1.0 - data)
+        out = _render()
+        assert numpy.array_equal(out[0], out[1])
+
+    def test_fused_lut(self):
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.configure_window(300, 200)
+
+        for dtype in ('uint8', 'int16', '>u2'):
+            info = numpy.iinfo(numpy.dtype(dtype))
+            data = numpy.random.randint(info.min, info.max + 1,
+                                        size=(150, 250)).astype(dtype)
+            image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+            viewer.set_image(image)
+            viewer.cut_levels(info.min / 3.0, info.max / 2.0)
+
+            out = []
+            for flag in (False, True):
+                viewer.get_settings().set(use_fused_lut=flag)
+                viewer.redraw_now(whence=0)
+                out.append(viewer.get_image_as_array())
+            # lookup table should give the same result
+            assert numpy.array_equal(out[0], out[1])
+
+    def test_render_threads(self):
+        for data in (numpy.random.rand(500, 400).astype(numpy.float32),
+                     numpy.random.randint(0, 4000, size=(500, 400),
+                                          dtype=numpy.uint16)):
+            image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+            results = []
+            for num_threads in (1, 4):
+                viewer = ImageViewCanvas(logger=self.logger)
+                viewer.defer_redraw = False
+                viewer.configure_window(300, 400)
+                viewer.get_settings().set(render_num_threads=num_threads)
+                viewer.set_image(image)
+                viewer.zoom_to(1)
+                results.append(viewer.get_image_as_array())
+
+            # rendering in bands should give the same result
+            assert numpy.array_equal(results[0], results[1])
+
+    def test_scroll_blit(self):
+        data = numpy.random.rand(400, 500).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+        viewers = []
+        for flag in (False, True):
+            viewer = ImageViewCanvas(logger=self.logger)
+            viewer.defer_redraw = False
+            viewer.configure_window(200, 150)
+            viewer.enable_autocuts('off')
+            viewer.get_settings().set(use_scroll_blit=flag)
+            viewer.set_image(image)
+            viewer.cut_levels(0.1, 0.9)
+            viewer.zoom_to(2)
+            viewer.rotate(20)
+            viewers.append(viewer)
+
+        for i in range(6):
+            for viewer in viewers:
+                viewer.set_pan(200 + 7.3 * i, 180 - 4.9 * i)
+            # scrolling should give the same result as a full redraw
+            assert numpy.array_equal(viewers[0].get_image_as_array(),
+                                     viewers[1].get_image_as_array())
+
+        # other changes after a scroll should render the current view
+        for viewer in viewers:
+            viewer.cut_levels(0.2, 0.5)
+        assert numpy.array_equal(viewers[0].get_image_as_array(),
+                                 viewers[1].get_image_as_array())
+
+    def test_scroll_blit_tiles(self):
+        data = numpy.random.rand(400, 500).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        mask = numpy.random.randint(0, 256, size=(60, 80, 4)).astype(
+            numpy.uint8)
+        overlay = RGBImage.RGBImage(data_np=mask, logger=self.logger)
+
+        for rot_deg, flip_x, swap_xy in ((0, False, False), (20, True, True)):
+            viewers = []
+            for flag in (False, True):
+                viewer = ImageViewCanvas(logger=self.logger)
+                viewer.defer_redraw = False
+                viewer.configure_window(200, 150)
+                viewer.enable_autocuts('off')
+                viewer.get_settings().set(use_scroll_blit=flag,
+                                          use_render_tiles=True)
+                viewer.set_image(image)
+                viewer.cut_levels(0.1, 0.9)
+                viewer.zoom_to(1.5)
+                viewer.rotate(rot_deg)
+                viewer.transform(flip_x, False, swap_xy)
+                viewers.append(viewer)
+
+            for with_overlay in (False, True):
+                if with_overlay:
+                    # an overlay that is not rendered on the tile grid
+                    for viewer in viewers:
+                        canvas = viewer.get_canvas()
+                        Image = canvas.get_draw_class('image')
+                        canvas.add(Image(220, 190, overlay, alpha=0.7))
+
+                for i in range(5):
+                    for viewer in viewers:
+                        viewer.set_pan(200 + 7.3 * i, 180 - 4.9 * i)
+                    # scrolling at a fractional scale should give the
+                    # same result as a full redraw
+                    assert numpy.array_equal(
+                        viewers[0].get_image_as_array(),
+                        viewers[1].get_image_as_array())
+
+    def test_dirty_rects(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        mask = numpy.zeros((60, 80, 4), dtype=numpy.uint8)
+        mask[..., 0] = 255
+        mask[..., 3] = numpy.random.randint(0, 256, size=(60, 80))
+        overlay = RGBImage.RGBImage(data_np=mask, logger=self.logger)
+
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(200, 150)
+        viewer.enable_autocuts('off')
+        viewer.set_image(image)
+        viewer.cut_levels(0.1, 0.9)
+        viewer.zoom_to(2)
+        viewer.set_pan(180, 140)
+
+        canvas = viewer.get_canvas()
+        Image = canvas.get_draw_class('image')
+        obj = Image(150, 120, overlay, alpha=0.6)
+        canvas.add(obj)
+
+        # moving the overlay should only recomposite its old and new
+        # areas, without copying the whole backing array
+        arr = viewer._rgbarr2
+        obj.set_origin(160, 125)
+        canvas.update_canvas(whence=3)
+        assert viewer._rgbarr2 is arr
+        res = viewer.get_image_as_array()
+
+        # compare to a full redraw
+        viewer.redraw(whence=0)
+        assert numpy.array_equal(res, viewer.get_image_as_array())
+
+        # same for a change of the overlay contents
+        mask2 = mask.copy()
+        mask2[..., 3] = 255 - mask2[..., 3]
+        obj.set_image(RGBImage.RGBImage(data_np=mask2[10:, 5:],
+                                        logger=self.logger))
+        canvas.update_canvas(whence=3)
+        res = viewer.get_image_as_array()
+        viewer.redraw(whence=0)
+        assert numpy.array_equal(res, viewer.get_image_as_array())
+
+    def test_preview_render(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(200, 150)
+        viewer.enable_autocuts('off')
+        # redraw even though nothing changes
+        viewer.get_settings().set(use_preview_render=True,
+                                  preview_lagtime=0.05,
+                                  use_change_tracking=False)
+        viewer.set_image(image)
+        viewer.cut_levels(0.1, 0.9)
+        viewer.zoom_to(1)
+        full = viewer.get_image_as_array()
+
+        # during an interaction a coarse preview is rendered
+        viewer.note_interaction()
+        viewer.redraw(whence=0)
+        preview = viewer.get_image_as_array()
+        assert preview.shape == full.shape
+        assert not numpy.array_equal(preview, full)
+
+        # ... and replaced at full quality after the interaction stops
+        time.sleep(0.1)
+        viewer.delayed_redraw()
+        assert numpy.array_equal(viewer.get_image_as_array(), full)
+
+    def test_render_stats(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(200, 150)
+        # redraw even though nothing changes
+        viewer.get_settings().set(render_stats_frames=5,
+                                  use_change_tracking=False)
+        viewer.set_image(image)
+        viewer.clear_render_stats()
+        for i in range(8):
+            viewer.redraw(whence=0)
+
+        stats = viewer.get_render_stats(percentiles=[50, 95])
+        assert stats['num_frames'] == 5
+        for stage in ('pan_rect', 'cutout', 'cut_levels', 'color_map',
+                      'composite', 'transforms', 'total'):
+            d = stats['stages'][stage]
+            assert d['count'] == 5
+            assert d['min'] <= d['p50'] <= d['p95'] <= d['max']
+        total = stats['stages']['total']
+        assert stats['stages']['cutout']['max'] <= total['max']
+
+    def test_render_in_thread(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+        viewers = []
+        for flag in (False, True):
+            viewer = ImageViewCanvas(logger=self.logger)
+            viewer.defer_redraw = False
+            viewer.configure_window(200, 150)
+            viewer.enable_autocuts('off')
+            viewer.set_image(image)
+            viewer.cut_levels(0.1, 0.9)
+            viewers.append(viewer)
+
+        viewer = viewers[1]
+        timer = FakeTimer()
+        timer.add_callback('expired', viewer._render_poll_cb)
+        viewer._render_timer = timer
+        viewer.get_settings().set(render_in_thread=True)
+        arr = viewer.get_image_as_array()
+
+        # a quick series of changes; stale renders may be cancelled
+        for viewer in viewers:
+            viewer.zoom_to(2)
+            viewer.set_pan(180, 140)
+            viewer.rotate(30)
+            viewer.set_color_map('rainbow3')
+        # nothing is shown until the GUI thread picks up the frame
+        assert numpy.array_equal(viewers[1].get_image_as_array(), arr)
+
+        timer.run()
+        assert numpy.array_equal(viewers[0].get_image_as_array(),
+                                 viewers[1].get_image_as_array())
+
+    def test_render_snapshot(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+        viewers = []
+        for flag in (False, True):
+            viewer = ImageViewCanvas(logger=self.logger)
+            viewer.defer_redraw = False
+            viewer.configure_window(200, 150)
+            viewer.enable_autocuts('off')
+            viewer.set_image(image)
+            viewers.append(viewer)
+
+        viewer = viewers[1]
+        timer = FakeTimer()
+        timer.add_callback('expired', viewer._render_poll_cb)
+        viewer._render_timer = timer
+        viewer.get_settings().set(render_in_thread=True)
+        timer.run()
+
+        viewers[0].set_pan(120, 90)
+        viewer.clear_render_stats()
+        with viewer._render_lock:
+            # the view is rendered as it was when the frame was requested
+            viewer.set_pan(120, 90)
+            viewer.get_settings().set(rot_deg=30.0, callback=False)
+            viewer._dst_x = -999
+            for i in range(500):
+                if viewer._render_busy:
+                    break
+                time.sleep(0.01)
+
+        # the render thread does not change the geometry being shown...
+        for i in range(500):
+            if viewer._render_res is not None:
+                break
+            time.sleep(0.01)
+        assert viewer._dst_x == -999
+        assert viewer.get_settings()['rot_deg'] == 30.0
+
+        # ... which is that of the frame once it is presented
+        timer.run()
+        assert viewer._dst_x == viewers[0]._dst_x
+        assert numpy.array_equal(viewers[0].get_image_as_array(),
+                                 viewer.get_image_as_array())
+
+        # the stages of the frame in both threads are timed together
+        stats = viewer.get_render_stats()
+        assert stats['num_frames'] == 1
+        for stage in ('cutout', 'transforms', 'encode', 'blit', 'total'):
+            assert stats['stages'][stage]['count'] == 1
+
+    def test_index_array(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        data[10:20, 30:40] = numpy.nan
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(200, 150)
+        viewer.enable_autocuts('off')
+        viewer.set_image(image)
+        viewer.cut_levels(0.2, 0.7)
+
+        canvas_img = viewer.get_canvas_image()
+        cache = canvas_img.get_cache(viewer)
+        idx, scratch = cache.prergb, cache.scratch
+        assert idx.dtype == numpy.uint16
+        assert scratch.dtype == numpy.float32
+
+        # same indexes as calculating in double precision
+        cutout = cache.cutout.astype(numpy.float64)
+        vmax = viewer.get_rgbmap().get_hash_size() - 1
+        expected = ((cutout.clip(0.2, 0.7) - 0.2) / 0.5) * vmax
+        expected[numpy.isnan(expected)] = vmax
+        expected = numpy.floor(expected)
+        assert numpy.max(numpy.abs(idx - expected)) <= 1.0
+
+        # buffers are reused when the cut levels change
+        viewer.cut_levels(0.3, 0.6)
+        assert cache.prergb is idx
+        assert cache.scratch is scratch
+
+    def test_change_tracking(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(200, 150)
+        viewer.enable_autocuts('off')
+        viewer.set_image(image)
+        viewer.cut_levels(0.1, 0.9)
+        viewer.clear_render_stats()
+        canvas = viewer.get_canvas()
+        Circle = canvas.get_draw_class('circle')
+
+        # only the overlays have changed
+        canvas.add(Circle(100, 100, 20))
+        canvas.update_canvas(whence=0)
+        stats = viewer.get_render_stats()
+        assert stats['counts']['downgraded'] == 1
+        assert 'cutout' not in stats['stages']
+
+        # cut levels have changed
+        versions = stats['versions']
+        viewer.get_settings().set(cuts=(0.2, 0.8), callback=False)
+        canvas.update_canvas(whence=0)
+        stats = viewer.get_render_stats()
+        assert stats['counts']['downgraded'] == 2
+        assert stats['versions']['cuts'] == versions['cuts'] + 1
+        assert stats['versions']['data'] == versions['data']
+        assert 'cutout' not in stats['stages']
+        assert stats['stages']['cut_levels']['count'] == 1
+        arr = viewer.get_image_as_array()
+
+        # changes to canvas images need a full redraw
+        viewer.get_canvas_image().x = 10
+        canvas.update_canvas(whence=0)
+        stats = viewer.get_render_stats()
+        assert stats['counts']['downgraded'] == 2
+        assert stats['versions']['data'] == versions['data'] + 1
+        assert stats['stages']['cutout']['count'] == 1
+        assert not numpy.array_equal(viewer.get_image_as_array(), arr)
+
+    def test_change_tracking_explicit(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.defer_redraw = False
+        viewer.configure_window(200, 150)
+        viewer.enable_autocuts('off')
+        viewer.set_image(image)
+        viewer.cut_levels(0.1, 0.9)
+        viewer.clear_render_stats()
+        arr = viewer.get_image_as_array()
+
+        # data changed in place is shown when a redraw is asked for
+        data[:] = 1.0 - data
+        viewer.redraw(whence=0)
+        stats = viewer.get_render_stats()
+        assert 'downgraded' not in stats['counts']
+        assert stats['stages']['cutout']['count'] == 1
+        assert not numpy.array_equal(viewer.get_image_as_array(), arr)
+
+    def test_shared_render_cache(self):
+        data = numpy.random.rand(300, 400).astype(numpy.float32)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        cache = image_types.shared_render_cache
+        cache.clear()
+
+        viewers = []
+        for flag in (False, True, True):
+            viewer = ImageViewCanvas(logger=self.logger)
+            viewer.defer_redraw = False
+            viewer.configure_window(200, 150)
+            viewer.get_settings().set(use_shared_render_cache=flag)
+            viewer.enable_autocuts('off')
+            viewer.set_image(image)
+            viewer.cut_levels(0.1, 0.9)
+            viewer.zoom_to(1.5)
+            viewers.append(viewer)
+
+        # the second sharing viewer reuses the results of the first
+        assert len(cache) > 0
+        num_arrays = len(cache)
+        for viewer in viewers:
+            viewer.redraw_now(whence=0)
+        assert len(cache) == num_arrays
+        arr = viewers[0].get_image_as_array()
+        for viewer in viewers[1:]:
+            assert numpy.array_equal(viewer.get_image_as_array(), arr)
+
+        # a different color map is not shared
+        viewers[2].set_color_map('rainbow3')
+        assert not numpy.array_equal(viewers[2].get_image_as_array(), arr)
+        assert numpy.array_equal(viewers[1].get_image_as_array(), arr)
+
+        # cutouts that are views of the data are cached as copies, so
+        # that they do not keep the data alive
+        for viewer in viewers:
+            viewer.zoom_to(1)
+        assert len(cache) > num_arrays
+        for _arr in cache._tiles.values():
+            assert _arr.flags.owndata
+
+        # new data invalidates the shared results
+        key = image.get_data_key()
+        image.set_data(1.0 - data)
+        assert image.get_data_key() != key
+        for viewer in viewers:
+            viewer.redraw_now(whence=0)
+        arr = viewers[0].get_image_as_array()
+        assert numpy.array_equal(viewers[1].get_image_as_array(), arr)
+        cache.clear()
+
 # END
@@ -0,0 +1,72 @@
+"""Unit Tests for the RGBMap.py functions"""
+
+import logging
+
+import numpy as np
+
+from ginga import RGBMap, cmap, imap
+
+
+class TestRGBMap(object):
+
+    def setup_class(self):
+        self.logger = logging.getLogger("TestRGBMap")
+
+    def _get_rgbmap(self):
+        rgbmap = RGBMap.RGBMapper(self.logger)
+        rgbmap.set_cmap(cmap.get_cmap('rainbow3'))
+        rgbmap.set_imap(imap.get_imap('log'))
+        rgbmap.scale_and_shift(0.7, 0.1)
+        return rgbmap
+
+    def test_version(self):
+        rgbmap = self._get_rgbmap()
+        version = rgbmap.get_version()
+        rgbmap.invert_cmap(callback=False)
+        assert rgbmap.get_version() > version
+
+        version = rgbmap.get_version()
+        rgbmap.shift(0.1)
+        assert rgbmap.get_version() > version
+
+    def test_packed_lut(self):
+        rgbmap = self._get_rgbmap()
+        idx = np.random.randint(0, 70000, size=(50, 60)).astype(np.uint)
+
+        for order in ('RGBA', 'BGRA', 'ARGB'):
+            res = rgbmap.get_rgbarray(idx.copy(), order=order)
+            arr = res.rgbarr
+
+            # compare to a separate lookup of each plane
+            hidx = rgbmap.get_hasharray(idx.copy()).clip(0, rgbmap.maxc)
+            sidx = rgbmap.get_sarr()[hidx].clip(0, rgbmap.maxc)
+            for i, c in enumerate(order):
+                if c == 'A':
+                    assert np.all(arr[..., i] == rgbmap.maxv)
+                else:
+                    plane = rgbmap.arr['RGB'.index(c)][sidx]
+                    assert np.array_equal(arr[..., i], plane)
+
+    def test_banded(self):
+        rgbmap = self._get_rgbmap()
+        idx = np.random.randint(0, 70000, size=(300, 60)).astype(np.uint)
+
+        for order in ('RGBA', 'RGB'):
+            res1 = rgbmap.get_rgbarray(idx.copy(), order=order)
+            res2 = rgbmap.get_rgbarray(idx.copy(), order=order,
+                                       num_threads=4)
+            assert np.array_equal(res1.rgbarr, res2.rgbarr)
+
+    def test_subclass_alpha(self):
+        class GrayMapper(RGBMap.RGBMapper):
+            # maps colors without writing the alpha plane
+            def _get_rgbarray(self, idx, rgbobj, image_order=''):
+                idx.clip(0, self.maxc, out=idx)
+                for c in 'RGB':
+                    rgbobj.get_slice(c)[...] = idx
+
+        rgbmap = GrayMapper(self.logger)
+        idx = np.random.randint(0, 256, size=(50, 60)).astype(np.uint)
+        out = np.zeros((50, 60, 4), dtype=np.uint8)
+        res = rgbmap.get_rgbarray(idx, out=out, order='RGBA')
+        assert np.all(res.get_slice('A') == rgbmap.maxv)
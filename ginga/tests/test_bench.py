@@ -0,0 +1,43 @@
+"""Unit Tests for the bench.py functions"""
+
+import logging
+
+import numpy as np
+
+from ginga.util import bench
+
+
+class TestBench(object):
+
+    def setup_class(self):
+        self.logger = logging.getLogger("TestBench")
+
+    def test_make_data(self):
+        data = bench.make_data(100, 'int16', nans=True)
+        assert data.dtype == np.int16
+        assert data.shape == (100, 100)
+        assert np.max(data) == 32767
+
+        data = bench.make_data(100, 'float32', nans=True)
+        assert np.any(np.isnan(data))
+        # data is reproducible
+        data2 = bench.make_data(100, 'float32', nans=True)
+        assert np.array_equal(np.nan_to_num(data), np.nan_to_num(data2))
+
+    def test_run(self):
+        res = bench.run(sizes=[128], dtypes=['uint8', 'float64'],
+                        num_frames=3, window=(100, 80), logger=self.logger)
+        results = res['results']
+        # float data is also run with NaNs
+        assert len(results) == 3 * len(bench.workloads)
+        for d in results:
+            assert d['frames'] > 0
+            assert d['fps'] > 0
+            assert d['stage_means']['total'] > 0
+
+    def test_run_datasrc(self):
+        for length in (0, 10):
+            res = bench.run_datasrc(100, length=length)
+            assert res['num_items'] == 100
+            for name in ('push', 'touch', 'keys', 'repush', 'remove'):
+                assert res[name] >= 0
@@ -0,0 +1,32 @@
+"""Unit Tests for the parallel.py functions"""
+
+import threading
+
+import numpy as np
+
+from ginga.util import parallel
+
+
+class TestParallel(object):
+
+    def test_band_pool(self):
+        pool = parallel.get_band_pool(2)
+        num_threads = threading.active_count()
+
+        # a larger pool grows the shared one, rather than replacing it
+        numthreads = pool.numthreads + 2
+        pool2 = parallel.get_band_pool(numthreads)
+        assert pool2 is pool
+        assert pool.numthreads == numthreads
+        assert threading.active_count() == num_threads + 2
+
+        assert parallel.get_band_pool(2) is pool
+
+    def test_run_in_bands(self):
+        arr = np.zeros((500, 10))
+
+        def fill(y1, y2):
+            arr[y1:y2] += np.arange(y1, y2)[:, np.newaxis]
+
+        parallel.run_in_bands(fill, 500, 4)
+        assert np.array_equal(arr[:, 0], np.arange(500))
@@ -0,0 +1,92 @@
+"""Unit Tests for the prefetch.py classes"""
+
+import logging
+
+import numpy as np
+
+from ginga.AstroImage import AstroImage
+from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+from ginga.util import prefetch
+
+
+class TestPrefetch(object):
+
+    def setup_class(self):
+        self.logger = logging.getLogger("TestPrefetch")
+        data = np.random.rand(6, 80, 100).astype(np.float32)
+        self.image = AstroImage(logger=self.logger)
+        self.image.load_data(data)
+        self.image.set_naxispath([0])
+
+    def test_prefetch(self):
+        prefetcher = prefetch.SlicePrefetcher(self.image, 0, self.logger,
+                                              num_ahead=3)
+        prefetcher.start()
+        try:
+            for idx in (1, 2, 3, 4, 5, 0, 1):
+                bnch = prefetcher.get(idx, timeout=10.0)
+                assert bnch.naxispath == [idx]
+                prefetcher.frame_shown()
+            # the slices ahead were read and analyzed
+            stats = self.image.get_slice_stats([2])
+            assert stats['minmax']['maxval'] == np.max(
+                self.image.get_mddata()[2])
+
+            # a slice that is not ahead is not prepared
+            assert prefetcher.get(4) is None
+            stats = prefetcher.get_stats(interval=0.1)
+            assert stats['hits'] == 7
+            assert stats['misses'] == 1
+            assert stats['frames'] == 6
+            assert stats['requested_fps'] == 10.0
+        finally:
+            prefetcher.stop()
+
+    def test_prerender(self):
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.configure(120, 90)
+        viewer.set_image(self.image)
+        viewer.cut_levels(0.2, 0.8)
+        viewer.set_color_map('rainbow')
+        viewer.rotate(20)
+        viewer.transform(True, False, False)
+
+        renderer = prefetch.SliceRenderer(viewer, self.image)
+        assert renderer.signature == prefetch.get_view_signature(viewer)
+        prefetcher = prefetch.SlicePrefetcher(self.image, 0, self.logger,
+                                              num_ahead=2,
+                                              render_func=renderer)
+        prefetcher.start()
+        try:
+            bnch = prefetcher.get(1, timeout=10.0)
+        finally:
+            prefetcher.stop()
+
+        # slice is rendered as the viewer renders it
+        self.image.set_naxispath([1])
+        rgbobj = viewer.get_rgb_object(whence=0)
+        assert np.array_equal(bnch.rgbobj.get_array('RGBA'),
+                              rgbobj.get_array('RGBA'))
+
+        viewer.show_rgb_object(bnch.rgbobj)
+        assert viewer.get_rgb_object(whence=3) is bnch.rgbobj
+
+        viewer.scale_to(2.0, 2.0)
+        assert renderer.signature != prefetch.get_view_signature(viewer)
+        self.image.set_naxispath([0])
+
+    def test_shows_only_image(self):
+        viewer = ImageViewCanvas(logger=self.logger)
+        viewer.set_image(self.image)
+        assert prefetch.shows_only_image(viewer)
+
+        # empty canvases of plugins do not count
+        canvas = viewer.get_canvas()
+        DrawingCanvas = canvas.get_draw_class('drawingcanvas')
+        subcanvas = DrawingCanvas()
+        canvas.add(subcanvas)
+        assert prefetch.shows_only_image(viewer)
+
+        Circle = canvas.get_draw_class('circle')
+        subcanvas.add(Circle(10, 10, 5))
+        assert not prefetch.shows_only_image(viewer)
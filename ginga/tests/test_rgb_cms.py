@@ -0,0 +1,44 @@
+"""Unit Tests for the rgb_cms.py functions"""
+
+import numpy as np
+
+from ginga.util import rgb_cms
+
+
+class TestRgbCms(object):
+
+    def test_lut_grid(self):
+        grid = rgb_cms.get_lut_grid(33)
+        assert grid.shape == (33, 33, 33, 3)
+        assert tuple(grid[0, 0, 0]) == (0, 0, 0)
+        assert tuple(grid[-1, -1, -1]) == (255, 255, 255)
+        assert tuple(grid[32, 0, 16]) == (255, 0, grid[16, 0, 0, 0])
+
+    def test_apply_lut(self):
+        img = np.random.randint(0, 256, size=(120, 90, 4)).astype(np.uint8)
+        mtx = np.array([[0.5, 0.2, 0.1],
+                        [0.2, 0.6, 0.1],
+                        [0.1, 0.1, 0.7]], dtype=np.float32)
+
+        for size in (17, 33):
+            grid = rgb_cms.get_lut_grid(size).astype(np.float32)
+
+            # the identity table leaves the colors unchanged
+            res = img.copy()
+            rgb_cms.apply_lut(res, grid, indexes=(2, 1, 0))
+            assert np.array_equal(res, img)
+
+            # a linear conversion is interpolated exactly
+            lut = np.dot(grid, mtx)
+            res = img.copy()
+            rgb_cms.apply_lut(res, lut, indexes=(2, 1, 0), num_pixels=1000)
+            expected = np.dot(img[..., 2::-1].astype(np.float32), mtx)
+            assert np.max(np.abs(res[..., 2::-1] - expected)) <= 0.5 + 1e-3
+            assert np.array_equal(res[..., 3], img[..., 3])
+
+            # remembered colors give the same results
+            memo = rgb_cms.make_lut_memo()
+            for i in range(2):
+                res2 = img.copy()
+                rgb_cms.apply_lut(res2, lut, indexes=(2, 1, 0), memo=memo)
+                assert np.array_equal(res2, res)
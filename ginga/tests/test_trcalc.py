@@ -0,0 +1,139 @@
+"""Unit Tests for the trcalc.py functions"""
+
+import numpy as np
+
+from ginga import trcalc
+
+
+class TestTrcalc(object):
+
+    def test_resample_area(self):
+        data = np.arange(64, dtype=np.float64).reshape((8, 8))
+        res = trcalc.resample(data, 4, 2, 'area')
+        assert res.shape == (2, 4)
+        # each output pixel is the average of a 4x2 block
+        assert res[1, 2] == np.mean(data[4:8, 4:6])
+
+    def test_resample_linear(self):
+        # linear interpolation reproduces a ramp exactly (away from
+        # the repeated edge pixels)
+        ramp = np.tile(np.arange(100, dtype=np.float32), (10, 1))
+        res = trcalc.resample(ramp, 300, 10, 'linear')
+        expected = (np.arange(300) + 0.5) / 3.0 - 0.5
+        assert np.allclose(res[5, 3:297], expected[3:297], atol=1e-4)
+
+    def test_resample_int(self):
+        data = np.zeros((40, 40), dtype=np.uint8)
+        data[::2, ::2] = 255
+        for method in ('bicubic', 'lanczos'):
+            res = trcalc.resample(data, 97, 53, method)
+            # overshoot is clipped to the range of the type
+            assert res.dtype == np.uint8
+            assert res.shape == (53, 97)
+
+        rgb = np.random.randint(0, 256, size=(40, 30, 4)).astype(np.uint8)
+        res = trcalc.resample(rgb, 60, 80, 'linear')
+        assert res.shape == (80, 60, 4)
+
+    def test_resample_table_cache(self):
+        tbl1 = trcalc.get_resample_table(100, 250, 'lanczos')
+        tbl2 = trcalc.get_resample_table(100, 250, 'lanczos')
+        assert tbl1 is tbl2
+        idx, wts = tbl1
+        assert idx.shape == wts.shape == (250, 8)
+        assert np.allclose(np.sum(wts, axis=1), 1.0)
+
+    def test_scaled_cutout(self):
+        data = np.random.rand(50, 60).astype(np.float32)
+        for method in trcalc.interpolation_methods:
+            res, scales = trcalc.get_scaled_cutout_basic(data, 5, 10, 44, 29,
+                                                         2.0, 2.0,
+                                                         interpolation=method)
+            assert res.shape == (40, 80)
+            assert scales == (2.0, 2.0)
+
+    def test_rotate_clip_transforms(self):
+        data = np.random.randint(0, 256, size=(60, 80, 4)).astype(np.uint8)
+        for flips in [(False, False, False), (True, False, True),
+                      (False, True, False), (True, True, True)]:
+            flip_x, flip_y, swap_xy = flips
+            res = trcalc.rotate_clip(data, 33.0, flip_x=flip_x,
+                                     flip_y=flip_y, swap_xy=swap_xy)
+            arr = np.ascontiguousarray(trcalc.transform(data, *flips))
+            # same as transforming first, and rotating each band
+            for i in range(4):
+                band = trcalc.rotate_clip(arr[..., i], 33.0)
+                assert np.array_equal(res[..., i], band)
+
+    def test_rotate_index_map_cache(self):
+        map1 = trcalc.get_rotate_index_map((50, 70), 12.0, 35, 25)
+        map2 = trcalc.get_rotate_index_map((50, 70), 12.0, 35, 25)
+        assert map1 is map2
+        assert map1.shape == (50, 70)
+        # indexes are stored in 32 bits
+        assert map1.dtype == np.uint32
+        assert map1.nbytes == 50 * 70 * 4
+
+    def test_overlay_blend_uint8(self):
+        dst = np.random.randint(0, 256, size=(200, 150, 4)).astype(np.uint8)
+        src = np.random.randint(0, 256, size=(180, 100, 4)).astype(np.uint8)
+        # fully transparent and fully opaque blocks of rows
+        src[:64, :, 3] = 0
+        src[64:128, :, 3] = 255
+
+        res = trcalc.overlay_image(dst.copy(), (20, 10), src,
+                                   dst_order='RGBA', src_order='RGBA')
+        region = res[10:190, 20:120, :3].astype(np.float64)
+        a = src[..., 3:4] / 255.0
+        expected = src[..., :3] * a + dst[10:190, 20:120, :3] * (1.0 - a)
+        assert np.max(np.abs(region - expected)) <= 0.5 + 1e-9
+        assert np.array_equal(res[10:74, 20:120, :3], dst[10:74, 20:120, :3])
+        assert np.array_equal(res[74:138, 20:120, :3], src[64:128, :, :3])
+        assert np.all(res[10:190, 20:120, 3] == 255)
+
+        # scalar alpha, with a source in a different order
+        res = trcalc.overlay_image(dst.copy(), (-5, -5), src[..., :3],
+                                   dst_order='RGBA', src_order='BGR',
+                                   alpha=0.4)
+        expected = src[5:, 5:, 2::-1] * 0.4 + dst[:175, :95, :3] * 0.6
+        assert np.max(np.abs(res[:175, :95, :3] - expected)) <= 0.5 + 1e-9
+
+    def test_calc_minmax(self):
+        data = np.random.rand(300, 200).astype(np.float64)
+        data[10, 20] = np.nan
+        data[150, 7] = np.inf
+        data[299, :] = np.nan
+        finite = data[np.isfinite(data)]
+        # with chunks of a few rows each
+        for chunk_bytes in (None, 3000, 1):
+            res = trcalc.calc_minmax(data, chunk_bytes=chunk_bytes)
+            assert res['minval'] == np.min(finite)
+            assert res['maxval'] == np.inf
+            assert res['minval_noinf'] == np.min(finite)
+            assert res['maxval_noinf'] == np.max(finite)
+            assert res['num_nan'] == 201
+
+        data = np.random.randint(-100, 100, size=(50, 40, 3)).astype(np.int16)
+        res = trcalc.calc_minmax(data, chunk_bytes=1000)
+        assert res['minval'] == res['minval_noinf'] == np.min(data)
+        assert res['maxval'] == res['maxval_noinf'] == np.max(data)
+        assert res['num_nan'] == 0
+
+        sample = trcalc.get_sample(data, 100)
+        assert sample.shape == (10, 8, 3)
+
+    def test_get_sample(self):
+        data = np.random.rand(400, 300).astype(np.float32)
+        for method in trcalc.sample_methods:
+            sample = trcalc.get_sample(data, 5000, method=method)
+            assert sample.ndim == 2
+            assert 2500 <= sample.size <= 10000
+            assert np.all(np.isin(sample, data))
+
+        # small data is used as is
+        assert trcalc.get_sample(data, 10 ** 6, method='random') is data
+
+        err1 = trcalc.get_sample_error(1000, 10 ** 6)
+        err2 = trcalc.get_sample_error(100000, 10 ** 6)
+        assert 0 < err2 < err1 < 0.1
+        assert trcalc.get_sample_error(10 ** 6, 10 ** 6) == 0.0
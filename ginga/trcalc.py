@@ -5,9 +5,14 @@
 # Please see the file LICENSE.txt for details.
 #
 import math
+from collections import OrderedDict
+
 import numpy as np
 
-interpolation_methods = ['basic']
+# methods other than 'basic' and 'nearest' are done by resample()
+# (or by OpenCv, if it is in use)
+interpolation_methods = ['area', 'basic', 'bicubic', 'lanczos', 'linear',
+                         'nearest']
 
 
 def use(pkgname):
@@ -121,8 +126,79 @@ def rotate_coord(coord, thetas, offsets):
     return arr.T
 
 
+# cache of index maps for rotate_clip(), see get_rotate_index_map()
+_rotate_maps = OrderedDict()
+rotate_map_cache_mb = 256
+
+
+def get_rotate_index_map(shape, theta_deg, rotctr_x, rotctr_y,
+                         flip_x=False, flip_y=False, swap_xy=False):
+    """
+    Get a map for rotating a 2D array of shape `shape` by `theta_deg`
+    around (rotctr_x, rotctr_y), after first flipping and/or swapping
+    its axes as done by `transform`.
+
+    The map is an array of the shape of the result, holding for each
+    result pixel the index of the source pixel in the flattened,
+    untransformed array.  Maps are cached, so that redraws of a rotated
+    view only need a single gather per frame.
+    """
+    ht, wd = shape[:2]
+    key = (ht, wd, theta_deg, rotctr_x, rotctr_y, flip_x, flip_y, swap_xy)
+    idx = _rotate_maps.get(key, None)
+    if idx is not None:
+        _rotate_maps.pop(key)
+        _rotate_maps[key] = idx
+        return idx
+
+    # dimensions after the flips and swap
+    t_ht, t_wd = (wd, ht) if swap_xy else (ht, wd)
+
+    yi, xi = np.mgrid[0:t_ht, 0:t_wd]
+    xi -= rotctr_x
+    yi -= rotctr_y
+    cos_t = np.cos(np.radians(theta_deg))
+    sin_t = np.sin(np.radians(theta_deg))
+
+    if have_numexpr:
+        ap = ne.evaluate("(xi * cos_t) - (yi * sin_t) + rotctr_x")
+        bp = ne.evaluate("(xi * sin_t) + (yi * cos_t) + rotctr_y")
+    else:
+        ap = (xi * cos_t) - (yi * sin_t) + rotctr_x
+        bp = (xi * sin_t) + (yi * cos_t) + rotctr_y
+
+    # Optomizations to reuse existing intermediate arrays
+    np.rint(ap, out=ap)
+    ap.clip(0, t_wd - 1, out=ap)
+    np.rint(bp, out=bp)
+    bp.clip(0, t_ht - 1, out=bp)
+    # 32-bit indexes, if they can address the source, halve the size of
+    # the cached map
+    itype = np.uint32 if ht * wd <= 2 ** 32 else np.intp
+    ap = ap.astype(itype)
+    bp = bp.astype(itype)
+
+    # undo the swap and flips to index the original array
+    if swap_xy:
+        ap, bp = bp, ap
+    if flip_y:
+        bp = (ht - 1) - bp
+    if flip_x:
+        ap = (wd - 1) - ap
+    idx = bp * wd + ap
+
+    max_bytes = rotate_map_cache_mb * 1024 * 1024
+    nbytes = idx.nbytes + sum([arr.nbytes for arr in _rotate_maps.values()])
+    while (len(_rotate_maps) > 0) and (nbytes > max_bytes):
+        _key, arr = _rotate_maps.popitem(last=False)
+        nbytes -= arr.nbytes
+    _rotate_maps[key] = idx
+    return idx
+
+
 def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
-                out=None, use_opencl=True, logger=None):
+                out=None, use_opencl=True, logger=None,
+                flip_x=False, flip_y=False, swap_xy=False):
     """
     Rotate numpy array `data_np` by `theta_deg` around rotation center
     (rotctr_x, rotctr_y).  If the rotation center is omitted it defaults
@@ -131,19 +207,33 @@ def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
     No adjustment is done to the data array beforehand, so the result will
     be clipped according to the size of the array (the output array will be
     the same size as the input array).
+
+    If any of `flip_x`, `flip_y` or `swap_xy` are given, the array is
+    first transformed as by `transform`; without OpenCv or OpenCL this
+    is folded into the same gather as the rotation.
     """
 
     # If there is no rotation, then we are done
     if math.fmod(theta_deg, 360.0) == 0.0:
-        return data_np
+        return transform(data_np, flip_x=flip_x, flip_y=flip_y,
+                         swap_xy=swap_xy)
+
+    if have_opencv or (have_opencl and use_opencl):
+        data_np = transform(data_np, flip_x=flip_x, flip_y=flip_y,
+                            swap_xy=swap_xy)
+        if flip_x or flip_y or swap_xy:
+            data_np = np.ascontiguousarray(data_np)
+        flip_x = flip_y = swap_xy = False
 
     ht, wd = data_np.shape[:2]
     dtype = data_np.dtype
 
+    # dimensions of the result
+    t_ht, t_wd = (wd, ht) if swap_xy else (ht, wd)
     if rotctr_x is None:
-        rotctr_x = wd // 2
+        rotctr_x = t_wd // 2
     if rotctr_y is None:
-        rotctr_y = ht // 2
+        rotctr_y = t_ht // 2
 
     if have_opencv:
         if logger is not None:
@@ -185,39 +275,24 @@ def rotate_clip(data_np, theta_deg, rotctr_x=None, rotctr_y=None,
     else:
         if logger is not None:
             logger.debug("rotating with numpy")
-        yi, xi = np.mgrid[0:ht, 0:wd]
-        xi -= rotctr_x
-        yi -= rotctr_y
-        cos_t = np.cos(np.radians(theta_deg))
-        sin_t = np.sin(np.radians(theta_deg))
-
-        if have_numexpr:
-            ap = ne.evaluate("(xi * cos_t) - (yi * sin_t) + rotctr_x")
-            bp = ne.evaluate("(xi * sin_t) + (yi * cos_t) + rotctr_y")
+        idx = get_rotate_index_map((ht, wd), theta_deg, rotctr_x, rotctr_y,
+                                   flip_x=flip_x, flip_y=flip_y,
+                                   swap_xy=swap_xy)
+
+        data_np = np.ascontiguousarray(data_np)
+        rdim = data_np.shape[2:]
+        if (dtype == np.uint8) and (rdim == (4,)):
+            # move all four bytes of each pixel with one gather
+            src = data_np.view(np.uint32).reshape(-1)
+            newdata = src.take(idx).view(np.uint8).reshape(
+                (t_ht, t_wd) + rdim)
         else:
-            ap = (xi * cos_t) - (yi * sin_t) + rotctr_x
-            bp = (xi * sin_t) + (yi * cos_t) + rotctr_y
-
-        #ap = np.rint(ap).astype('int').clip(0, wd-1)
-        #bp = np.rint(bp).astype('int').clip(0, ht-1)
-        # Optomizations to reuse existing intermediate arrays
-        np.rint(ap, out=ap)
-        ap = ap.astype(np.int, copy=False)
-        ap.clip(0, wd - 1, out=ap)
-        np.rint(bp, out=bp)
-        bp = bp.astype(np.int, copy=False)
-        bp.clip(0, ht - 1, out=bp)
+            src = data_np.reshape((ht * wd, ) + rdim)
+            newdata = src.take(idx, axis=0)
 
         if out is not None:
-            out[:, :, ...] = data_np[bp, ap]
+            out[:, :, ...] = newdata
             newdata = out
-        else:
-            newdata = data_np[bp, ap]
-            new_ht, new_wd = newdata.shape[:2]
-
-            assert (wd == new_wd) and (ht == new_ht), \
-                Exception("rotated cutout is %dx%d original=%dx%d" % (
-                    new_wd, new_ht, wd, ht))
 
     return newdata
 
@@ -370,6 +445,134 @@ def get_scaled_cutout_wdhtdp_view(shp, p1, p2, new_dims):
     return (view, (scale_x, scale_y, scale_z))
 
 
+def _kernel_linear(x):
+    return np.clip(1.0 - np.abs(x), 0.0, None)
+
+
+def _kernel_bicubic(x, a=-0.75):
+    # Keys cubic convolution kernel (same coefficient as OpenCv)
+    x = np.abs(x)
+    x2, x3 = x * x, x * x * x
+    return np.where(x <= 1.0, (a + 2.0) * x3 - (a + 3.0) * x2 + 1.0,
+                    np.where(x < 2.0, a * x3 - 5.0 * a * x2 + 8.0 * a * x - 4.0 * a,
+                             0.0))
+
+
+def _kernel_lanczos(x, a=4):
+    return np.where(np.abs(x) < a, np.sinc(x) * np.sinc(x / a), 0.0)
+
+
+# kernel function and radius (in source pixels) of each resampling method
+resample_kernels = {
+    'linear': (_kernel_linear, 1),
+    'bicubic': (_kernel_bicubic, 2),
+    'lanczos': (_kernel_lanczos, 4),
+}
+
+# cache of resampling tables, see get_resample_table()
+_resample_tables = {}
+_resample_tables_max = 64
+
+
+def get_resample_table(old_n, new_n, method):
+    """
+    Get the table for resampling `old_n` pixels to `new_n` pixels along
+    one axis by interpolation method `method`.
+
+    Returns (idx, wts), each of shape (new_n, ntaps): output pixel i is
+    the sum of source pixels idx[i] weighted by wts[i].  Source indexes
+    are clipped to the range 0..old_n-1 (i.e. edge pixels are repeated).
+    Tables are cached, because redraws at the same scale need the same
+    ones over and over.
+    """
+    key = (method, old_n, new_n)
+    tbl = _resample_tables.get(key, None)
+    if tbl is not None:
+        return tbl
+
+    scale = float(old_n) / new_n
+    # output pixel i covers the source interval [i * scale, (i+1) * scale)
+    i = np.arange(new_n, dtype=np.float64).reshape(-1, 1)
+
+    if method == 'area':
+        # weight each source pixel by how much of it the output covers
+        a, b = i * scale, (i + 1) * scale
+        ntaps = int(math.ceil(scale)) + 1
+        j = np.floor(a) + np.arange(ntaps)
+        wts = np.clip(np.minimum(b, j + 1) - np.maximum(a, j), 0.0, None)
+
+    else:
+        kernel, radius = resample_kernels[method]
+        ctr = (i + 0.5) * scale - 0.5
+        j = np.floor(ctr) + np.arange(1 - radius, radius + 1)
+        wts = kernel(ctr - j)
+
+    wts /= np.sum(wts, axis=1, keepdims=True)
+    idx = j.clip(0, old_n - 1).astype(np.intp)
+    tbl = (idx, wts.astype(np.float32))
+
+    if len(_resample_tables) >= _resample_tables_max:
+        _resample_tables.clear()
+    _resample_tables[key] = tbl
+    return tbl
+
+
+def _resample_axis(data_np, axis, idx, wts, dtype):
+    # apply a resampling table along `axis` (0 or 1) of `data_np`
+    shp = [1] * data_np.ndim
+    shp[axis] = len(idx)
+    res = None
+    for k in range(idx.shape[1]):
+        part = np.take(data_np, idx[:, k], axis=axis).astype(dtype, copy=False)
+        part *= wts[:, k].reshape(shp)
+        if res is None:
+            res = part
+        else:
+            res += part
+    return res
+
+
+def resample(data_np, new_wd, new_ht, method, dtype=None):
+    """
+    Resample `data_np` (2D, or 3D with the color bands last) to size
+    (`new_wd`, `new_ht`) using NumPy only.
+
+    `method` is one of 'linear', 'bicubic', 'lanczos' (each with the
+    same kernel as OpenCv) or 'area' (average of the covered source
+    pixels, best for reducing).  Integer results are rounded and clipped
+    to the range of `dtype`, which defaults to the type of `data_np`.
+    """
+    if dtype is None:
+        dtype = data_np.dtype
+    dtype = np.dtype(dtype)
+    ht, wd = data_np.shape[:2]
+    new_wd, new_ht = max(int(new_wd), 1), max(int(new_ht), 1)
+
+    # single precision is enough for small integer and float32 data
+    if ((data_np.dtype.kind in ('u', 'i', 'b') and data_np.dtype.itemsize <= 2) or
+            data_np.dtype == np.float32):
+        ftype = np.float32
+    else:
+        ftype = np.float64
+
+    idx_y, wts_y = get_resample_table(ht, new_ht, method)
+    idx_x, wts_x = get_resample_table(wd, new_wd, method)
+
+    # do the axis first that saves the most work
+    if (idx_y.shape[1] * new_ht * wd) <= (idx_x.shape[1] * ht * new_wd):
+        res = _resample_axis(data_np, 0, idx_y, wts_y, ftype)
+        res = _resample_axis(res, 1, idx_x, wts_x, ftype)
+    else:
+        res = _resample_axis(data_np, 1, idx_x, wts_x, ftype)
+        res = _resample_axis(res, 0, idx_y, wts_y, ftype)
+
+    if dtype.kind in ('u', 'i'):
+        info = np.iinfo(dtype)
+        np.rint(res, out=res)
+        res = res.clip(info.min, info.max)
+    return res.astype(dtype, copy=False)
+
+
 def get_scaled_cutout_wdht(data_np, x1, y1, x2, y2, new_wd, new_ht,
                            interpolation='basic', logger=None,
                            dtype=None):
@@ -417,8 +620,19 @@ def get_scaled_cutout_wdht(data_np, x1, y1, x2, y2, new_wd, new_ht,
                                                                         scale_x, scale_y)
 
     elif interpolation not in ('basic', 'nearest'):
-        raise ValueError("Interpolation method not supported: '%s'" % (
-            interpolation))
+        if interpolation not in interpolation_methods:
+            raise ValueError("Interpolation method not supported: '%s'" % (
+                interpolation))
+
+        if logger is not None:
+            logger.debug("resizing with numpy (%s)" % (interpolation))
+        cutout = data_np[y1:y2 + 1, x1:x2 + 1]
+        newdata = resample(cutout, new_wd, new_ht, interpolation,
+                           dtype=dtype)
+
+        old_wd, old_ht = max(x2 - x1 + 1, 1), max(y2 - y1 + 1, 1)
+        ht, wd = newdata.shape[:2]
+        scale_x, scale_y = float(wd) / old_wd, float(ht) / old_ht
 
     else:
         if logger is not None:
@@ -510,8 +724,12 @@ def get_scaled_cutout_basic(data_np, x1, y1, x2, y2, scale_x, scale_y,
             data_np, x1, y1, x2, y2, scale_x, scale_y)
 
     elif interpolation not in ('basic', 'nearest'):
-        raise ValueError("Interpolation method not supported: '%s'" % (
-            interpolation))
+        new_wd = int(round(scale_x * (x2 - x1 + 1)))
+        new_ht = int(round(scale_y * (y2 - y1 + 1)))
+        return get_scaled_cutout_wdht(data_np, x1, y1, x2, y2,
+                                      new_wd, new_ht,
+                                      interpolation=interpolation,
+                                      logger=logger, dtype=dtype)
 
     else:
         if logger is not None:
@@ -531,8 +749,15 @@ def get_scaled_cutout_basic2(data_np, p1, p2, scales,
                              interpolation='basic', logger=None):
 
     if interpolation not in ('basic', 'nearest'):
-        raise ValueError("Interpolation method not supported: '%s'" % (
-            interpolation))
+        if len(scales) > 2:
+            raise ValueError("Interpolation method not supported for "
+                             "3D cutouts: '%s'" % (interpolation))
+        newdata, scales = get_scaled_cutout_basic(data_np, p1[0], p1[1],
+                                                  p2[0], p2[1],
+                                                  scales[0], scales[1],
+                                                  interpolation=interpolation,
+                                                  logger=logger)
+        return newdata, scales
 
     if logger is not None:
         logger.debug('resizing by slicing')
@@ -543,6 +768,27 @@ def get_scaled_cutout_basic2(data_np, p1, p2, scales,
     return newdata, scales
 
 
+def area_average_2x(data_np):
+    """
+    Reduce `data_np` by a factor of two in the X and Y dimensions by
+    averaging each 2x2 block of pixels.  A trailing odd row or column
+    is dropped.  Integer data is rounded back to its original type.
+    """
+    ht, wd = data_np.shape[:2]
+    new_ht, new_wd = ht // 2, wd // 2
+    dtype = data_np.dtype
+
+    data = data_np[:new_ht * 2, :new_wd * 2]
+    shp = (new_ht, 2, new_wd, 2) + data.shape[2:]
+    newdata = data.reshape(shp).mean(axis=(1, 3))
+
+    if not np.issubdtype(dtype, np.floating):
+        np.rint(newdata, out=newdata)
+    newdata = newdata.astype(dtype, copy=False)
+
+    return newdata
+
+
 def transform(data_np, flip_x=False, flip_y=False, swap_xy=False):
 
     # Do transforms as necessary
@@ -683,12 +929,12 @@ def overlay_image_2d(dstarr, pos, srcarr, dst_order='RGBA',
     if fill and (da_idx >= 0):
         dstarr[dst_y:dst_y + src_ht, dst_x:dst_x + src_wd, da_idx] = dst_max_val
 
+    # if overlay source contains an alpha channel, use it, otherwise
+    # use scalar keyword parameter
+    src_alpha = None
     if (src_ch > 3) and ('A' in src_order):
         sa_idx = src_order.index('A')
-        # if overlay source contains an alpha channel, extract it
-        # and use it, otherwise use scalar keyword parameter
-        alpha = srcarr[0:src_ht, 0:src_wd, sa_idx] / float(src_max_val)
-        alpha = np.dstack((alpha, alpha, alpha))
+        src_alpha = srcarr[0:src_ht, 0:src_wd, sa_idx]
 
     # reorder srcarr if necessary to match dstarr for alpha merge
     get_order = dst_order
@@ -696,22 +942,82 @@ def overlay_image_2d(dstarr, pos, srcarr, dst_order='RGBA',
         get_order = dst_order.replace('A', '')
     if get_order != src_order:
         srcarr = reorder_image(get_order, srcarr, src_order)
+    src_slc = slc if ('A' in get_order) else slice(0, 3)
+
+    dst = dstarr[dst_y:dst_y + src_ht, dst_x:dst_x + src_wd, slc]
+    src = srcarr[0:src_ht, 0:src_wd, src_slc]
+
+    if (dst_type == np.uint8) and (src_type == np.uint8):
+        _blend_uint8(dst, src, src_alpha, alpha)
+        return dstarr
+
+    if src_alpha is not None:
+        alpha = src_alpha / float(src_max_val)
+        alpha = np.dstack((alpha, alpha, alpha))
 
     # calculate alpha blending
     #   Co = CaAa + CbAb(1 - Aa)
-    a_arr = (alpha * srcarr[0:src_ht, 0:src_wd, slc]).astype(dst_type, copy=False)
-    b_arr = ((1.0 - alpha) * dstarr[dst_y:dst_y + src_ht,
-                                    dst_x:dst_x + src_wd,
-                                    slc]).astype(dst_type, copy=False)
+    a_arr = (alpha * src).astype(dst_type, copy=False)
+    b_arr = ((1.0 - alpha) * dst).astype(dst_type, copy=False)
 
     # Place our srcarr into this dstarr at dst offsets
-    #dstarr[dst_y:dst_y+src_ht, dst_x:dst_x+src_wd, slc] += addarr[0:src_ht, 0:src_wd, slc]
-    dstarr[dst_y:dst_y + src_ht, dst_x:dst_x + src_wd, slc] = \
-        a_arr[0:src_ht, 0:src_wd, slc] + b_arr[0:src_ht, 0:src_wd, slc]
+    dst[...] = a_arr + b_arr
 
     return dstarr
 
 
+# rows of an overlay checked at a time for fully transparent or opaque
+# areas of its alpha channel, see _blend_uint8()
+blend_block_rows = 64
+
+
+def _blend_uint8(dst, src, src_alpha, alpha):
+    """Alpha blend 8-bit color bands `src` into `dst` in place, using
+    fixed-point integer arithmetic.
+
+    If `src_alpha` is not None it is the 8-bit alpha plane of the source,
+    otherwise the scalar `alpha` (0-1) is used.  Fully transparent areas
+    are skipped and fully opaque ones simply copied.
+    """
+    if src_alpha is None:
+        a = int(round(max(0.0, min(1.0, alpha)) * 255))
+        if a == 255:
+            dst[...] = src
+        elif a > 0:
+            _blend_uint8_block(dst, src, a)
+        return
+
+    ht = dst.shape[0]
+    for y1 in range(0, ht, blend_block_rows):
+        y2 = min(y1 + blend_block_rows, ht)
+        a = src_alpha[y1:y2]
+        a_min, a_max = a.min(), a.max()
+        if a_max == 0:
+            # fully transparent
+            continue
+        if a_min == 255:
+            # fully opaque
+            dst[y1:y2] = src[y1:y2]
+        else:
+            _blend_uint8_block(dst[y1:y2], src[y1:y2], a[..., np.newaxis])
+
+
+def _blend_uint8_block(dst, src, a):
+    #   Co = (Ca * Aa + Cb * (255 - Aa)) / 255, rounded
+    # NOTE: the sum is at most 255 * 255, so everything fits in 16 bits
+    a = np.asarray(a, dtype=np.uint16)
+    res = src.astype(np.uint16)
+    res *= a
+    tmp = dst.astype(np.uint16)
+    tmp *= (255 - a)
+    res += tmp
+    # exact rounded division by 255
+    res += 128
+    res += (res >> 8)
+    res >>= 8
+    dst[...] = res
+
+
 def overlay_image_3d(dstarr, pos, srcarr, dst_order='RGBA', src_order='RGBA',
                      alpha=1.0, copy=False, fill=True, flipy=False):
 
@@ -840,6 +1146,170 @@ def reorder_image(dst_order, src_arr, src_order):
                            for idx in indexes], axis=-1)
 
 
+def get_work_dtype(dtype):
+    """Return the floating point type for calculations on data of type
+    `dtype`: float32 for float32 and narrower types, which it represents
+    exactly, else float64.
+    """
+    return np.result_type(dtype, np.float32)
+
+
+def get_index_dtype(maxval):
+    """Return the smallest unsigned integer type, of at least 16 bits,
+    that holds index values up to `maxval`.
+    """
+    if maxval < 2 ** 16:
+        return np.dtype(np.uint16)
+    if maxval < 2 ** 32:
+        return np.dtype(np.uint32)
+    return np.dtype(np.uint64)
+
+
+# number of bytes of data that statistics are calculated on at a time
+stats_chunk_bytes = 16 * 1024 ** 2
+
+
+def calc_minmax(data, chunk_bytes=None):
+    """Calculate the minimum and maximum of `data` in a single pass over
+    blocks of about `chunk_bytes` (default `stats_chunk_bytes`) of its
+    rows, so that memory mapped data is read only once and only a block
+    at a time is copied.
+
+    Returns a dict of the minimum and maximum ignoring NaNs (`minval`,
+    `maxval`), the same also ignoring infinities (`minval_noinf`,
+    `maxval_noinf`) and the number of NaNs (`num_nan`).  Values that
+    cannot be determined (e.g. because all values are NaN) are 0.
+    """
+    if chunk_bytes is None:
+        chunk_bytes = stats_chunk_bytes
+    data = np.asanyarray(data)
+    if data.ndim == 0:
+        data = data.reshape((1,))
+    is_float = np.issubdtype(data.dtype, np.floating)
+
+    num_rows = 1
+    if data.size > 0:
+        num_rows = max(1, int(chunk_bytes // data[0:1].nbytes))
+
+    lo, hi, lo_fin, hi_fin = [], [], [], []
+    num_nan = 0
+    for i in range(0, data.shape[0], num_rows):
+        chunk = data[i:i + num_rows]
+        if chunk.size == 0:
+            continue
+        if not is_float:
+            lo.append(chunk.min())
+            hi.append(chunk.max())
+            continue
+
+        # fmin/fmax ignore NaNs without making a copy
+        mn = np.fmin.reduce(chunk, axis=None)
+        mx = np.fmax.reduce(chunk, axis=None)
+        if np.isnan(mn):
+            # all NaN
+            num_nan += chunk.size
+            continue
+        num_nan += int(np.count_nonzero(np.isnan(chunk)))
+        lo.append(mn)
+        hi.append(mx)
+
+        if not (np.isfinite(mn) and np.isfinite(mx)):
+            chunk = chunk[np.isfinite(chunk)]
+            if chunk.size == 0:
+                continue
+            mn, mx = chunk.min(), chunk.max()
+        lo_fin.append(mn)
+        hi_fin.append(mx)
+
+    if not is_float:
+        lo_fin, hi_fin = lo, hi
+
+    def _reduce(func, vals):
+        if len(vals) == 0:
+            return 0
+        return func(vals)
+
+    return dict(minval=_reduce(min, lo), maxval=_reduce(max, hi),
+                minval_noinf=_reduce(min, lo_fin),
+                maxval_noinf=_reduce(max, hi_fin),
+                num_nan=num_nan)
+
+
+# strategies for sampling data (see get_sample)
+sample_methods = ['random', 'stride', 'tile']
+
+
+def get_sample(data, num_samples, method='stride', tile_size=32, seed=0):
+    """Return a sample of about `num_samples` pixels of `data`, or `data`
+    itself if it is no larger than that.
+
+    `method` is one of:
+
+    - 'stride': a view of the pixels at a regular stride in the first two
+      dimensions;
+    - 'random': pixels chosen at random (with `seed`), as a single row;
+    - 'tile': square tiles of `tile_size` pixels spread evenly over the
+      data, side by side.
+
+    Only the 'stride' method is used for data of fewer than two
+    dimensions.
+    """
+    data = np.asanyarray(data)
+    if data.ndim == 0:
+        return data
+    num = data.size
+    if data.ndim > 2:
+        num = int(np.prod(data.shape[:2]))
+    if num <= num_samples:
+        return data
+    num_samples = max(1, int(num_samples))
+
+    if data.ndim == 1 or method == 'stride':
+        step = int(math.ceil(math.sqrt(num / float(num_samples))))
+        if data.ndim == 1:
+            return data[::step ** 2]
+        return data[::step, ::step]
+
+    ht, wd = data.shape[:2]
+    if method == 'random':
+        rnd = np.random.RandomState(seed)
+        # sorted, for locality of access to memory mapped data
+        idx = np.unique(rnd.randint(0, num, size=num_samples))
+        ys, xs = np.divmod(idx, wd)
+        sample = data[ys, xs]
+        return sample.reshape((1,) + sample.shape)
+
+    if method == 'tile':
+        tile_ht, tile_wd = min(tile_size, ht), min(tile_size, wd)
+        num_tiles = int(math.ceil(num_samples / float(tile_ht * tile_wd)))
+        n = int(math.ceil(math.sqrt(num_tiles)))
+        ys = np.unique(np.linspace(0, ht - tile_ht, n).astype(int))
+        xs = np.unique(np.linspace(0, wd - tile_wd, n).astype(int))
+        return np.concatenate([data[y:y + tile_ht, x:x + tile_wd]
+                               for y in ys for x in xs], axis=1)
+
+    raise ValueError("Unknown sampling method '%s'" % (method))
+
+
+def get_sample_error(num_samples, num_total, confidence=0.95):
+    """Estimate a bound on the error of statistics calculated from a
+    sample of `num_samples` of `num_total` values.
+
+    The bound is the fraction of all the values by which the rank of a
+    quantile (e.g. a cut level, or the minimum or maximum) estimated
+    from the sample may be off, with the given `confidence`.  It comes
+    from the Dvoretzky-Kiefer-Wolfowitz inequality for random samples,
+    with a finite population correction, and is 0 if all values are in
+    the sample.
+    """
+    if num_samples >= num_total:
+        return 0.0
+    num_samples = max(1, num_samples)
+    eps = math.sqrt(math.log(2.0 / (1.0 - confidence)) / (2.0 * num_samples))
+    fpc = math.sqrt(float(num_total - num_samples) / max(1, num_total - 1))
+    return min(1.0, eps * fpc)
+
+
 def strip_z(pts):
     """Strips a Z component from `pts` if it is present."""
     pts = np.asarray(pts)
@@ -0,0 +1,461 @@
+#
+# bench.py -- headless benchmarks of ginga rendering
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Benchmarks of rendering, run in a viewer without a window.
+
+A viewer is driven through a number of typical workloads (loading,
+zooming, panning, changing cut levels and color maps, rotating and
+drawing over images with many canvas objects), for images of a range of
+sizes and data types.  For each combination the frame rate, the peak of
+memory allocated during the workload and the time spent in each stage
+of rendering are reported as JSON, so that results can be compared
+between releases.
+
+There is also a micro-benchmark of the data source (image cache) of the
+channels of the reference viewer, which pushes, uses and removes a large
+number of entries.
+
+Usage::
+
+    $ python -m ginga.util.bench --sizes=1024,4096 --dtypes=uint8,float32 \\
+          -o results.json
+    $ python -m ginga.util.bench --datasrc=100000
+
+"""
+from __future__ import absolute_import, print_function
+
+import sys
+import ast
+import json
+import time
+import platform
+from collections import OrderedDict
+
+import numpy as np
+
+from ginga import AstroImage, RGBImage, cmap
+from ginga.misc import log, Datasrc
+
+try:
+    from ginga.version import version
+except ImportError:
+    version = 'unknown'
+
+try:
+    import tracemalloc
+    have_tracemalloc = True
+except ImportError:
+    have_tracemalloc = False
+
+try:
+    import resource
+    have_resource = True
+except ImportError:
+    have_resource = False
+
+default_sizes = [1024, 2048, 4096, 8192, 16384]
+default_dtypes = ['uint8', 'int16', 'float32', 'float64']
+# fraction of pixels set to NaN in float data with NaNs
+nan_fraction = 0.01
+
+
+def make_data(size, dtype, nans=False, seed=0):
+    """Make a reproducible `size` x `size` test image of type `dtype`,
+    consisting of smooth sources on a noisy background.  Optionally, some
+    pixels of floating point data are set to NaN.
+    """
+    rs = np.random.RandomState(seed)
+    dtype = np.dtype(dtype)
+    # generate the noise in blocks of rows, to keep the temporary
+    # double precision arrays small for large sizes
+    data = np.empty((size, size), dtype=np.float32)
+    for y in range(0, size, 1024):
+        data[y:y + 1024] = rs.normal(100.0, 10.0,
+                                     size=data[y:y + 1024].shape)
+
+    # add some gaussian sources
+    yi, xi = np.ogrid[:size, :size]
+    for i in range(20):
+        x, y = rs.uniform(0, size, size=2)
+        sigma = rs.uniform(0.005, 0.05) * size
+        amp = rs.uniform(50.0, 1000.0)
+        # only compute over the area where the source is significant
+        x1, x2 = int(max(0, x - 4 * sigma)), int(min(size, x + 4 * sigma))
+        y1, y2 = int(max(0, y - 4 * sigma)), int(min(size, y + 4 * sigma))
+        data[y1:y2, x1:x2] += amp * np.exp(
+            -((xi[:, x1:x2] - x) ** 2 + (yi[y1:y2] - y) ** 2) /
+            (2.0 * sigma ** 2))
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        lo, hi = np.min(data), np.max(data)
+        data = (data - lo) * ((min(info.max, 32767) - max(info.min, 0)) /
+                              (hi - lo)) + max(info.min, 0)
+    data = data.astype(dtype)
+
+    if nans and np.issubdtype(dtype, np.floating):
+        idx = rs.randint(0, size * size, size=int(size * size * nan_fraction))
+        data.flat[idx] = np.nan
+    return data
+
+
+def get_viewer(backend, logger, wd, ht):
+    """Make a viewer of size `wd` x `ht` for backend 'mock', 'pil' or
+    'agg' that renders synchronously.
+    """
+    if backend == 'mock':
+        from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas as klass
+    elif backend == 'pil':
+        from ginga.pilw.ImageViewPil import CanvasView as klass
+    elif backend == 'agg':
+        from ginga.aggw.ImageViewAgg import CanvasView as klass
+    else:
+        raise ValueError("Unknown backend '%s'" % (backend))
+
+    viewer = klass(logger=logger)
+    viewer.defer_redraw = False
+    viewer.configure_window(wd, ht)
+    return viewer
+
+
+def _pan_path(image, num, margin=0.1):
+    # a sweep of pan positions across the image
+    wd, ht = image.get_size()
+    xs = np.linspace(wd * margin, wd * (1.0 - margin), num)
+    ys = np.linspace(ht * margin, ht * (1.0 - margin), num)
+    return zip(xs, ys)
+
+
+def wl_load(viewer, data, num):
+    """Load the data into a new image object and display it."""
+    for i in range(num):
+        image = AstroImage.AstroImage(data_np=data, logger=viewer.logger)
+        viewer.set_image(image)
+
+
+def wl_zoom_fit(viewer, data, num):
+    """Alternate between zooming to 1:1 and fitting the window."""
+    for i in range(num):
+        viewer.zoom_to(1)
+        viewer.zoom_fit()
+
+
+def wl_pan(viewer, data, num):
+    """Sweep the pan position across the image at 1:1."""
+    viewer.zoom_to(1)
+    for pan_x, pan_y in _pan_path(viewer.get_image(), num):
+        viewer.set_pan(pan_x, pan_y)
+
+
+def wl_zoom(viewer, data, num):
+    """Zoom in and out over a range of zoom levels."""
+    levels = [-8, -4, -2, 1, 2, 4, 8, 4, 2, 1, -2, -4]
+    for i in range(num):
+        viewer.zoom_to(levels[i % len(levels)])
+
+
+def wl_cuts(viewer, data, num):
+    """Change the cut levels, as when dragging them."""
+    viewer.enable_autocuts('off')
+    lo, hi = viewer.get_cut_levels()
+    for i in range(num):
+        frac = (i + 1.0) / num
+        viewer.cut_levels(lo + (hi - lo) * 0.2 * frac,
+                          hi - (hi - lo) * 0.4 * frac)
+
+
+def wl_cmap(viewer, data, num):
+    """Cycle through color maps."""
+    names = cmap.get_names()
+    for i in range(num):
+        viewer.set_color_map(names[i % len(names)])
+
+
+def wl_rotate(viewer, data, num):
+    """Rotate the image in steps."""
+    for i in range(num):
+        viewer.rotate((i + 1) * 360.0 / num)
+
+
+def wl_overlays(viewer, data, num, num_objects=200):
+    """Sweep the pan position over an image with many canvas objects,
+    some of which are overlaid images.
+    """
+    viewer.zoom_to(1)
+    image = viewer.get_image()
+    wd, ht = image.get_size()
+    canvas = viewer.get_canvas()
+    rs = np.random.RandomState(1)
+    Circle = canvas.get_draw_class('circle')
+    Box = canvas.get_draw_class('box')
+    Text = canvas.get_draw_class('text')
+    Image = canvas.get_draw_class('image')
+    arr = np.zeros((64, 64, 4), dtype=np.uint8)
+    arr[..., 0] = 255
+    arr[..., 3] = rs.randint(0, 256, size=(64, 64))
+    overlay = RGBImage.RGBImage(data_np=arr, logger=viewer.logger)
+    with viewer.suppress_redraw:
+        for i in range(num_objects):
+            x, y = rs.uniform(0, wd), rs.uniform(0, ht)
+            r1, r2 = rs.uniform(5, 50, size=2)
+            if i % 10 == 9:
+                obj = Image(x, y, overlay, alpha=0.5)
+            elif i % 3 == 0:
+                obj = Circle(x, y, r1, color='cyan')
+            elif i % 3 == 1:
+                obj = Box(x, y, r1, r2, color='green')
+            else:
+                obj = Text(x, y, text="obj%d" % (i), color='yellow')
+            canvas.add(obj, tag='_bench%d' % (i), redraw=False)
+    try:
+        for pan_x, pan_y in _pan_path(image, num):
+            viewer.set_pan(pan_x, pan_y)
+    finally:
+        canvas.delete_objects_by_tag(['_bench%d' % (i)
+                                      for i in range(num_objects)],
+                                     redraw=False)
+
+
+workloads = OrderedDict([('load', wl_load), ('zoom_fit', wl_zoom_fit),
+                         ('pan', wl_pan), ('zoom', wl_zoom),
+                         ('cuts', wl_cuts), ('cmap', wl_cmap),
+                         ('rotate', wl_rotate), ('overlays', wl_overlays)])
+
+
+def get_rss_max():
+    """Get the high-water mark of the resident memory of the process,
+    in bytes, or None if it is not available.
+    """
+    if not have_resource:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on Mac OS X, kilobytes elsewhere
+    if sys.platform != 'darwin':
+        rss *= 1024
+    return rss
+
+
+def run_workload(viewer, name, data, num_frames):
+    """Run the workload `name` on `data`, which should already be loaded
+    into `viewer`, and return a dict of the results.
+    """
+    func = workloads[name]
+    viewer.get_settings().set(render_stats_frames=max(1000, num_frames * 4))
+    viewer.clear_render_stats()
+    if have_tracemalloc:
+        tracemalloc.start()
+
+    time_start = time.time()
+    try:
+        func(viewer, data, num_frames)
+        elapsed = time.time() - time_start
+
+        mem_peak = None
+        if have_tracemalloc:
+            mem_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if have_tracemalloc:
+            tracemalloc.stop()
+
+    stats = viewer.get_render_stats()
+    frames = stats['num_frames']
+    stages = dict([(stage, d['mean'])
+                   for stage, d in stats['stages'].items()])
+    return OrderedDict([('workload', name), ('frames', frames),
+                        ('seconds', elapsed),
+                        ('fps', frames / elapsed if elapsed > 0 else None),
+                        ('mem_peak', mem_peak),
+                        ('rss_max', get_rss_max()),
+                        ('stage_means', stages)])
+
+
+def run(sizes=None, dtypes=None, nans=(False, True), names=None,
+        num_frames=20, backend='mock', window=(1024, 768), settings=None,
+        logger=None):
+    """Run the benchmarks and return a dict of the results.
+
+    Every combination of image size (in `sizes`), data type (in `dtypes`)
+    and with and without NaNs (in `nans`) is run through each workload in
+    `names` (all of them, by default), with about `num_frames` redraws
+    each.  `settings` is an optional dict of viewer settings to use.
+    """
+    if logger is None:
+        logger = log.get_logger('bench', null=True)
+    if sizes is None:
+        sizes = default_sizes
+    if dtypes is None:
+        dtypes = default_dtypes
+    if names is None:
+        names = list(workloads.keys())
+
+    results = []
+    for size in sizes:
+        for dtype in dtypes:
+            for has_nans in nans:
+                if has_nans and not np.issubdtype(np.dtype(dtype),
+                                                  np.floating):
+                    continue
+                data = make_data(size, dtype, nans=has_nans)
+
+                viewer = get_viewer(backend, logger, *window)
+                if settings is not None:
+                    viewer.get_settings().set(**settings)
+                viewer.set_image(AstroImage.AstroImage(data_np=data,
+                                                       logger=logger))
+
+                for name in names:
+                    res = run_workload(viewer, name, data, num_frames)
+                    res.update(dict(size=size, dtype=str(dtype),
+                                    nans=has_nans))
+                    results.append(res)
+                    logger.info("%(workload)s %(size)d %(dtype)s "
+                                "nans=%(nans)s: %(fps).1f fps" % res)
+
+    info = OrderedDict([('ginga', version),
+                        ('numpy', np.__version__),
+                        ('python', platform.python_version()),
+                        ('platform', platform.platform()),
+                        ('backend', backend), ('window', list(window)),
+                        ('num_frames', num_frames),
+                        ('settings', settings or {}),
+                        ('time', time.strftime('%Y-%m-%dT%H:%M:%S'))])
+    return OrderedDict([('info', info), ('results', results)])
+
+
+def run_datasrc(num_items=100000, length=0):
+    """Time the operations of a `~ginga.misc.Datasrc.Datasrc` limited to
+    `length` entries (0 = unlimited), with `num_items` keys pushed in
+    random order, and return a dict of the seconds spent in each of them.
+    """
+    rnd = np.random.RandomState(0)
+    keys = ['image%07d' % (i) for i in rnd.permutation(num_items)]
+    datasrc = Datasrc.Datasrc(length)
+
+    def _time(func, keys):
+        time_start = time.time()
+        for key in keys:
+            func(key)
+        return time.time() - time_start
+
+    res = OrderedDict([('num_items', num_items), ('length', length)])
+    res['push'] = _time(lambda key: datasrc.push(key, key), keys)
+    res['touch'] = _time(datasrc.touch, keys)
+    res['keys'] = _time(lambda key: datasrc.keys(), keys[:100])
+    res['repush'] = _time(lambda key: datasrc.push(key, key), keys)
+    res['remove'] = _time(lambda key: (key in datasrc) and
+                          datasrc.remove(key), keys)
+    return res
+
+
+def main(options, args):
+
+    logger = log.get_logger(name="bench", options=options)
+
+    def _list(s, conv):
+        return [conv(x) for x in s.split(',') if len(x) > 0]
+
+    settings = {}
+    for arg in options.settings:
+        key, val = arg.split('=', 1)
+        settings[key] = ast.literal_eval(val)
+
+    if options.datasrc > 0:
+        # unlimited, and limited so that entries are evicted
+        num = options.datasrc
+        results = [run_datasrc(num), run_datasrc(num, num // 10)]
+        res = OrderedDict([('ginga', version),
+                           ('python', platform.python_version()),
+                           ('results', results)])
+
+    else:
+        nans = {'yes': (True,), 'no': (False,), 'both': (False, True)}
+        wd, ht = _list(options.window, int)
+        res = run(sizes=_list(options.sizes, int),
+                  dtypes=_list(options.dtypes, str),
+                  nans=nans[options.nans],
+                  names=_list(options.workloads, str),
+                  num_frames=options.frames, backend=options.backend,
+                  window=(wd, ht), settings=settings, logger=logger)
+
+    buf = json.dumps(res, indent=2)
+    if options.outfile:
+        with open(options.outfile, 'w') as out_f:
+            out_f.write(buf)
+    else:
+        print(buf)
+
+
+if __name__ == "__main__":
+
+    # Parse command line options with nifty optparse module
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options]"
+    optprs = OptionParser(usage=usage, version=('%%prog'))
+
+    optprs.add_option("--backend", dest="backend", metavar="NAME",
+                      default='mock',
+                      help="Render with backend NAME (mock|pil|agg)")
+    optprs.add_option("--datasrc", dest="datasrc", metavar="NUM",
+                      type='int', default=0,
+                      help="Run the data source benchmark with NUM items")
+    optprs.add_option("--debug", dest="debug", default=False, action="store_true",
+                      help="Enter the pdb debugger on main()")
+    optprs.add_option("--dtypes", dest="dtypes", metavar="LIST",
+                      default=','.join(default_dtypes),
+                      help="Comma separated list of data types")
+    optprs.add_option("--frames", dest="frames", metavar="NUM",
+                      type='int', default=20,
+                      help="Redraw about NUM frames per workload")
+    optprs.add_option("--log", dest="logfile", metavar="FILE",
+                      help="Write logging output to FILE")
+    optprs.add_option("--loglevel", dest="loglevel", metavar="LEVEL",
+                      type='int',
+                      help="Set logging level to LEVEL")
+    optprs.add_option("--nans", dest="nans", metavar="yes|no|both",
+                      default='both',
+                      help="Run float data with NaNs, without or both")
+    optprs.add_option("-o", "--outfile", dest="outfile", metavar="FILE",
+                      help="Write JSON results to FILE")
+    optprs.add_option("--profile", dest="profile", action="store_true",
+                      default=False,
+                      help="Run the profiler on main()")
+    optprs.add_option("--set", dest="settings", metavar="KEY=VALUE",
+                      action="append", default=[],
+                      help="Set viewer setting KEY to python VALUE")
+    optprs.add_option("--sizes", dest="sizes", metavar="LIST",
+                      default=','.join(map(str, default_sizes)),
+                      help="Comma separated list of image sizes")
+    optprs.add_option("--stderr", dest="logstderr", default=False,
+                      action="store_true",
+                      help="Copy logging also to stderr")
+    optprs.add_option("--window", dest="window", metavar="WD,HT",
+                      default='1024,768',
+                      help="Set viewer window size")
+    optprs.add_option("--workloads", dest="workloads", metavar="LIST",
+                      default=','.join(workloads.keys()),
+                      help="Comma separated list of workloads")
+
+    (options, args) = optprs.parse_args(sys.argv[1:])
+
+    # Are we debugging this?
+    if options.debug:
+        import pdb
+
+        pdb.run('main(options, args)')
+
+    # Are we profiling this?
+    elif options.profile:
+        import profile
+
+        print("%s profile:" % sys.argv[0])
+        profile.run('main(options, args)')
+
+    else:
+        main(options, args)
+
+# END
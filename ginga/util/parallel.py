@@ -0,0 +1,123 @@
+#
+# parallel.py -- rendering arrays in horizontal bands on a thread pool
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Most of the numpy operations in the rendering chain release the GIL,
+so large arrays can be processed faster by splitting them into bands of
+rows and working on the bands in parallel threads.
+"""
+import threading
+
+from ginga.misc import Task, log
+
+# don't split arrays into bands smaller than this many rows
+min_band_rows = 64
+
+_lock = threading.RLock()
+_pool = None
+_local = threading.local()
+
+
+class BandWorker(Task.WorkerThread):
+    """Worker thread for rendering bands.
+
+    The thread does not keep the interpreter from exiting, and records
+    that it is running a band so that work is never farmed out again
+    from within a band (which could deadlock the pool).
+    """
+
+    def start(self):
+        self.thread = threading.Thread(target=self.taskloop, args=[])
+        self.thread.daemon = True
+        self.thread.start()
+
+    def execute(self, task):
+        _local.in_band = True
+        try:
+            super(BandWorker, self).execute(task)
+        finally:
+            _local.in_band = False
+
+
+def get_band_pool(num_threads, logger=None):
+    """Get the thread pool shared by all viewers for rendering bands,
+    starting it, or adding threads to it if it does not have at least
+    `num_threads` threads.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            if logger is None:
+                logger = log.NullLogger()
+            _pool = Task.ThreadPool(numthreads=num_threads, logger=logger,
+                                    workerClass=BandWorker)
+            _pool.startall(wait=True)
+
+        elif _pool.numthreads < num_threads:
+            # grow the pool in place: another viewer may be waiting on
+            # bands queued to it, so it cannot be replaced
+            _pool.addThreads(num_threads - _pool.numthreads)
+
+        return _pool
+
+
+def split_bands(ht, num_bands, min_rows=None):
+    """Split `ht` rows into at most `num_bands` bands of roughly equal
+    size, none of which (except possibly a single one) is smaller than
+    `min_rows`.  Returns a list of (y1, y2) row ranges.
+    """
+    if min_rows is None:
+        min_rows = min_band_rows
+    num_bands = max(1, min(num_bands, ht // max(1, min_rows)))
+    edges = [(ht * i) // num_bands for i in range(num_bands + 1)]
+    return [(edges[i], edges[i + 1]) for i in range(num_bands)]
+
+
+def run_in_bands(func, ht, num_threads, logger=None):
+    """Call `func(y1, y2)` for bands of rows covering the range 0 to
+    `ht`, in parallel on `num_threads` threads.
+
+    The bands are processed serially if `num_threads` is less than 2,
+    the rows do not make more than one band, or we are already running
+    in a band.  Any exception raised by `func` is raised here, after all
+    of the bands have finished.
+    """
+    bands = split_bands(ht, num_threads)
+    if (num_threads < 2) or (len(bands) < 2) or \
+       getattr(_local, 'in_band', False):
+        for y1, y2 in bands:
+            func(y1, y2)
+        return
+
+    pool = get_band_pool(num_threads, logger=logger)
+    tasks = []
+    for y1, y2 in bands[1:]:
+        task = Task.FuncTask2(func, y1, y2)
+        task.initialize(None)
+        pool.addTask(task)
+        tasks.append(task)
+
+    # do one band ourselves while the others run
+    res = None
+    _local.in_band = True
+    try:
+        func(*bands[0])
+
+    except Exception as e:
+        res = e
+
+    finally:
+        _local.in_band = False
+
+    for task in tasks:
+        try:
+            task.wait()
+
+        except Exception as e:
+            res = e
+
+    if res is not None:
+        raise res
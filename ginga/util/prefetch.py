@@ -0,0 +1,345 @@
+#
+# prefetch.py -- prefetching the slices of a data cube for playback
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Reads and prepares the slices of a data cube that are about to be shown
+during playback on worker threads, so that showing a slice does not have
+to wait for its data to be read (e.g. from a memory mapped or compressed
+file) or analyzed.
+"""
+import time
+import threading
+from collections import OrderedDict, deque
+
+from ginga.misc import Bunch
+from ginga import RGBMap
+
+# settings of a viewer that a rendering of an image depends on, besides
+# its window size, scale, pan position, background and color mapping
+view_settings = ('cuts', 'flip_x', 'flip_y', 'swap_xy', 'rot_deg',
+                 'interpolation', 'icc_output_profile', 'icc_output_intent',
+                 'icc_proof_profile', 'icc_proof_intent',
+                 'icc_black_point_compensation', 'icc_lut_size')
+
+
+def get_view_signature(viewer):
+    """Get a key that changes whenever the rendering of the same data by
+    `viewer` would.
+    """
+    t_ = viewer.get_settings()
+    return (tuple(viewer.get_window_size()), tuple(viewer.get_scale_xy()),
+            tuple(viewer.get_pan(coord='data')[:2]), tuple(viewer.get_bg()),
+            tuple([t_.get(name, None) for name in view_settings]),
+            viewer.get_rgbmap().get_signature())
+
+
+def shows_only_image(viewer):
+    """Whether nothing but the image of `viewer` is on its canvas, so that
+    a rendering of the image alone (see `SliceRenderer`) can be shown in
+    place of a redraw without hiding anything.
+    """
+    canvas_img = viewer.get_canvas_image()
+
+    def _only_image(canvas):
+        for obj in canvas.get_objects():
+            if obj is canvas_img:
+                continue
+            if not (obj.is_compound() and _only_image(obj)):
+                return False
+        return True
+
+    return _only_image(viewer.private_canvas)
+
+
+def copy_rgbmap(src_rgbmap, dst_rgbmap):
+    dst_rgbmap.set_hash_size(src_rgbmap.get_hash_size(), callback=False)
+    src_rgbmap.copy_attributes(dst_rgbmap)
+
+
+class SlicePrefetcher(object):
+    """Prefetches the slices of a data cube along one axis into a bounded
+    ring buffer, ahead of the slice being shown.
+
+    Preparing a slice calculates its statistics (see
+    `~ginga.AstroImage.AstroImage.calc_slice_stats`), which reads all of
+    its data, and optionally renders it with `render_func`.
+
+    Parameters
+    ----------
+    image : `~ginga.AstroImage.AstroImage`
+        Image with multidimensional data.
+
+    axis : int
+        Index in the naxispath of the image of the axis that is played.
+
+    logger : logger
+        Logger for errors.
+
+    num_ahead : int
+        Number of slices to prepare ahead of the current one.
+
+    num_threads : int
+        Number of worker threads.
+
+    autocuts : `~ginga.AutoCuts.AutoCutsBase` or `None`
+        If given, the auto cut levels of the slices are calculated too.
+
+    render_func : callable or `None`
+        If given, it is called as ``render_func(naxispath)`` in a worker
+        thread, and its result is kept with the slice as `rgbobj`.
+
+    """
+
+    def __init__(self, image, axis, logger, num_ahead=4, num_threads=2,
+                 autocuts=None, render_func=None):
+        self.image = image
+        self.axis = axis
+        self.logger = logger
+        self.num_ahead = max(1, num_ahead)
+        self.num_threads = max(1, num_threads)
+        self.autocuts = autocuts
+        self.render_func = render_func
+
+        self.naxispath = list(image.naxispath)
+        # naxispath is in FITS order, the reverse of the numpy axes
+        self.num_slices = image.get_mddata().shape[-(axis + 3)]
+
+        self.cond = threading.Condition()
+        # prepared slices, in the order they will be shown
+        self.buffer = OrderedDict()
+        self.queue = deque()
+        self.pending = set()
+        self.cur_idx = self.naxispath[axis]
+        self.direction = 1
+        self.ev_quit = threading.Event()
+        self.threads = []
+
+        self.clear_stats()
+
+    def get_naxispath(self, idx):
+        naxispath = list(self.naxispath)
+        naxispath[self.axis] = idx
+        return naxispath
+
+    def start(self, direction=1):
+        """Start preparing the slices after the current one, going in
+        `direction` (1 or -1).
+        """
+        with self.cond:
+            self.direction = direction
+            self._schedule()
+
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._prefetch_loop,
+                                      name='prefetch-%d' % (i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Stop the worker threads and drop the prepared slices."""
+        self.ev_quit.set()
+        with self.cond:
+            self.queue.clear()
+            self.buffer.clear()
+            self.cond.notify_all()
+
+    def _get_wanted(self):
+        return [(self.cur_idx + self.direction * i) % self.num_slices
+                for i in range(1, self.num_ahead + 1)]
+
+    def _schedule(self):
+        # drop the slices that are no longer ahead and queue the missing
+        # ones, nearest first
+        wanted = self._get_wanted()
+        for idx in list(self.buffer.keys()):
+            if idx not in wanted:
+                del self.buffer[idx]
+        self.queue = deque([idx for idx in wanted
+                            if idx not in self.buffer and
+                            idx not in self.pending])
+        self.cond.notify_all()
+
+    def _prefetch_loop(self):
+        # body of the worker threads
+        while not self.ev_quit.is_set():
+            with self.cond:
+                while len(self.queue) == 0 and not self.ev_quit.is_set():
+                    self.cond.wait()
+                if self.ev_quit.is_set():
+                    return
+                idx = self.queue.popleft()
+                self.pending.add(idx)
+
+            bnch = None
+            try:
+                bnch = self._prepare(idx)
+
+            except Exception as e:
+                self.logger.error("Error preparing slice %d: %s" % (
+                    idx, str(e)))
+
+            with self.cond:
+                self.pending.discard(idx)
+                if bnch is not None and idx in self._get_wanted():
+                    self.buffer[idx] = bnch
+                    self.cond.notify_all()
+
+    def _prepare(self, idx):
+        naxispath = self.get_naxispath(idx)
+        self.image.calc_slice_stats(naxispath, autocuts=self.autocuts)
+
+        rgbobj = None
+        if self.render_func is not None:
+            rgbobj = self.render_func(naxispath)
+        return Bunch.Bunch(idx=idx, naxispath=naxispath, rgbobj=rgbobj)
+
+    def get(self, idx, timeout=0.0):
+        """Get the prepared slice `idx`, waiting up to `timeout` seconds
+        for it, and make it the current one.
+
+        Returns a bunch with the index (`idx`), the naxispath
+        (`naxispath`) and the rendered frame, if any (`rgbobj`) of the
+        slice, or `None` if it was not ready.
+        """
+        deadline = time.time() + timeout
+        with self.cond:
+            while idx not in self.buffer:
+                delta = deadline - time.time()
+                if (delta <= 0 or self.ev_quit.is_set() or
+                        (idx not in self.pending and idx not in self.queue)):
+                    break
+                self.cond.wait(delta)
+
+            bnch = self.buffer.pop(idx, None)
+            if bnch is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            self.cur_idx = idx
+            self._schedule()
+            return bnch
+
+    def clear_stats(self):
+        with self.cond:
+            self.hits = 0
+            self.misses = 0
+            self.num_frames = 0
+            self.dropped = 0
+            self.time_start = None
+            self.time_last = None
+
+    def frame_shown(self, dropped=0):
+        """Count a frame as shown, after `dropped` frames that were
+        skipped to keep up with the requested rate.
+        """
+        with self.cond:
+            self.time_last = time.time()
+            if self.time_start is None:
+                self.time_start = self.time_last
+            else:
+                self.num_frames += 1
+            self.dropped += dropped
+
+    def get_stats(self, interval=None):
+        """Get the statistics of playback.
+
+        Returns a dict with the achieved frame rate (`fps`), the requested
+        one (`requested_fps`, if the requested `interval` between frames
+        is given), the numbers of frames shown (`frames`) and dropped
+        (`dropped`), and the numbers of slices that were (`hits`) and were
+        not (`misses`) prepared when they were needed.
+        """
+        with self.cond:
+            fps = 0.0
+            if self.num_frames > 0 and self.time_last > self.time_start:
+                fps = self.num_frames / (self.time_last - self.time_start)
+            requested_fps = None
+            if interval:
+                requested_fps = 1.0 / interval
+            return dict(fps=fps, requested_fps=requested_fps,
+                        frames=self.num_frames, dropped=self.dropped,
+                        hits=self.hits, misses=self.misses)
+
+
+class SliceRenderer(object):
+    """Renders the slices of a data cube offscreen, as a viewer shows them
+    at the time this object is created, e.g. as the `render_func` of a
+    `SlicePrefetcher`.
+
+    It is created in the GUI thread, from which it takes a snapshot of the
+    view, and can be called from any number of threads as
+    ``renderer(naxispath)``, which returns the RGB object of the slice.
+    The cut levels are not recalculated for each slice, and only the image
+    itself is rendered, not any other objects on the canvas of the viewer
+    (see `shows_only_image`).
+
+    Parameters
+    ----------
+    viewer : subclass of `~ginga.ImageView.ImageViewBase`
+        Viewer showing a slice of `image`.
+
+    image : `~ginga.AstroImage.AstroImage`
+        Image with multidimensional data.
+
+    """
+
+    def __init__(self, viewer, image):
+        self.image = image
+        self.logger = viewer.logger
+        self.signature = get_view_signature(viewer)
+
+        t_ = viewer.get_settings()
+        self.settings = dict([(name, t_[name]) for name in view_settings
+                              if name in t_])
+        self.window_size = viewer.get_window_size()
+        self.scale = viewer.get_scale_xy()
+        self.pan = viewer.get_pan(coord='data')[:2]
+        self.bg = viewer.get_bg()
+        self.rgbmap = RGBMap.RGBMapper(self.logger)
+        copy_rgbmap(viewer.get_rgbmap(), self.rgbmap)
+
+        # offscreen viewer of each thread
+        self._local = threading.local()
+
+    def _get_viewer(self, data):
+        # imported here, so that loading this module does not load the
+        # viewer classes
+        from ginga.AstroImage import AstroImage
+        from ginga.mockw.ImageViewCanvasMock import ImageViewCanvas
+
+        bnch = getattr(self._local, 'bnch', None)
+        if bnch is None:
+            viewer = ImageViewCanvas(logger=self.logger)
+            viewer.set_redraw_lag(0)
+            viewer.configure(*self.window_size)
+            viewer.t_.set(autozoom='off', autocenter='off', autocuts='off',
+                          **self.settings)
+            viewer.set_bg(*self.bg)
+            copy_rgbmap(self.rgbmap, viewer.get_rgbmap())
+
+            image = AstroImage(data_np=data, logger=self.logger)
+            # the viewer renders when asked, not when the data is set
+            image.block_callback('modified')
+            viewer.set_image(image)
+            viewer.scale_to(*self.scale)
+            viewer.set_pan(*self.pan, coord='data')
+
+            bnch = Bunch.Bunch(viewer=viewer, image=image)
+            self._local.bnch = bnch
+        else:
+            bnch.image.set_data(data)
+        return bnch
+
+    def __call__(self, naxispath):
+        revnaxis = list(naxispath)
+        revnaxis.reverse()
+        data = self.image.get_mddata()[tuple(revnaxis)]
+        bnch = self._get_viewer(data)
+        return bnch.viewer.get_rgb_object(whence=0)
+
+# END
@@ -9,6 +9,10 @@ from __future__ import absolute_import, print_function
 import os
 import glob
 import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
 
 from ginga.misc import Bunch
 
@@ -16,6 +20,7 @@ from . import paths
 
 # How about color management (ICC profile) support?
 try:
+    import PIL.Image as PILimage
     import PIL.ImageCms as ImageCms
     have_cms = True
 except ImportError:
@@ -41,6 +46,16 @@ working_profile = None
 # Holds transforms
 icc_transform = {}
 
+# Holds 3D color lookup tables made from transforms, least recently used
+# first.  Each one comes with a table of remembered colors that can grow
+# to 64 MB, so only the most recently used ones are kept.
+icc_lut = OrderedDict()
+icc_lut_max_entries = 4
+_icc_lut_lock = threading.RLock()
+
+# Holds the interpolation tables of 3D color lookup tables, by size
+_lut_tables = {}
+
 
 class ColorManager(object):
 
@@ -190,11 +205,7 @@ def get_transform_key(from_name, to_name, to_intent, proof_name,
     return (from_name, to_name, to_intent, proof_name, proof_intent, flags)
 
 
-def get_transform(from_name, to_name, to_intent='perceptual',
-                  proof_name=None, proof_intent=None,
-                  use_black_pt=False):
-    global icc_transform
-
+def _get_flags(proof_name, use_black_pt):
     flags = 0
     if proof_name is not None:
         if hasattr(ImageCms, 'FLAGS'):
@@ -207,7 +218,15 @@ def get_transform(from_name, to_name, to_intent='perceptual',
             flags |= ImageCms.FLAGS['BLACKPOINTCOMPENSATION']
         else:
             flags |= ImageCms.BLACKPOINTCOMPENSATION
+    return flags
+
+
+def get_transform(from_name, to_name, to_intent='perceptual',
+                  proof_name=None, proof_intent=None,
+                  use_black_pt=False):
+    global icc_transform
 
+    flags = _get_flags(proof_name, use_black_pt)
     key = get_transform_key(from_name, to_name, to_intent, proof_name,
                             proof_intent, flags)
 
@@ -265,6 +284,218 @@ def convert_profile_fromto(image_np, from_name, to_name,
         return image_np
 
 
+def get_lut_grid(size):
+    """
+    Get the colors of the nodes of a 3D color lookup table.
+
+    Parameters
+    ----------
+    size: integer
+      Number of nodes along each of the R, G and B axes
+
+    Returns
+    -------
+    A uint8 array of shape (size, size, size, 3), indexed by the R, G
+    and B node, of the RGB values of the nodes
+    """
+    vals = np.round(np.linspace(0, 255, size)).astype(np.uint8)
+    grid = np.empty((size, size, size, 3), dtype=np.uint8)
+    grid[..., 0] = vals.reshape((-1, 1, 1))
+    grid[..., 1] = vals.reshape((1, -1, 1))
+    grid[..., 2] = vals.reshape((1, 1, -1))
+    return grid
+
+
+def get_transform_lut(from_name, to_name, to_intent='perceptual',
+                      proof_name=None, proof_intent=None,
+                      use_black_pt=False, size=33):
+    """
+    Get a 3D color lookup table of the conversion made by a transform
+    (see get_transform), for use with apply_lut().  The table holds the
+    converted colors of the nodes of get_lut_grid(size), and is cached
+    along with the transform.
+    """
+    return _get_lut_entry(from_name, to_name, to_intent, proof_name,
+                          proof_intent, use_black_pt, size).lut
+
+
+def _get_lut_entry(from_name, to_name, to_intent, proof_name,
+                   proof_intent, use_black_pt, size):
+    flags = _get_flags(proof_name, use_black_pt)
+    key = get_transform_key(from_name, to_name, to_intent, proof_name,
+                            proof_intent, flags) + (size,)
+    with _icc_lut_lock:
+        entry = icc_lut.pop(key, None)
+        if entry is None:
+            transform = get_transform(from_name, to_name,
+                                      to_intent=to_intent,
+                                      proof_name=proof_name,
+                                      proof_intent=proof_intent,
+                                      use_black_pt=use_black_pt)
+
+            # convert all of the nodes as one image
+            grid = get_lut_grid(size)
+            image = PILimage.fromarray(grid.reshape((size * size, size, 3)),
+                                       'RGB')
+            image = convert_profile_pil_transform(image, transform)
+            lut = np.asarray(image, dtype=np.float32).reshape(grid.shape)
+
+            entry = Bunch.Bunch(lut=lut, memo=make_lut_memo())
+
+            # make room for it, dropping the least recently used tables
+            while len(icc_lut) >= max(1, icc_lut_max_entries):
+                icc_lut.popitem(last=False)
+
+        # (re)insert as the most recently used
+        icc_lut[key] = entry
+        return entry
+
+
+def make_lut_memo():
+    """
+    Make a table for remembering the colors converted by apply_lut(),
+    indexed by the 24-bit RGB value.  The memory for the table is only
+    committed as it is filled.
+    """
+    return np.zeros(2 ** 24, dtype=np.uint32)
+
+
+def _get_lut_tables(size):
+    # For each 8-bit value, the offset of the node below it along an axis
+    # of a lookup table (see get_lut_grid) and the fraction of the way to
+    # the next node
+    try:
+        return _lut_tables[size]
+
+    except KeyError:
+        vals = get_lut_grid(size)[:, 0, 0, 0].astype(np.int32)
+        v = np.arange(256)
+        i0 = (np.searchsorted(vals, v, side='right') - 1).clip(0, size - 2)
+        frac = (v - vals[i0]) / (vals[i0 + 1] - vals[i0]).astype(np.float32)
+        tables = (i0.astype(np.int32), frac.astype(np.float32))
+        _lut_tables[size] = tables
+        return tables
+
+
+def _interpolate_lut(lut, r, g, b):
+    # Trilinear interpolation of the colors (r, g, b) in `lut`.
+    # Returns a float array of the converted colors, rounded up by 0.5
+    size = lut.shape[0]
+    i0_tbl, frac_tbl = _get_lut_tables(size)
+    lut = lut.reshape((-1, 3))
+    s1, s2 = size * size, size
+
+    base = i0_tbl.take(r) * s1
+    base += i0_tbl.take(g) * s2
+    base += i0_tbl.take(b)
+    fr = frac_tbl.take(r)[..., np.newaxis]
+    fg = frac_tbl.take(g)[..., np.newaxis]
+    fb = frac_tbl.take(b)[..., np.newaxis]
+
+    def _interp_b(offset):
+        # interpolate between two nodes along the B axis
+        c0 = lut.take(base + offset, axis=0)
+        c1 = lut.take(base + (offset + 1), axis=0)
+        return _interp(c0, c1, fb)
+
+    def _interp(c0, c1, f):
+        c1 -= c0
+        c1 *= f
+        c0 += c1
+        return c0
+
+    # interpolate along B, then G, then R
+    c0 = _interp(_interp_b(0), _interp_b(s2), fg)
+    c1 = _interp(_interp_b(s1), _interp_b(s1 + s2), fg)
+    c = _interp(c0, c1, fr)
+    c += 0.5
+    return c
+
+
+def apply_lut(image_np, lut, indexes=(0, 1, 2), memo=None,
+              num_pixels=65536):
+    """
+    Convert the colors of an 8-bit RGB image in-place, through a 3D color
+    lookup table with trilinear interpolation.
+
+    Parameters
+    ----------
+    image_np: ndarray
+      uint8 image array, with the color planes on the last axis
+
+    lut: ndarray
+      3D color lookup table (see get_transform_lut)
+
+    indexes: tuple of int
+      Indexes of the R, G and B planes in `image_np`
+
+    memo: ndarray or None
+      Table for remembering converted colors (see make_lut_memo), that
+      must only be used with this `lut`.  Each color is then only
+      interpolated once, and later conversions of it cost a single
+      lookup.
+
+    num_pixels: integer
+      Approximate number of pixels to convert at once, which limits
+      the size of the temporary arrays
+    """
+    ri, gi, bi = indexes
+    ht = image_np.shape[0]
+    wd = max(1, int(np.prod(image_np.shape[1:-1])))
+    num_rows = max(1, num_pixels // wd)
+
+    for y1 in range(0, ht, num_rows):
+        band = image_np[y1:y1 + num_rows]
+        r, g, b = band[..., ri], band[..., gi], band[..., bi]
+
+        if memo is None:
+            c = _interpolate_lut(lut, r, g, b)
+            band[..., ri] = c[..., 0]
+            band[..., gi] = c[..., 1]
+            band[..., bi] = c[..., 2]
+            continue
+
+        idx = r.astype(np.uint32)
+        idx <<= 8
+        idx |= g
+        idx <<= 8
+        idx |= b
+        res = memo.take(idx)
+
+        # entries that are filled have bit 24 set
+        missing = (res == 0)
+        if missing.any():
+            new_idx = np.unique(idx[missing])
+            c = _interpolate_lut(lut, (new_idx >> 16).astype(np.uint8),
+                                 ((new_idx >> 8) & 0xff).astype(np.uint8),
+                                 (new_idx & 0xff).astype(np.uint8))
+            c = c.astype(np.uint32)
+            memo[new_idx] = ((1 << 24) | (c[:, 0] << 16) | (c[:, 1] << 8) |
+                             c[:, 2])
+            res = memo.take(idx)
+
+        band[..., bi] = res & 0xff
+        res >>= 8
+        band[..., gi] = res & 0xff
+        res >>= 8
+        band[..., ri] = res & 0xff
+
+
+def convert_profile_lut(image_np, from_name, to_name,
+                        to_intent='perceptual', proof_name=None,
+                        proof_intent=None, use_black_pt=False,
+                        indexes=(0, 1, 2), size=33):
+    """
+    Convert an 8-bit RGB image in-place from one profile to another,
+    through a cached 3D color lookup table of the transform (see
+    get_transform_lut and apply_lut).  `indexes` are the indexes of the
+    R, G and B planes in `image_np`.
+    """
+    entry = _get_lut_entry(from_name, to_name, to_intent, proof_name,
+                           proof_intent, use_black_pt, size)
+    apply_lut(image_np, entry.lut, indexes=indexes, memo=entry.memo)
+
+
 def set_rendering_intent(intent):
     """
     Sets the color management attribute rendering intent.
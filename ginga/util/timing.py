@@ -0,0 +1,144 @@
+#
+# timing.py -- recording the time spent in the stages of rendering
+#
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+"""
+Keeps the times spent in each stage of rendering for a number of recent
+frames, so that the stage responsible for a slow redraw can be found.
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# default percentiles reported for each stage
+default_percentiles = (50, 90, 99)
+
+
+class StageTimes(object):
+    """Ring buffer of the times spent in the stages of recent frames.
+
+    Parameters
+    ----------
+    num_frames : int
+        Number of most recent frames to keep.
+
+    The frame being recorded is kept per thread, so that frames recorded
+    at the same time in different threads do not mix.  A frame that is
+    finished in another thread than it was started in is handed over with
+    :meth:`detach_frame` and :meth:`attach_frame`.
+
+    """
+
+    def __init__(self, num_frames=100):
+        self.lock = threading.RLock()
+        self.frames = deque(maxlen=max(1, int(num_frames)))
+        # counts of events (since the last clear())
+        self.counts = {}
+        # frame being recorded in each thread
+        self._local = threading.local()
+
+    def set_num_frames(self, num_frames):
+        with self.lock:
+            self.frames = deque(self.frames, maxlen=max(1, int(num_frames)))
+
+    def start_frame(self):
+        """Start recording the times of a new frame in this thread."""
+        self._local.frame = ({}, time.time())
+
+    def detach_frame(self):
+        """Stop recording the frame of this thread, without finishing it.
+
+        Returns the frame, to be passed to :meth:`attach_frame`, or `None`
+        if no frame is being recorded.
+        """
+        frame = getattr(self._local, 'frame', None)
+        self._local.frame = None
+        return frame
+
+    def attach_frame(self, frame):
+        """Continue recording `frame`, as returned by :meth:`detach_frame`,
+        in this thread.
+        """
+        self._local.frame = frame
+
+    def end_frame(self):
+        """Finish the frame being recorded in this thread and add it to the
+        buffer, along with the total time since :meth:`start_frame`.
+        """
+        frame = self.detach_frame()
+        if frame is None:
+            return
+        times, time_start = frame
+        times['total'] = time.time() - time_start
+        with self.lock:
+            self.frames.append(times)
+
+    def add(self, stage, secs):
+        """Add `secs` to the time spent in `stage` in the current frame.
+        Does nothing if no frame is being recorded in this thread.
+        """
+        frame = getattr(self._local, 'frame', None)
+        if frame is not None:
+            times = frame[0]
+            times[stage] = times.get(stage, 0.0) + secs
+
+    def count(self, name, n=1):
+        """Add `n` to the count of events `name`."""
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager that adds the time spent in its block to
+        `stage` in the current frame.
+        """
+        time_start = time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.time() - time_start)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.counts = {}
+
+    def get_stats(self, percentiles=None):
+        """Get statistics of the recent frames.
+
+        Returns a dict with the number of frames (`num_frames`), the
+        statistics of each stage (`stages`), keyed by stage name, and the
+        counts of events (`counts`), keyed by event name.  The
+        statistics of a stage are a dict of the number of frames in which
+        it ran (`count`), and the `mean`, `min`, `max` and requested
+        `percentiles` (as e.g. `p90`) of its time per frame, in seconds.
+        """
+        if percentiles is None:
+            percentiles = default_percentiles
+        with self.lock:
+            frames = list(self.frames)
+            counts = dict(self.counts)
+
+        times = {}
+        for frame in frames:
+            for stage, secs in frame.items():
+                times.setdefault(stage, []).append(secs)
+
+        stages = {}
+        for stage, arr in times.items():
+            arr = np.asarray(arr)
+            d = dict(count=len(arr), mean=float(np.mean(arr)),
+                     min=float(np.min(arr)), max=float(np.max(arr)))
+            for pct, val in zip(percentiles,
+                                np.percentile(arr, percentiles)):
+                d['p%g' % pct] = float(val)
+            stages[stage] = d
+
+        return dict(num_frames=len(frames), stages=stages, counts=counts)
+
+# END